@@ -0,0 +1,175 @@
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from typing import Any, Dict, List, Optional
+from embedding_cache import normalize_text
+from config import ANALYSIS_CACHE_ENABLED, ANALYSIS_CACHE_PATH
+
+
+def _restore_entities(entities: Dict[str, Any]) -> Dict[str, Any]:
+    # JSON turns the (text, fips) pairs into lists; the filter builders expect tuples.
+    return {column: [tuple(item) for item in items] if items is not None else None
+            for column, items in entities.items()}
+
+
+class AnalysisCache:
+    """Persistent memo of QueryAnalyzer results keyed by normalized question, analysis kind, model and prompt version."""
+
+    def __init__(self, path: str = ANALYSIS_CACHE_PATH, enabled: bool = ANALYSIS_CACHE_ENABLED):
+        self.path = path
+        self.enabled = enabled
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self.stats: Dict[str, int] = {"hits": 0, "misses": 0, "puts": 0}
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is not None:
+            return self._conn
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS analyses (
+                key TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                question TEXT NOT NULL,
+                model TEXT NOT NULL,
+                prompt_version TEXT NOT NULL,
+                result TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS analyses_question ON analyses(question);
+        """)
+        self._conn = conn
+        return conn
+
+    @staticmethod
+    def key(kind: str, question: str, model: str, prompt_version: str) -> str:
+        return hashlib.sha1(f"{kind}\0{model}\0{prompt_version}\0{normalize_text(question)}".encode("utf-8")).hexdigest()
+
+    def get(self, kind: str, question: str, model: str, prompt_version: str) -> Optional[Dict[str, Any]]:
+        if not self.enabled:
+            return None
+        key = self.key(kind, question, model, prompt_version)
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute("SELECT result FROM analyses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.stats["misses"] += 1
+                return None
+            conn.execute("UPDATE analyses SET hits = hits + 1 WHERE key = ?", (key,))
+            conn.commit()
+            self.stats["hits"] += 1
+
+        result = json.loads(row[0])
+        if "entities" in result:
+            result["entities"] = _restore_entities(result["entities"])
+        return result
+
+    def put(self, kind: str, question: str, model: str, prompt_version: str, result: Dict[str, Any]):
+        if not self.enabled:
+            return
+        key = self.key(kind, question, model, prompt_version)
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO analyses(key, kind, question, model, prompt_version, result, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, kind, normalize_text(question), model, str(prompt_version), json.dumps(result), time.time())
+            )
+            conn.commit()
+            self.stats["puts"] += 1
+
+    def inspect(self, question: Optional[str] = None, limit: int = 20) -> List[Dict[str, Any]]:
+        query = "SELECT kind, question, model, prompt_version, result, created_at, hits FROM analyses"
+        params: tuple = ()
+        if question is not None:
+            query += " WHERE question = ?"
+            params = (normalize_text(question),)
+        query += " ORDER BY created_at DESC LIMIT ?"
+        with self._lock:
+            rows = self._connect().execute(query, params + (limit,)).fetchall()
+        return [{"kind": row[0], "question": row[1], "model": row[2], "prompt_version": row[3],
+                 "result": json.loads(row[4]), "created_at": row[5], "hits": row[6]} for row in rows]
+
+    def invalidate(self, question: Optional[str] = None, model: Optional[str] = None,
+                   prompt_version: Optional[str] = None, kind: Optional[str] = None) -> int:
+        """Delete matching entries; with no arguments every entry is removed."""
+        clauses, params = [], []
+        for column, value in (("question", normalize_text(question) if question is not None else None),
+                              ("model", model), ("prompt_version", prompt_version), ("kind", kind)):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(str(value))
+        query = "DELETE FROM analyses" + (" WHERE " + " AND ".join(clauses) if clauses else "")
+        with self._lock:
+            conn = self._connect()
+            removed = conn.execute(query, params).rowcount
+            conn.commit()
+        return removed
+
+    def summary(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._connect().execute(
+                "SELECT kind, model, prompt_version, COUNT(*), SUM(hits) FROM analyses "
+                "GROUP BY kind, model, prompt_version ORDER BY kind, model, prompt_version"
+            ).fetchall()
+        return [{"kind": row[0], "model": row[1], "prompt_version": row[2], "entries": row[3], "hits": row[4] or 0}
+                for row in rows]
+
+    def report(self) -> str:
+        return (f"--- Analysis cache: {self.stats['hits']} hits, {self.stats['misses']} misses, "
+                f"{self.stats['puts']} stored")
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+_analysis_cache: Optional[AnalysisCache] = None
+
+def get_analysis_cache() -> AnalysisCache:
+    global _analysis_cache
+    if _analysis_cache is None:
+        _analysis_cache = AnalysisCache()
+    return _analysis_cache
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect or invalidate memoized query analyses.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("summary", help="Entry counts per kind, model and prompt version")
+    show_parser = subparsers.add_parser("show", help="Most recent entries, optionally for one question")
+    show_parser.add_argument("--question")
+    show_parser.add_argument("--limit", type=int, default=20)
+    invalidate_parser = subparsers.add_parser("invalidate", help="Delete entries matching every given filter")
+    invalidate_parser.add_argument("--question")
+    invalidate_parser.add_argument("--model")
+    invalidate_parser.add_argument("--prompt-version")
+    invalidate_parser.add_argument("--kind")
+    invalidate_parser.add_argument("--all", action="store_true", help="Required to delete without any filter")
+    args = parser.parse_args()
+
+    cache = get_analysis_cache()
+    if args.command == "summary":
+        for entry in cache.summary():
+            print(f"{entry['kind']:<8} {entry['model']:<50} v{entry['prompt_version']:<4} "
+                  f"{entry['entries']:>7} entries {entry['hits']:>8} hits")
+    elif args.command == "show":
+        for entry in cache.inspect(args.question, args.limit):
+            print(json.dumps(entry, indent=2))
+    else:
+        filters = [args.question, args.model, args.prompt_version, args.kind]
+        if all(value is None for value in filters) and not args.all:
+            parser.error("invalidate needs at least one filter or --all")
+        print(f"Removed {cache.invalidate(args.question, args.model, args.prompt_version, args.kind)} entries.")
@@ -1,10 +1,9 @@
 import pandas as pd
-import time
-import pandas as pd
 
 from dataset_utils import load_liar_dataset
-from llm_interaction import query_ollama
-from sklearn.metrics import classification_report
+from eval_engine import EvalEngine, run_evaluation
+from config import EVAL_ROW_LIMIT, BASELINE_MAX_TOKENS
+from llm_interaction import extract_liar_label
 
 def build_baseline_prompt(statement_text: str, context: str = None, speaker: str = None, subject: str = None) -> str:
     prompt_parts = [f"Please classify the following statement: \"{statement_text}\"."]
@@ -32,7 +31,7 @@ def parse_llm_label(response_text: str) -> str:
     print(f"Warning: Could not parse label from LLM response: '{response_text}'")
     return "N/A_PARSE_ERROR"
 
-def process_liar_statement_baseline(liar_data_row: pd.Series) -> dict:
+async def process_liar_statement_baseline(liar_data_row: pd.Series, engine: EvalEngine) -> dict:
     statement_text = liar_data_row['statement']
     true_label = liar_data_row['label']
     statement_id = liar_data_row['id']
@@ -42,9 +41,11 @@ def process_liar_statement_baseline(liar_data_row: pd.Series) -> dict:
 
     prompt = build_baseline_prompt(statement_text, context, speaker, subject)
 
-    generated_response = query_ollama(prompt)
-    
-    predicted_label = parse_llm_label(generated_response)
+    generation = await engine.generate_stream(prompt, stop_on_label=True, require_label_marker=False,
+                                              max_tokens=BASELINE_MAX_TOKENS)
+    generated_response = generation.text
+
+    predicted_label = extract_liar_label(generated_response, require_marker=False) or parse_llm_label(generated_response)
 
     return {
         "id": statement_id,
@@ -52,6 +53,7 @@ def process_liar_statement_baseline(liar_data_row: pd.Series) -> dict:
         "true_label": true_label,
         "predicted_label": predicted_label,
         "justification": generated_response,
+        "time_to_first_token": generation.time_to_first_token,
         "time_taken": 0
     }
 
@@ -61,18 +63,9 @@ def run_baseline_liar_eval():
         print("LIAR dataset not loaded. Exiting.")
         return
 
-    results_list = []
-    for index, row in liar_df.head(100).iterrows():
-        start_time = time.time()
-        result = process_liar_statement_baseline(row)
-        
-        if not result:
-            continue
-        end_time = time.time()
-        result["time_taken"] = end_time - start_time
-        print("--- DEBUG: Finished one")
-        results_list.append(result)
-        
+    rows = liar_df if EVAL_ROW_LIMIT is None else liar_df.head(EVAL_ROW_LIMIT)
+    results_list = run_evaluation(rows, process_liar_statement_baseline)
+
     results_df = pd.DataFrame(results_list)
     results_df.to_csv("liar_baseline_evaluation_results.csv", index=False)
     print("\n--- Baseline evaluation results saved to liar_baseline_evaluation_results.csv")
@@ -87,6 +80,7 @@ def run_baseline_liar_eval():
 
             liar_labels = ["true", "mostly-true", "half-true", "barely-true", "false", "pants-fire"]
 
+            from sklearn.metrics import classification_report
             report_dict = classification_report(
                 true_labels, 
                 predicted_labels, 
@@ -0,0 +1,345 @@
+import datetime
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import faiss
+import numpy as np
+
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+from data_models import TextChunk
+from embedding_retrieval import (retrieve_chunks_with_mmr, new_factory_index, train_index, set_search_params,
+                                 evaluate_index, EMBEDDINGS_NORMALIZED)
+from config import (CHUNK_CORPUS_DIR, CHUNK_CORPUS_SAVE_EVERY, CHUNK_CORPUS_MIN_SCORE, CHUNK_CORPUS_INDEX_FACTORY,
+                    CHUNK_CORPUS_MIN_TRAIN_VECTORS, CHUNK_CORPUS_MAX_TRAIN_VECTORS, CHUNK_CORPUS_NPROBE,
+                    CHUNK_CORPUS_EF_SEARCH)
+
+# Untrained factories collect vectors here until there are enough to train on.
+STAGING_FACTORY = "Flat"
+REBUILD_BATCH_SIZE = 65536
+
+
+@dataclass
+class CorpusHit:
+    chunk: TextChunk
+    score: float
+    vector: np.ndarray
+    gkg_row: Optional[Dict]
+
+
+def _normalized_float32(embeddings: np.ndarray) -> np.ndarray:
+    vectors = np.array(embeddings, dtype=np.float32, order="C", copy=True).reshape(-1, np.shape(embeddings)[-1])
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+class ChunkCorpus:
+    """Chunk texts in SQLite, a faiss index keyed by chunk id, and the raw vectors in vectors.f32.
+
+    Row id-1 of vectors.f32 holds the unit-length vector of chunk `id`, which lets the index be
+    retrained or rebuilt with another factory without re-embedding anything.
+    """
+
+    def __init__(self, directory: str = CHUNK_CORPUS_DIR, save_every: int = CHUNK_CORPUS_SAVE_EVERY,
+                 factory: str = CHUNK_CORPUS_INDEX_FACTORY,
+                 min_train_vectors: int = CHUNK_CORPUS_MIN_TRAIN_VECTORS,
+                 max_train_vectors: int = CHUNK_CORPUS_MAX_TRAIN_VECTORS):
+        self.directory = directory
+        self.save_every = save_every
+        self.factory = factory
+        self.min_train_vectors = min_train_vectors
+        self.max_train_vectors = max_train_vectors
+        self._index_path = os.path.join(directory, "chunks.faiss")
+        self._db_path = os.path.join(directory, "chunks.sqlite3")
+        self._vectors_path = os.path.join(directory, "vectors.f32")
+
+        self._conn: Optional[sqlite3.Connection] = None
+        self._index: Optional[faiss.Index] = None
+        self._index_factory: Optional[str] = None
+        self._dim: Optional[int] = None
+        self._vector_view: Optional[np.memmap] = None
+        self._unsaved = 0
+        self._lock = threading.RLock()
+
+    def _meta(self, conn: sqlite3.Connection, key: str) -> Optional[str]:
+        row = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _open(self):
+        if self._conn is not None:
+            return
+
+        os.makedirs(self.directory, exist_ok=True)
+        conn = sqlite3.connect(self._db_path, check_same_thread=False)
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE IF NOT EXISTS chunks (
+                id INTEGER PRIMARY KEY,
+                text_hash TEXT UNIQUE NOT NULL,
+                text TEXT NOT NULL,
+                source_title TEXT,
+                source_url TEXT,
+                source_date TEXT,
+                gkg_row TEXT
+            );
+            CREATE INDEX IF NOT EXISTS chunks_source_date ON chunks(source_date);
+        """)
+
+        if os.path.exists(self._index_path):
+            self._index = faiss.read_index(self._index_path)
+            self._index_factory = self._meta(conn, "index_factory")
+            self._dim = self._index.d
+            set_search_params(self._index, nprobe=CHUNK_CORPUS_NPROBE, ef_search=CHUNK_CORPUS_EF_SEARCH)
+            # Taken from the index file itself, so a crash between replacing it and any SQLite commit
+            # cannot leave rows that the index holds marked as unindexed.
+            ids = faiss.vector_to_array(self._index.id_map)
+            indexed_upto = int(ids.max()) if ids.size else 0
+        else:
+            indexed_upto = 0
+
+        # Rows committed after the last index save are not in the index; drop them so they are re-added.
+        dropped = conn.execute("DELETE FROM chunks WHERE id > ?", (indexed_upto,)).rowcount
+        conn.commit()
+        if dropped:
+            print(f"--- Chunk corpus: dropped {dropped} rows that were never written to the index.")
+        self._conn = conn
+
+        if self._dim is not None:
+            self._sync_vector_file(indexed_upto)
+            if self._index_factory != self.factory and self._index_factory != STAGING_FACTORY:
+                print(f"--- Chunk corpus: index factory changed from {self._index_factory} to {self.factory}, rebuilding.")
+                self.rebuild()
+            elif self._index_factory == STAGING_FACTORY and self._index.ntotal >= self.min_train_vectors:
+                self.rebuild()
+
+    def _sync_vector_file(self, indexed_upto: int):
+        row_bytes = self._dim * 4
+        rows = os.path.getsize(self._vectors_path) // row_bytes if os.path.exists(self._vectors_path) else 0
+        if rows > indexed_upto:
+            with open(self._vectors_path, "r+b") as f:
+                f.truncate(indexed_upto * row_bytes)
+        self._vector_view = None
+
+    def _write_vectors(self, ids: List[int], vectors: np.ndarray):
+        row_bytes = vectors.shape[1] * 4
+        mode = "r+b" if os.path.exists(self._vectors_path) else "w+b"
+        with open(self._vectors_path, mode) as f:
+            for chunk_id, vector in zip(ids, vectors):
+                f.seek((chunk_id - 1) * row_bytes)
+                f.write(np.ascontiguousarray(vector, dtype=np.float32).tobytes())
+        self._vector_view = None
+
+    def _vectors(self) -> np.ndarray:
+        rows = os.path.getsize(self._vectors_path) // (self._dim * 4) if os.path.exists(self._vectors_path) else 0
+        if rows == 0:
+            return np.zeros((0, self._dim or 0), dtype=np.float32)
+        if self._vector_view is None or self._vector_view.shape[0] != rows:
+            self._vector_view = np.memmap(self._vectors_path, dtype=np.float32, mode="r", shape=(rows, self._dim))
+        return self._vector_view
+
+    def _new_index(self, dim: int, factory: str) -> faiss.Index:
+        # Vectors are unit length and scores are compared against CHUNK_CORPUS_MIN_SCORE as similarities,
+        # so the corpus always uses inner product whatever RETRIEVAL_METRIC is.
+        index = faiss.IndexIDMap2(new_factory_index(dim, factory, metric="cosine"))
+        set_search_params(index, nprobe=CHUNK_CORPUS_NPROBE, ef_search=CHUNK_CORPUS_EF_SEARCH)
+        return index
+
+    def rebuild(self, factory: Optional[str] = None):
+        """Re-create the index from the raw vectors, training it first when the factory needs it."""
+        with self._lock:
+            self._open()
+            if self._dim is None:
+                return
+            factory = factory or self.factory
+            ids = np.asarray([row[0] for row in self._conn.execute("SELECT id FROM chunks ORDER BY id")], dtype=np.int64)
+            vectors = self._vectors()
+            ids = ids[ids <= vectors.shape[0]]
+
+            index = self._new_index(self._dim, factory)
+            if not index.is_trained:
+                if ids.size < self.min_train_vectors:
+                    print(f"--- Chunk corpus: {ids.size} vectors is too few to train {factory}, staging in a flat index.")
+                    factory = STAGING_FACTORY
+                    index = self._new_index(self._dim, factory)
+                else:
+                    train_ids = ids
+                    if ids.size > self.max_train_vectors:
+                        train_ids = np.sort(np.random.default_rng(0).choice(ids, self.max_train_vectors, replace=False))
+                    train_index(index, vectors[train_ids - 1])
+
+            start = time.perf_counter()
+            for begin in range(0, ids.size, REBUILD_BATCH_SIZE):
+                batch_ids = ids[begin:begin + REBUILD_BATCH_SIZE]
+                index.add_with_ids(np.ascontiguousarray(vectors[batch_ids - 1]), batch_ids)
+            print(f"--- Chunk corpus: built {factory} index over {index.ntotal} vectors in {time.perf_counter() - start:.1f}s.")
+
+            self._index = index
+            self._index_factory = factory
+            self.save()
+
+    def evaluate(self, k: int = 10, num_queries: int = 200) -> Dict[str, float]:
+        """Recall@k and memory of the live index against exact search over the raw vectors."""
+        with self._lock:
+            self._open()
+            if self._index is None or self._index.ntotal == 0:
+                return {}
+            ids = np.asarray([row[0] for row in self._conn.execute("SELECT id FROM chunks ORDER BY id")], dtype=np.int64)
+            vectors = self._vectors()
+            ids = ids[ids <= vectors.shape[0]]
+            vectors = np.ascontiguousarray(vectors[ids - 1])
+            queries = vectors[np.random.default_rng(0).choice(len(ids), min(num_queries, len(ids)), replace=False)]
+            stats = evaluate_index(self._index, vectors, queries, k, ids=ids)
+        print(f"--- Chunk corpus ({self._index_factory}): recall@{stats['k']} {stats['recall_at_k']:.3f}, "
+              f"{stats['memory_bytes'] / 2**20:.1f} MiB vs {stats['flat_memory_bytes'] / 2**20:.1f} MiB flat, "
+              f"{stats['query_ms']:.2f} ms/query")
+        return stats
+
+    @property
+    def ntotal(self) -> int:
+        with self._lock:
+            self._open()
+            return self._index.ntotal if self._index is not None else 0
+
+    def add_chunks(self, chunks: List[TextChunk], embeddings: np.ndarray,
+                   gkg_rows_by_url: Optional[Dict[str, Dict]] = None) -> int:
+        if not chunks:
+            return 0
+
+        vectors = _normalized_float32(embeddings)
+        with self._lock:
+            self._open()
+            new_ids = []
+            new_vectors = []
+            for chunk, vector in zip(chunks, vectors):
+                text_hash = hashlib.sha1(chunk.text.encode("utf-8")).hexdigest()
+                gkg_row = (gkg_rows_by_url or {}).get(chunk.source_url)
+                cursor = self._conn.execute(
+                    "INSERT OR IGNORE INTO chunks(text_hash, text, source_title, source_url, source_date, gkg_row) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (text_hash, chunk.text, chunk.source_title, chunk.source_url, chunk.source_date,
+                     json.dumps(gkg_row, default=str) if gkg_row is not None else None)
+                )
+                if cursor.rowcount:
+                    new_ids.append(cursor.lastrowid)
+                    new_vectors.append(vector)
+            self._conn.commit()
+
+            if not new_ids:
+                return 0
+
+            if self._index is None:
+                self._dim = vectors.shape[1]
+                self._index_factory = self.factory
+                self._index = self._new_index(self._dim, self.factory)
+                if not self._index.is_trained:
+                    self._index_factory = STAGING_FACTORY
+                    self._index = self._new_index(self._dim, STAGING_FACTORY)
+
+            new_vectors = np.stack(new_vectors)
+            self._write_vectors(new_ids, new_vectors)
+            self._index.add_with_ids(new_vectors, np.asarray(new_ids, dtype=np.int64))
+
+            self._unsaved += len(new_ids)
+            if (self._index_factory == STAGING_FACTORY and self.factory != STAGING_FACTORY
+                    and self._index.ntotal >= self.min_train_vectors):
+                self.rebuild()
+            elif self._unsaved >= self.save_every:
+                self.save()
+
+        print(f"--- Chunk corpus: added {len(new_ids)} new chunks (total {self._index.ntotal}).")
+        return len(new_ids)
+
+    def search(self, query_embedding: np.ndarray, top_k: int,
+               min_score: Optional[float] = None,
+               min_date: Optional[str] = None,
+               max_date: Optional[str] = None) -> List[CorpusHit]:
+        with self._lock:
+            self._open()
+            if self._index is None or self._index.ntotal == 0:
+                return []
+
+            query = _normalized_float32(query_embedding)[:1]
+            # Over-fetch when filtering by date so the window still yields top_k hits.
+            fetch_k = min(self._index.ntotal, top_k * 4 if (min_date or max_date) else top_k)
+            scores, ids = self._index.search(query, fetch_k)
+
+            hits: List[CorpusHit] = []
+            for score, chunk_id in zip(scores[0], ids[0]):
+                if chunk_id == -1 or (min_score is not None and score < min_score):
+                    continue
+                row = self._conn.execute(
+                    "SELECT text, source_title, source_url, source_date, gkg_row FROM chunks WHERE id = ?",
+                    (int(chunk_id),)
+                ).fetchone()
+                if row is None:
+                    continue
+                source_date = (row[3] or "")[:8]
+                if (min_date and source_date < min_date) or (max_date and source_date > max_date):
+                    continue
+                hits.append(CorpusHit(
+                    chunk=TextChunk(text=row[0], source_title=row[1], source_url=row[2], source_date=row[3]),
+                    score=float(score),
+                    vector=np.array(self._vectors()[int(chunk_id) - 1]),
+                    gkg_row=json.loads(row[4]) if row[4] else None,
+                ))
+                if len(hits) >= top_k:
+                    break
+            return hits
+
+    def save(self):
+        with self._lock:
+            if self._index is None or self._conn is None:
+                return
+            tmp_path = f"{self._index_path}.tmp"
+            faiss.write_index(self._index, tmp_path)
+            os.replace(tmp_path, self._index_path)
+            self._conn.execute("INSERT OR REPLACE INTO meta(key, value) VALUES ('index_factory', ?)",
+                               (self._index_factory,))
+            self._conn.commit()
+            self._unsaved = 0
+            print(f"--- Chunk corpus saved ({self._index.ntotal} vectors).")
+
+
+_chunk_corpus: Optional[ChunkCorpus] = None
+
+def get_chunk_corpus() -> ChunkCorpus:
+    global _chunk_corpus
+    if _chunk_corpus is None:
+        _chunk_corpus = ChunkCorpus()
+    return _chunk_corpus
+
+def _date_window(start_date: Optional[str], days_to_look_back: int):
+    if start_date is None:
+        end = datetime.datetime.now(datetime.timezone.utc).date()
+    else:
+        end = datetime.datetime.strptime(start_date, "%Y-%m-%d").date()
+    start = end - datetime.timedelta(days=days_to_look_back)
+    return start.strftime("%Y%m%d"), end.strftime("%Y%m%d")
+
+def retrieve_from_corpus(query_embedding: np.ndarray,
+                         top_n: int,
+                         lambda_param: float,
+                         candidate_pool_size: int,
+                         use_mmr: bool = True,
+                         min_score: float = CHUNK_CORPUS_MIN_SCORE,
+                         start_date: Optional[str] = None,
+                         days_to_look_back: int = 90,
+                         excluded_sources: Optional[List[str]] = None) -> List[TextChunk]:
+    min_date, max_date = _date_window(start_date, days_to_look_back)
+    hits = get_chunk_corpus().search(query_embedding, max(top_n, candidate_pool_size), min_score=min_score,
+                                     min_date=min_date, max_date=max_date)
+    if excluded_sources:
+        excluded = set(excluded_sources)
+        hits = [hit for hit in hits if (hit.gkg_row or {}).get('SourceCommonName') not in excluded]
+    if len(hits) < top_n:
+        return []
+
+    print(f"--- Chunk corpus returned {len(hits)} chunks above {min_score} similarity, skipping GKG retrieval.")
+    if not use_mmr:
+        return [hit.chunk for hit in hits[:top_n]]
+    return retrieve_chunks_with_mmr(query_embedding, np.stack([hit.vector for hit in hits]),
+                                    [hit.chunk for hit in hits], top_n_final=top_n, lambda_param=lambda_param,
+                                    normalized=EMBEDDINGS_NORMALIZED)
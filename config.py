@@ -1,2 +1,138 @@
+import os
+
 EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
 OLLAMA_MODEL_NAME = "gemma3:latest"
+
+# Never touch the network for lookup tables; rely on the local caches only.
+OFFLINE_MODE = os.environ.get("LLMRAG_OFFLINE", "0") == "1"
+
+CACHE_DIR = os.environ.get("LLMRAG_CACHE_DIR", "cache")
+
+GDELT_THEMES_URL = "http://data.gdeltproject.org/api/v2/guides/LOOKUP-GKGTHEMES.TXT"
+GDELT_THEMES_CACHE_PATH = os.path.join(CACHE_DIR, "gdelt_themes.pkl")
+GDELT_THEMES_CACHE_TTL_SECONDS = 7 * 24 * 60 * 60
+
+# GKG queries: "maximum_bytes_billed" caps the real job (BigQuery refuses it if it would bill more),
+# "dry_run" estimates first and aborts over budget (an extra round trip), "none" runs unchecked.
+GKG_BUDGET_MODE = "maximum_bytes_billed"
+GKG_MAX_BYTES_BILLED = 100 * 1024**3
+
+# Where GKG filters run: "bigquery" (gdelt-bq.gdeltv2.gkg_partitioned) or "duckdb" over local Parquet files
+# partitioned as GKG_LOCAL_DIR/date=YYYY-MM-DD/. Offline runs default to the local store.
+GKG_BACKEND = os.environ.get("LLMRAG_GKG_BACKEND", "duckdb" if OFFLINE_MODE else "bigquery")
+# Results of recent GKG filter expressions, keyed by canonical filter, limit and partition window.
+GKG_RESULT_CACHE_SIZE = 256
+GKG_LOCAL_DIR = os.environ.get("LLMRAG_GKG_DIR", os.path.join("data", "gkg"))
+GKG_LOCAL_THREADS = None
+# Answer filter expressions from the per-partition posting lists when every partition in the window has them.
+GKG_LOCAL_USE_POSTINGS = True
+# Partition posting lists kept in memory; enough for a 90-day window plus its edge days.
+GKG_POSTINGS_CACHE_SIZE = int(os.environ.get("LLMRAG_GKG_POSTINGS_CACHE_SIZE", "128"))
+# Raw GKG ingestion (gkg_ingest.py): rows read per chunk and parallel file workers.
+GKG_INGEST_CHUNK_ROWS = 50_000
+GKG_INGEST_WORKERS = os.cpu_count()
+
+# Evaluation engine: None evaluates the full split instead of the first N rows.
+EVAL_ROW_LIMIT = None
+EVAL_MAX_CONCURRENT_CLAIMS = 8
+EVAL_STAGE_LIMITS = {
+    "spacy": 1,
+    "analysis": 4,
+    "bigquery": 4,
+    "scrape": 2,
+    "embed": 1,
+    "corpus": 1,
+    "llm": 2,
+}
+EVAL_BATCH_SIZE = 64
+EVAL_BATCH_WAIT_SECONDS = 0.05
+
+# Downloaded article HTML kept between the title and content phases.
+PAGE_STORE_MAX_MEMORY_BYTES = 256 * 1024 * 1024
+PAGE_STORE_SPILL_DIR = os.path.join(CACHE_DIR, "page_spill")
+PAGE_STORE_MAX_SPILL_BYTES = 1024 * 1024 * 1024
+
+# "full" downloads whole pages during title pre-selection so the content phase can
+# reuse them; "sniff" stops reading as soon as the title is known.
+TITLE_FETCH_MODE = "full"
+TITLE_SNIFF_MAX_BYTES = 64 * 1024
+TITLE_SNIFF_CHUNK_SIZE = 4 * 1024
+
+# Shared aiohttp client used for article scraping.
+HTTP_MAX_CONNECTIONS = 100
+HTTP_MAX_PER_HOST = 4
+HTTP_DNS_CACHE_TTL_SECONDS = 300
+HTTP_KEEPALIVE_TIMEOUT_SECONDS = 30
+HTTP_MAX_RETRIES = 2
+HTTP_BACKOFF_BASE_SECONDS = 0.5
+HTTP_BACKOFF_MAX_SECONDS = 8.0
+
+# Persistent URL -> title / article text cache. "replay" never fetches, "off" disables it.
+URL_CACHE_MODE = os.environ.get("LLMRAG_URL_CACHE_MODE", "readwrite")
+URL_CACHE_PATH = os.path.join(CACHE_DIR, "url_cache.sqlite3")
+URL_CACHE_TTL_SECONDS = 30 * 24 * 60 * 60
+URL_CACHE_MAX_ENTRIES = 200_000
+URL_CACHE_MAX_BYTES = 4 * 1024 * 1024 * 1024
+URL_CACHE_STORE_HTML = True
+
+# Async Ollama client shared by query analysis and answer generation.
+OLLAMA_HOST = os.environ.get("OLLAMA_HOST", "http://localhost:11434")
+OLLAMA_MAX_IN_FLIGHT = 4
+OLLAMA_TIMEOUT_SECONDS = 300
+OLLAMA_MAX_RETRIES = 2
+
+# Streaming generation: stop as soon as a LIAR label has been emitted, or after N tokens.
+LLM_STOP_ON_LABEL = True
+LLM_MAX_TOKENS = None
+BASELINE_MAX_TOKENS = 16
+
+# Query analysis fast path: choose issue categories and curated themes by embedding similarity and only
+# ask the LLM when the best match is weak or too many candidates score alike.
+QUERY_CLASSIFIER_ENABLED = True
+ISSUE_CLASSIFIER_MIN_SCORE = 0.35
+ISSUE_CLASSIFIER_MARGIN = 0.05
+ISSUE_CLASSIFIER_MAX_ISSUES = 3
+THEME_CLASSIFIER_MIN_SCORE = 0.4
+THEME_CLASSIFIER_MAX_THEMES = 5
+
+# Memoized QueryAnalyzer results (entities and themes), keyed by normalized question, model and prompt version.
+ANALYSIS_CACHE_ENABLED = True
+ANALYSIS_CACHE_PATH = os.path.join(CACHE_DIR, "query_analysis.sqlite3")
+
+# Embedding memoization: in-process LRU in front of an on-disk float32 matrix per model.
+EMBEDDING_CACHE_DIR = os.path.join(CACHE_DIR, "embeddings")
+EMBEDDING_CACHE_LRU_SIZE = 50_000
+EMBEDDING_CACHE_PERSIST = True
+
+# Embedding throughput: texts are sorted by token length and encoded in fixed-size batches.
+EMBEDDING_BATCH_SIZE = 64
+EMBEDDING_SORT_BY_LENGTH = True
+# Intra-op torch threads for encoding; None keeps torch's default.
+EMBEDDING_NUM_THREADS = None
+
+# Embedding backend: "torch", "onnx" or "onnx-int8". The ONNX variants are loaded from EMBEDDING_ONNX_PATH,
+# which export_onnx_model in embedding_retrieval fills with the exported and dynamically quantized model.
+EMBEDDING_BACKEND = "torch"
+EMBEDDING_ONNX_PATH = os.path.join(CACHE_DIR, "onnx", "all-MiniLM-L6-v2")
+# Instruction-set target of the int8 model: "avx2", "avx512", "avx512_vnni" or "arm64".
+EMBEDDING_ONNX_QUANTIZATION = "avx2"
+
+# Persistent, append-only corpus of every chunk scraped so far.
+CHUNK_CORPUS_DIR = os.path.join(CACHE_DIR, "chunk_corpus")
+# faiss factory string for the corpus index. "HNSW32,Flat" keeps full float32 vectors; compressed options
+# include "SQ8", "IVF4096,PQ48" or "OPQ48_384,IVF4096,PQ48,Refine(SQ8)". Raw vectors are always kept on disk
+# so the index can be rebuilt with a different factory.
+CHUNK_CORPUS_INDEX_FACTORY = "HNSW32,Flat"
+# Factories that need training stay in a flat staging index until this many vectors exist.
+CHUNK_CORPUS_MIN_TRAIN_VECTORS = 50_000
+CHUNK_CORPUS_MAX_TRAIN_VECTORS = 200_000
+CHUNK_CORPUS_NPROBE = 32
+CHUNK_CORPUS_EF_SEARCH = 64
+CHUNK_CORPUS_SAVE_EVERY = 5000
+CHUNK_CORPUS_MIN_SCORE = 0.6
+
+# "cosine" L2-normalizes embeddings at encode time and searches with inner product; "l2" keeps raw vectors.
+RETRIEVAL_METRIC = "cosine"
+# "flat" for exact search, "hnsw" for an approximate graph index.
+RETRIEVAL_INDEX_TYPE = "flat"
+RETRIEVAL_HNSW_M = 32
@@ -2,6 +2,8 @@ HEADERS = {
     'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
 }
 
+LIAR_LABELS = ["true", "mostly-true", "half-true", "barely-true", "false", "pants-fire"]
+
 GKG_HEADER = [
     "GKGRECORDID", "DATE", "SourceCollectionIdentifier", "SourceCommonName",
     "DocumentIdentifier", "Counts", "V2Counts", "Themes", "V2Themes", "Locations",
@@ -47,6 +49,30 @@ ISSUES_TO_GDELT_THEMES  = {"taxes" : ["ECON_TAXATION",],
 "energy" : ["ENV_BIOFUEL",  "ENV_COAL", "ENV_GEOTHERMAL", "ENV_GREEN", "ENV_HYDRO", "ENV_NATURALGAS", "ENV_NUCLEARPOWER", "ENV_OIL", "ENV_SOLAR",  "ENV_WINDPOWER"]
 }
 
+# Short natural-language descriptions of each issue key, embedded by the semantic issue classifier.
+ISSUE_DESCRIPTIONS = {
+"taxes" : "Taxes, tax rates, tax cuts and tax increases, income tax, corporate tax, sales tax and property tax, the IRS and tax policy.",
+"unemployment" : "Unemployment, jobs, job losses and job creation, the unemployment rate, layoffs, employment and the labor market.",
+"domesticeconomy" : "The domestic economy: economic growth, recession, inflation, cost of living, wages, the stock market, housing prices, business, debt, budgets, government spending and deficits.",
+"trade" : "International trade, tariffs, imports and exports, free trade agreements, trade deficits, outsourcing, foreign investment and currency exchange rates.",
+"terrorism" : "Terrorism, terrorist attacks and groups, extremism, jihad, ISIS and al-Qaeda, suicide bombings and weapons of mass destruction.",
+"military" : "The military and armed forces, war, armed conflict, troops, defense spending, veterans, ceasefires and peacekeeping.",
+"internationalrelations" : "International relations, foreign policy, diplomacy, treaties, relations between countries, the United Nations and foreign governments.",
+"immigration/refugees" : "Immigration and illegal immigrants, refugees, asylum seekers, deportation, border security, the border wall and migration.",
+"healthcare" : "Health care and health insurance, Obamacare, Medicare and Medicaid, hospitals, doctors, vaccines, diseases and public health.",
+"guncontrol" : "Gun control and gun rights, firearms, the Second Amendment, background checks, assault weapons, gun violence and arms deals.",
+"drug" : "Drugs and illegal drugs, drug trafficking, cartels, marijuana legalization, opioids and the war on drugs.",
+"policesystem" : "Police and law enforcement, policing, police brutality, crime and criminal justice, prisons and security services.",
+"racism" : "Racism and racial discrimination, hate speech, race relations, civil rights and minorities.",
+"civilliberties" : "Civil liberties and social rights, women's rights, abortion, LGBT and same-sex marriage, gender violence and social movements.",
+"environment" : "The environment, climate change and global warming, pollution, emissions, deforestation, endangered species, water, mining and natural resources.",
+"partypolitics" : "Party politics, Democrats and Republicans, political parties, campaigns, candidates, Congress, elections and voting records.",
+"electionfraud" : "Election fraud, voter fraud, rigged elections, voter ID laws, ballots and vote counting.",
+"education" : "Education, schools, teachers, students, colleges and universities, student loans and tuition.",
+"media/internet" : "The media and the internet, news outlets, social media, censorship, free speech, surveillance and cyber attacks.",
+"energy" : "Energy, oil and gas, coal, nuclear power, renewable energy, solar and wind power, fuel and gas prices."
+}
+
 ALL_THEMES_FROM_ISSUES_MAP = list(set(theme for themes_list in ISSUES_TO_GDELT_THEMES.values() for theme in themes_list))
 
 FIPS_MANUAL_MAP = {
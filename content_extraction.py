@@ -1,40 +1,90 @@
 import time
+import codecs
 import requests
 from typing import List, Dict, Optional, Tuple
 from bs4 import BeautifulSoup
-import nltk
+from html.parser import HTMLParser
 
 import asyncio
 import aiohttp
 
-from constants import HEADERS
+from config import TITLE_FETCH_MODE, TITLE_SNIFF_MAX_BYTES, TITLE_SNIFF_CHUNK_SIZE
 from data_models import GKGDocument
+from page_store import PageStore
+from http_client import HttpClient, get_http_client
+from url_cache import get_url_cache
+import model_registry
 
-nltk.download('punkt_tab')
-
-async def fetch_article_content(session: aiohttp.ClientSession, url: str) -> tuple[Optional[str], Optional[str]]:
+def _load_sentence_tokenizer():
+    import nltk
     try:
+        nltk.data.find('tokenizers/punkt_tab')
+    except LookupError:
+        nltk.download('punkt_tab')
+    return nltk.sent_tokenize
 
-        async with  session.get(url, headers=HEADERS, timeout=10) as response:
-            response.raise_for_status()
-            html_text = await response.text()
-
-            soup = BeautifulSoup(html_text, "html.parser")
-
-            title_tag = soup.find('title')
-            title = title_tag.string.strip() if title_tag and title_tag.string else "No Title Found"
+model_registry.register("sentence_tokenizer", _load_sentence_tokenizer)
 
-            paragraphs = soup.find_all('p')
-            text_content_list = [p.get_text().strip() for p in paragraphs if p.get_text() and len(p.get_text().strip()) > 50]
+# Bodies downloaded during title pre-selection, reused by the full-content phase.
+page_store = PageStore()
 
-            if not text_content_list:
-                all_text = soup.get_text(seperator='\n', strip=True)
-                text_content = "\n".join(line for line in all_text.splitlines() if len(line) > 20)
-            else:
-                text_content = "\n".join(text_content_list)
+def decode_html(body: bytes, encoding: Optional[str]) -> str:
+    try:
+        return body.decode(encoding or "utf-8", errors="replace")
+    except LookupError:
+        return body.decode("utf-8", errors="replace")
+
+NO_TITLE = "No Title Found"
+
+def parse_article_html(html_text: str) -> tuple[str, str]:
+    soup = BeautifulSoup(html_text, "html.parser")
+
+    title_tag = soup.find('title')
+    title = title_tag.string.strip() if title_tag and title_tag.string else NO_TITLE
+
+    paragraphs = soup.find_all('p')
+    text_content_list = [p.get_text().strip() for p in paragraphs if p.get_text() and len(p.get_text().strip()) > 50]
+
+    if not text_content_list:
+        all_text = soup.get_text(separator='\n', strip=True)
+        text_content = "\n".join(line for line in all_text.splitlines() if len(line) > 20)
+    else:
+        text_content = "\n".join(text_content_list)
+
+    return title, text_content.strip()
+
+async def _read_body(response: aiohttp.ClientResponse) -> Tuple[bytes, Optional[str]]:
+    return await response.read(), response.get_encoding()
+
+async def fetch_article_content(client: HttpClient, url: str) -> tuple[Optional[str], Optional[str]]:
+    url_cache = get_url_cache()
+    cached_article = await asyncio.to_thread(url_cache.get_article, url)
+    if cached_article is not None:
+        return cached_article
+
+    stored = page_store.get(url)
+    if stored is None:
+        stored = await asyncio.to_thread(url_cache.get_html, url)
+    if stored is not None:
+        body, encoding = stored
+        try:
+            title, text = parse_article_html(decode_html(body, encoding))
+        except Exception as e:
+            print(f"Failed to parse stored page {url}: {e}")
+            return None, None
+        # A missing <title> must not overwrite the title stored by the title phase.
+        await asyncio.to_thread(url_cache.put, url, title=title if title != NO_TITLE else None, text=text)
+        return title, text
+
+    if url_cache.replay:
+        return None, None
 
-            return title, text_content.strip()
-        
+    try:
+        body, encoding = await client.request(url, _read_body, timeout=10)
+        title, text = parse_article_html(decode_html(body, encoding))
+        await asyncio.to_thread(url_cache.put, url, title=title if title != NO_TITLE else None, text=text,
+                                body=body, encoding=encoding)
+        return title, text
     except aiohttp.ClientError as e:
         print(f"AIOHTTP ClientError fetching {url}: {e}")
         return None, None
@@ -49,55 +99,124 @@ async def build_gkg_documents_from_rows(gkg_rows: List[Dict]) -> List[GKGDocumen
     documents: List[GKGDocument] = []
     print(f"--- Attempting to fetch content for {len(gkg_rows)} articles...")
 
-    async with aiohttp.ClientSession() as session:
-        tasks = []
-        for row_num, row in enumerate(gkg_rows, 1):
-            url = row.get('DocumentIdentifier')
-            if not url:
-                print(f"--- Row {row_num}: Skipping row, missing DocumentIdentifier.")
-                continue
+    client = get_http_client()
+    tasks = []
+    for row_num, row in enumerate(gkg_rows, 1):
+        url = row.get('DocumentIdentifier')
+        if not url:
+            print(f"--- Row {row_num}: Skipping row, missing DocumentIdentifier.")
+            continue
 
-            tasks.append(fetch_article_content(session, url))
+        tasks.append(fetch_article_content(client, url))
 
-        results = await asyncio.gather(*tasks, return_exceptions=True)
+    results = await asyncio.gather(*tasks, return_exceptions=True)
 
-        for i, result in enumerate(results):
-            original_row = gkg_rows[i]
-            url = original_row.get('DocumentIdentifier', 'N/A')
+    for i, result in enumerate(results):
+        original_row = gkg_rows[i]
+        url = original_row.get('DocumentIdentifier', 'N/A')
 
-            if isinstance(result, Exception):
-                print(f"--- Row {i+1}: Failed to get valid content for {url} due to an exception: {result}")
-                continue
+        if isinstance(result, Exception):
+            print(f"--- Row {i+1}: Failed to get valid content for {url} due to an exception: {result}")
+            continue
 
-            title, text = result
+        title, text = result
 
-            if title is None or text is None or not text.strip():
-                print(f"--- Row {i+1}: Failed to get valid content for {url} (async). Skipping.")
-                continue
+        if title is None or text is None or not text.strip():
+            print(f"--- Row {i+1}: Failed to get valid content for {url} (async). Skipping.")
+            continue
 
-            themes_str = original_row.get('V2Themes', '')
-            themes = themes_str.split(';') if themes_str else []
-            tone = original_row.get('V2Tone', '')
-            date_str = str(original_row.get('DATE'))
+        themes_str = original_row.get('V2Themes', '')
+        themes = themes_str.split(';') if themes_str else []
+        tone = original_row.get('V2Tone', '')
+        date_str = str(original_row.get('DATE'))
 
-            documents.append(GKGDocument(
-                title=title, url=url, themes=themes, tone=tone, raw_text=text, date=date_str
-            ))
-            print(f"-- Row {i+1}: Succesfully added document (async): {title[:50]}...")
+        documents.append(GKGDocument(
+            title=title, url=url, themes=themes, tone=tone, raw_text=text, date=date_str
+        ))
+        print(f"-- Row {i+1}: Succesfully added document (async): {title[:50]}...")
 
     print(f"--- Successfully build {len(documents)} GKGDocuments (async).")
+    print(page_store.report())
+    print(get_url_cache().report())
     return documents
 
-async def fetch_title_async(session: aiohttp.ClientSession, url: str) -> Optional[str]:
+class TitleSniffer(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.title: Optional[str] = None
+        self.og_title: Optional[str] = None
+        self.done = False
+        self._in_title = False
+        self._title_parts: List[str] = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "title" and self.title is None:
+            self._in_title = True
+        elif tag == "meta" and self.og_title is None:
+            attr_map = dict(attrs)
+            if (attr_map.get("property") or attr_map.get("name") or "").lower() == "og:title" and attr_map.get("content"):
+                self.og_title = attr_map["content"].strip() or None
+                self.done = self.og_title is not None
+        elif tag == "body":
+            self.done = True
+
+    def handle_endtag(self, tag):
+        if tag == "title" and self._in_title:
+            self._in_title = False
+            self.title = " ".join("".join(self._title_parts).split()) or None
+            self.done = self.title is not None
+
+    def handle_data(self, data):
+        if self._in_title:
+            self._title_parts.append(data)
+
+    def result(self) -> Optional[str]:
+        return self.title or self.og_title
+
+def extract_title(html_text: str, chunk_size: int = TITLE_SNIFF_CHUNK_SIZE) -> Optional[str]:
+    sniffer = TitleSniffer()
+    for start in range(0, len(html_text), chunk_size):
+        sniffer.feed(html_text[start:start + chunk_size])
+        if sniffer.done:
+            break
+    return sniffer.result()
+
+async def sniff_title(response: aiohttp.ClientResponse, max_bytes: int = TITLE_SNIFF_MAX_BYTES) -> Optional[str]:
+    sniffer = TitleSniffer()
     try:
-        async with session.get(url, headers=HEADERS, timeout=5) as response:
-            response.raise_for_status()
-            html_text = await response.text()
-
-            soup = BeautifulSoup(html_text, "html.parser")
-            title_tag = soup.find('title')
-            title = title_tag.string.strip() if title_tag and title_tag.string else None
+        decoder = codecs.getincrementaldecoder(response.charset or "utf-8")(errors="replace")
+    except LookupError:
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+    bytes_read = 0
+    async for chunk in response.content.iter_chunked(TITLE_SNIFF_CHUNK_SIZE):
+        bytes_read += len(chunk)
+        sniffer.feed(decoder.decode(chunk))
+        if sniffer.done or bytes_read >= max_bytes:
+            break
+    return sniffer.result()
+
+async def fetch_title_async(client: HttpClient, url: str, mode: str = TITLE_FETCH_MODE) -> Optional[str]:
+    url_cache = get_url_cache()
+    cached_title = await asyncio.to_thread(url_cache.get_title, url)
+    if cached_title is not None or url_cache.replay:
+        return cached_title
+
+    async def read_title(response: aiohttp.ClientResponse) -> Optional[str]:
+        if mode == "sniff":
+            title = await sniff_title(response)
+            await asyncio.to_thread(url_cache.put, url, title=title, status=response.status)
             return title
+
+        body = await response.read()
+        encoding = response.get_encoding()
+        page_store.put(url, body, encoding)
+        title = extract_title(decode_html(body, encoding))
+        await asyncio.to_thread(url_cache.put, url, title=title, body=body, encoding=encoding, status=response.status)
+        return title
+
+    try:
+        return await client.request(url, read_title, timeout=5)
     except Exception as e:
         return None
 
@@ -110,22 +229,23 @@ async def fetch_titles_for_gkg_rows(gkg_rows: List[Dict]) -> List[Tuple[str, Opt
         if url:
             urls_and_orignal_rows.append((url, row))
     
-    async with aiohttp.ClientSession() as session:
-        tasks = [fetch_title_async(session, item[0]) for item in urls_and_orignal_rows]
+    client = get_http_client()
+    tasks = [fetch_title_async(client, item[0]) for item in urls_and_orignal_rows]
 
-        titles_results = await asyncio.gather(*tasks, return_exceptions=True)
+    titles_results = await asyncio.gather(*tasks, return_exceptions=True)
 
-        for i, result in enumerate(titles_results):
-            url, orignal_row = urls_and_orignal_rows[i]
-            if isinstance(result, Exception) or result is None or len(result) < 5:
-                if not isinstance(result, Exception):
-                    print(f"--- Could not fetch valid title (async) for {url}")
+    for i, result in enumerate(titles_results):
+        url, orignal_row = urls_and_orignal_rows[i]
+        if isinstance(result, Exception) or result is None or len(result) < 5:
+            if not isinstance(result, Exception):
+                print(f"--- Could not fetch valid title (async) for {url}")
 
-            else:
-                title = result
-                titled_rows.append((url, title, orignal_row))
+        else:
+            title = result
+            titled_rows.append((url, title, orignal_row))
 
     print(f"--- Fetched titles for {len(titled_rows)} out of {len(gkg_rows)} GDELT records (async).")
+    print(client.report())
     return titled_rows
 
 def split_text_into_chunks(text: str, min_chunk_words: int = 20) -> List[str]:
@@ -140,7 +260,7 @@ def split_text_into_chunks(text: str, min_chunk_words: int = 20) -> List[str]:
 
 def split_text_into_chunks_by_sentence(text: str, sentences_per_chunk: int = 4, min_chunk_words: int = 20) -> List[str]:
     try:
-        sentences = nltk.sent_tokenize(text)
+        sentences = model_registry.get("sentence_tokenizer")(text)
     except Exception as e:
          print(f"NLTK sentence tokenization failed: {e}")
          return split_text_into_chunks(text, min_chunk_words) 
@@ -1,8 +1,12 @@
-import faiss
-import numpy as np
-from typing import List
+from __future__ import annotations
+
+from typing import List, TYPE_CHECKING
 from dataclasses import dataclass
 
+if TYPE_CHECKING:
+    import faiss
+    import numpy as np
+
 @dataclass
 class GKGDocument:
     title: str
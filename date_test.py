@@ -1,23 +1,29 @@
-import faiss
 import numpy as np
-import asyncio
 import pandas as pd
-import time
 
-from typing import List, Any, Dict
-from query_processing import QueryAnalyzer, build_bigquery_filter_with_issues
+from typing import List, Any, Dict, Optional
+from query_processing import get_query_analyzer, warm_up_query_analyzer
+from gkg_filters import issue_filter
 from content_extraction import fetch_titles_for_gkg_rows, build_gkg_documents_from_rows, split_text_into_chunks_by_sentence
 from external_apis import fetch_gkg_from_bigquery
-from embedding_retrieval import embed_query, embed_texts, retrieve_top_chunks
+from embedding_retrieval import build_index, retrieve_top_chunks, retrieve_chunks_with_mmr, EMBEDDINGS_NORMALIZED
 from data_models import TextChunk
-from llm_interaction import build_prompt_with_chunks, query_ollama
+from chunk_corpus import get_chunk_corpus, retrieve_from_corpus
+from llm_interaction import build_prompt_with_chunks, extract_liar_label
 from dataset_utils import adapt_liar_statement, load_liar_dataset_date
-from sklearn.metrics import classification_report
+from eval_engine import EvalEngine, run_evaluation
+import model_registry
+from config import LLM_STOP_ON_LABEL, LLM_MAX_TOKENS
 
 
 USE_ISSUES_BASED_THEME_LOGIC = True
+USE_MMR = True
+USE_CHUNK_CORPUS = True
+MMR_CANDIDATE_POOL = 200
+NUM_CHUNKS_FOR_LLM = 10
+LAMBDA_MMR = 0.7
 
-def process_liar(liar_data_row: pd.Series) -> Dict[str, Any]:
+async def process_liar(liar_data_row: pd.Series, engine: EvalEngine) -> Dict[str, Any]:
     statement_text = liar_data_row['statement']
     label = liar_data_row['label']
     speaker = liar_data_row['speaker']
@@ -27,19 +33,75 @@ def process_liar(liar_data_row: pd.Series) -> Dict[str, Any]:
 
     query = adapt_liar_statement(liar_data_row.to_dict())
 
-    return asyncio.run(ask_question(query, statement_text, label, date, liar_data_row['id']))
+    return await ask_question(query, statement_text, label, date, liar_data_row['id'], engine)
 
 
-async def ask_question(question: str, statement_text: str, label: str, date, id) -> str:
-    analyzer = QueryAnalyzer()
+async def ask_question(question: str, statement_text: str, label: str, date, id, engine: Optional[EvalEngine] = None) -> str:
+    if engine is None:
+        engine = EvalEngine()
+
+    query_embedding = await engine.embed_query(question)
+
+    retrieved_chunks = []
+    if USE_CHUNK_CORPUS:
+        retrieved_chunks = await engine.run_stage("corpus", retrieve_from_corpus, query_embedding, NUM_CHUNKS_FOR_LLM,
+                                                  LAMBDA_MMR, MMR_CANDIDATE_POOL, use_mmr=USE_MMR, start_date=date,
+                                                  days_to_look_back=30)
+    if not retrieved_chunks:
+        retrieved_chunks = await retrieve_chunks_from_gkg(question, date, query_embedding, engine)
+
+    if not retrieved_chunks:
+        print("No relevant text chunks found matching the query.")
+        return False
+    
+    print(f"--- Retrieved {len(retrieved_chunks)} chunks to use in prompt.")
+
+    prompt = build_prompt_with_chunks(question, retrieved_chunks)
+
+    print("--- Querying LLM with retrieved chunks...")
+
+    generation = await engine.generate_stream(prompt, stop_on_label=LLM_STOP_ON_LABEL, max_tokens=LLM_MAX_TOKENS)
+    generated_answer = generation.text
+    print("\nGenerated Answer:\n", generated_answer)
+    
+    # Same parser the streaming stop condition uses, so whatever stopped generation also parses.
+    predicted_label = extract_liar_label(generated_answer) or "N/A_PARSE_ERROR"
+    justification = generated_answer
+    try:
+        if "Justification:" in generated_answer:
+             justification = generated_answer.split("Justification:")[1].split("Label:")[0].strip()
+
+    except Exception as e:
+        print(f"Error parsing LLM response: {e}")
+
+    return {
+        "id": id,
+        "statement": statement_text,
+        "true_label": label,
+        "predicted_label": predicted_label,
+        "justification": justification,
+        "time_to_first_token": generation.time_to_first_token,
+        "time_taken": 0
+    }
+    
+
+
+async def retrieve_chunks_from_gkg(question: str, date, query_embedding: np.ndarray, engine: EvalEngine) -> List[TextChunk]:
+    analyzer = get_query_analyzer()
 
     where_clause = ""
     
-    entities, structured_themes_for_bq = analyzer.analyze_question_with_issues(question)
+    # A memoized analysis skips the spaCy parse and the LLM calls altogether.
+    analysis = await analyzer.cached_analysis_with_issues(question)
+    if analysis is None:
+        question_doc = await engine.parse(analyzer, question)
+        async with engine.stage("analysis"):
+            analysis = await analyzer.analyze_question_with_issues(question, question_doc, lookup_cache=False)
+    entities, structured_themes_for_bq = analysis
     
-    where_clause = build_bigquery_filter_with_issues(entities, structured_themes_for_bq)
+    where_clause = issue_filter(entities, structured_themes_for_bq)
 
-    gkg_rows = fetch_gkg_from_bigquery(where_clause, limit=500, start_date=date, days_to_look_back=30)
+    gkg_rows = await engine.run_stage("bigquery", fetch_gkg_from_bigquery, where_clause, limit=500, start_date=date, days_to_look_back=30)
 
     if len(gkg_rows) <= 0:
         entities['V2Organizations'] = None
@@ -48,31 +110,29 @@ async def ask_question(question: str, statement_text: str, label: str, date, id)
         while len(looser_themes) > 1:
             looser_themes.popitem()
         
-        where_clause = build_bigquery_filter_with_issues(entities, looser_themes, loose=True)
-        gkg_rows = fetch_gkg_from_bigquery(where_clause, limit=500, start_date=date, days_to_look_back=30)
+        where_clause = issue_filter(entities, looser_themes, loose=True)
+        gkg_rows = await engine.run_stage("bigquery", fetch_gkg_from_bigquery, where_clause, limit=500, start_date=date, days_to_look_back=30)
 
     if len(gkg_rows) <= 0:
         print("--- No articles found, exiting!")
-        return False
+        return []
 
     print(f"--- Fetching titles for {len(gkg_rows)} GDELT records...")
-    url_title_gkg_list = await fetch_titles_for_gkg_rows(gkg_rows)
+    async with engine.stage("scrape"):
+        url_title_gkg_list = await fetch_titles_for_gkg_rows(gkg_rows)
 
     if not url_title_gkg_list:
         print("No titles could be fetched for pre-selection.")
-        return False
+        return []
 
     titles = [item[1] for item in url_title_gkg_list if item[1]]
-    query_embedding = embed_query(question)
-
     if not titles:
         print("No valid titles found for semantic ranking.")
-        return False
+        return []
 
-    title_embeddings = embed_texts(titles)
+    title_embeddings = await engine.embed_texts(titles)
 
-    title_index = faiss.IndexFlatL2(title_embeddings.shape[1])
-    title_index.add(title_embeddings)
+    title_index = build_index(title_embeddings)
 
     TOP_N_TITLES_TO_SCRAPE = 30
     distances, indices = title_index.search(query_embedding, min(TOP_N_TITLES_TO_SCRAPE, len(titles)))
@@ -87,13 +147,14 @@ async def ask_question(question: str, statement_text: str, label: str, date, id)
 
     if not selected_gkg_rows_for_scraping:
         print("No articles selected after title ranking for full scraping.")
-        return False
+        return []
 
-    gkg_documents = await build_gkg_documents_from_rows(selected_gkg_rows_for_scraping)
+    async with engine.stage("scrape"):
+        gkg_documents = await build_gkg_documents_from_rows(selected_gkg_rows_for_scraping)
 
     if not gkg_documents:
         print("Failed to fetch content for the selected relevant articles.")
-        return False
+        return []
 
     all_chunks_with_meta: List[TextChunk] = []
     unique_chunk_texts = set()
@@ -114,32 +175,30 @@ async def ask_question(question: str, statement_text: str, label: str, date, id)
 
     if not all_chunks_with_meta:
         print("No suitable unique text chunks found after processing documents.")
-        return False
+        return []
 
     print(f"--- Generated {len(all_chunks_with_meta)} unique chunks for final retrieval.")
 
     chunk_texts = [chunk.text for chunk in all_chunks_with_meta]
     print(f"--- Embedding {len(chunk_texts)} unique chunks...")
-    chunk_embeddings = embed_texts(chunk_texts)
-
-    dimension = chunk_embeddings.shape[1]
-    chunk_index = faiss.IndexFlatL2(dimension)
-
-    if isinstance(chunk_embeddings, list):
-        chunk_embeddings = np.array(chunk_embeddings).astype('float32')
-    elif chunk_embeddings.dtype != 'float32':
-        chunk_embeddings = chunk_embeddings.astype('float32')
+    chunk_embeddings = await engine.embed_texts(chunk_texts)
 
-    chunk_index.add(chunk_embeddings)
+    chunk_index = build_index(chunk_embeddings)
     print(f"--- Built FAISS index for unique chunks (Size: {chunk_index.ntotal}).")
 
-    query_embedding = embed_query(question)
-
-    NUM_CHUNKS_FOR_LLM = 10
-    LAMBDA_MMR = 0.7
+    if USE_CHUNK_CORPUS:
+        gkg_rows_by_url = {row.get('DocumentIdentifier'): row for row in selected_gkg_rows_for_scraping}
+        await engine.run_stage("corpus", get_chunk_corpus().add_chunks, all_chunks_with_meta, chunk_embeddings,
+                               gkg_rows_by_url)
 
     print(f"--- Retrieving top {NUM_CHUNKS_FOR_LLM} relevant chunks...")
-    retrieved_chunks = retrieve_top_chunks(chunk_index, all_chunks_with_meta, query_embedding, top_k=NUM_CHUNKS_FOR_LLM)
+    if USE_MMR:
+        retrieved_chunks = retrieve_chunks_with_mmr(query_embedding, chunk_embeddings, all_chunks_with_meta,
+                                                    top_n_final=NUM_CHUNKS_FOR_LLM, lambda_param=LAMBDA_MMR,
+                                                    index=chunk_index, candidate_pool_size=MMR_CANDIDATE_POOL,
+                                                    normalized=EMBEDDINGS_NORMALIZED)
+    else:
+        retrieved_chunks = retrieve_top_chunks(chunk_index, all_chunks_with_meta, query_embedding, top_k=NUM_CHUNKS_FOR_LLM)
 
     print(f"--- Retrieved {len(retrieved_chunks)} chunks to use in prompt.")
     print("--- Top Retrieved Chunks ---")
@@ -148,44 +207,8 @@ async def ask_question(question: str, statement_text: str, label: str, date, id)
        print(f"--- Chunk {i+1} Text:\n{chunk_data.text}")
        print("-" * 25)
 
-    if not retrieved_chunks:
-        print("No relevant text chunks found matching the query.")
-        return False
-    
-    print(f"--- Retrieved {len(retrieved_chunks)} chunks to use in prompt.")
-
-    prompt = build_prompt_with_chunks(question, retrieved_chunks)
-
-    print("--- Querying LLM with retrieved chunks...")
-
-    generated_answer = query_ollama(prompt)
-    print("\nGenerated Answer:\n", generated_answer)
-    
-    predicted_label = "N/A_PARSE_ERROR"
-    justification = generated_answer
-    try:
-        if "Label:" in generated_answer:
-            label_part = generated_answer.split("Label:")[1].strip()
-            possible_labels = ["true", "mostly-true", "half-true", "barely-true", "false", "pants-fire"]
-            for l in possible_labels:
-                if label_part.lower().startswith(l):
-                    predicted_label = l
-                    break
-        if "Justification:" in generated_answer:
-             justification = generated_answer.split("Justification:")[1].split("Label:")[0].strip()
-
-    except Exception as e:
-        print(f"Error parsing LLM response: {e}")
+    return retrieved_chunks
 
-    return {
-        "id": id,
-        "statement": statement_text,
-        "true_label": label,
-        "predicted_label": predicted_label,
-        "justification": justification,
-        "time_taken": 0
-    }
-    
 
 
 def liar_eval():
@@ -193,18 +216,13 @@ def liar_eval():
     if liar_df.empty:
         return
 
-    results_list = []
-
-    for index, row in liar_df.head(4).iterrows():
-        start_time = time.time()
-        result = process_liar(row)
-        if not result:
-            continue
-        end_time = time.time()
-        result["time_taken"] = end_time - start_time
-        results_list.append(result)
-        print(f"--- Processed statement ID {result['id']}, Predicted: {result['predicted_label']}, Time: {result['time_taken']:.2f}s")
-        
+    warm_up_query_analyzer()
+    model_registry.preload(["embedding", "sentence_tokenizer"])
+
+    results_list = run_evaluation(liar_df.head(4), process_liar)
+    if USE_CHUNK_CORPUS:
+        get_chunk_corpus().save()
+
     results_df = pd.DataFrame(results_list)
     results_df.to_csv("liar_date_evalutaion_results.csv", index=False)
     print("\n--- Evaluation results saved.")
@@ -219,6 +237,7 @@ def liar_eval():
 
             liar_labels = ["true", "mostly-true", "half-true", "barely-true", "false", "pants-fire"]
 
+            from sklearn.metrics import classification_report
             report_dict = classification_report(
                 true_labels, 
                 predicted_labels, 
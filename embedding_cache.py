@@ -0,0 +1,140 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import numpy as np
+
+from collections import OrderedDict
+from typing import Dict, List, Optional
+from config import EMBEDDING_CACHE_DIR, EMBEDDING_CACHE_LRU_SIZE, EMBEDDING_CACHE_PERSIST
+
+
+def normalize_text(text: str) -> str:
+    return " ".join(text.split())
+
+
+class EmbeddingCache:
+    def __init__(self, model_id: str,
+                 directory: str = EMBEDDING_CACHE_DIR,
+                 lru_size: int = EMBEDDING_CACHE_LRU_SIZE,
+                 persist: bool = EMBEDDING_CACHE_PERSIST):
+        self.model_id = model_id
+        self.lru_size = lru_size
+        self.persist = persist
+        self.directory = os.path.join(directory, re.sub(r"[^A-Za-z0-9_.-]+", "_", model_id))
+        self._vectors_path = os.path.join(self.directory, "vectors.f32")
+        self._keys_path = os.path.join(self.directory, "keys.txt")
+        self._meta_path = os.path.join(self.directory, "meta.json")
+
+        self._lru: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._row_index: Optional[Dict[str, int]] = None
+        self._rows = 0
+        self._matrix: Optional[np.memmap] = None
+        self.dim: Optional[int] = None
+        self._lock = threading.Lock()
+        self.stats = {"lru_hits": 0, "disk_hits": 0, "misses": 0}
+
+    def key(self, text: str) -> str:
+        return hashlib.sha1(f"{self.model_id}\0{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+    def _load_disk_index(self):
+        if self._row_index is not None:
+            return
+        self._row_index = {}
+        if not self.persist or not os.path.exists(self._meta_path):
+            return
+
+        with open(self._meta_path) as f:
+            self.dim = json.load(f)["dim"]
+        with open(self._keys_path) as f:
+            keys = [line.strip() for line in f if line.strip()]
+
+        row_bytes = self.dim * 4
+        rows_on_disk = os.path.getsize(self._vectors_path) // row_bytes
+        if rows_on_disk > len(keys):
+            # An interrupted append wrote vectors without their keys; drop the orphans.
+            with open(self._vectors_path, "r+b") as f:
+                f.truncate(len(keys) * row_bytes)
+            rows_on_disk = len(keys)
+        keys = keys[:rows_on_disk]
+
+        self._row_index = {key: row for row, key in enumerate(keys)}
+        self._rows = rows_on_disk
+
+    def _disk_matrix(self) -> Optional[np.memmap]:
+        if self._rows == 0:
+            return None
+        if self._matrix is None or self._matrix.shape[0] < self._rows:
+            self._matrix = np.memmap(self._vectors_path, dtype=np.float32, mode="r", shape=(self._rows, self.dim))
+        return self._matrix
+
+    def _remember(self, key: str, vector: np.ndarray):
+        self._lru[key] = vector
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.lru_size:
+            self._lru.popitem(last=False)
+
+    def get_many(self, keys: List[str]) -> List[Optional[np.ndarray]]:
+        with self._lock:
+            self._load_disk_index()
+            results: List[Optional[np.ndarray]] = []
+            for key in keys:
+                vector = self._lru.get(key)
+                if vector is not None:
+                    self._lru.move_to_end(key)
+                    self.stats["lru_hits"] += 1
+                    results.append(vector)
+                    continue
+
+                row = self._row_index.get(key)
+                if row is not None:
+                    vector = np.array(self._disk_matrix()[row])
+                    self._remember(key, vector)
+                    self.stats["disk_hits"] += 1
+                    results.append(vector)
+                    continue
+
+                self.stats["misses"] += 1
+                results.append(None)
+            return results
+
+    def put_many(self, keys: List[str], vectors: np.ndarray):
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        with self._lock:
+            self._load_disk_index()
+            for key, vector in zip(keys, vectors):
+                self._remember(key, vector)
+
+            if not self.persist:
+                return
+
+            new_rows = {}
+            for key, vector in zip(keys, vectors):
+                if key not in self._row_index and key not in new_rows:
+                    new_rows[key] = vector
+            if not new_rows:
+                return
+
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                os.makedirs(self.directory, exist_ok=True)
+                with open(self._meta_path, "w") as f:
+                    json.dump({"model_id": self.model_id, "dim": self.dim}, f)
+
+            # Vectors first: keys without vectors would point past the end of the matrix.
+            with open(self._vectors_path, "ab") as f:
+                f.write(np.stack(list(new_rows.values())).tobytes())
+            with open(self._keys_path, "a") as f:
+                f.write("".join(f"{key}\n" for key in new_rows))
+
+            for key in new_rows:
+                self._row_index[key] = self._rows
+                self._rows += 1
+
+    def report(self) -> str:
+        lookups = sum(self.stats.values())
+        hits = self.stats["lru_hits"] + self.stats["disk_hits"]
+        hit_rate = hits / lookups if lookups else 0.0
+        return (f"--- Embedding cache ({self.model_id}): {self._rows} vectors on disk, lru hits={self.stats['lru_hits']}, "
+                f"disk hits={self.stats['disk_hits']}, misses={self.stats['misses']}, hit rate={hit_rate:.1%}")
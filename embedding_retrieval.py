@@ -1,21 +1,272 @@
+import threading
+import time
 import faiss
 import numpy as np
 
-from sentence_transformers import SentenceTransformer
-from sentence_transformers import util
-from config import EMBEDDING_MODEL_NAME
-from typing import List
+import model_registry
+
+from config import (EMBEDDING_MODEL_NAME, RETRIEVAL_METRIC, RETRIEVAL_INDEX_TYPE, RETRIEVAL_HNSW_M,
+                    EMBEDDING_BATCH_SIZE, EMBEDDING_SORT_BY_LENGTH, EMBEDDING_NUM_THREADS,
+                    EMBEDDING_BACKEND, EMBEDDING_ONNX_PATH, EMBEDDING_ONNX_QUANTIZATION)
+from typing import List, Dict, Optional, Sequence, TYPE_CHECKING
 from data_models import TextChunk, GKGDocument
-from sklearn.metrics.pairwise import cosine_similarity
+from embedding_cache import EmbeddingCache
+
+if TYPE_CHECKING:
+    from sentence_transformers import SentenceTransformer
+
+
+class EmbeddingService:
+    """Encodes texts in fixed-size batches of similar token length, with pinned torch threads."""
+
+    def __init__(self, model: "SentenceTransformer",
+                 batch_size: int = EMBEDDING_BATCH_SIZE,
+                 sort_by_length: bool = EMBEDDING_SORT_BY_LENGTH,
+                 num_threads: Optional[int] = EMBEDDING_NUM_THREADS,
+                 output_dtype: str = "float32"):
+        self.model = model
+        self.batch_size = batch_size
+        self.sort_by_length = sort_by_length
+        self.output_dtype = output_dtype
+        self.dim = model.get_sentence_embedding_dimension()
+        self.stats = {"calls": 0, "sentences": 0, "batches": 0, "seconds": 0.0}
+        self._lock = threading.Lock()
+
+        if num_threads:
+            import torch
+            torch.set_num_threads(num_threads)
+
+    def _token_lengths(self, texts: List[str]) -> List[int]:
+        tokenizer = getattr(self.model, "tokenizer", None)
+        if tokenizer is None:
+            return [len(text) for text in texts]
+        encoded = tokenizer(texts, add_special_tokens=True, truncation=True, max_length=self.model.max_seq_length)
+        return [len(ids) for ids in encoded["input_ids"]]
+
+    def encode(self, texts: List[str], output_dtype: Optional[str] = None) -> np.ndarray:
+        output = np.empty((len(texts), self.dim), dtype=np.dtype(output_dtype or self.output_dtype))
+        if not texts:
+            return output
+
+        start = time.perf_counter()
+        # Batches of similar length need almost no padding, which is most of the wasted work on CPU.
+        order = np.argsort(self._token_lengths(texts), kind="stable") if self.sort_by_length else np.arange(len(texts))
+        batches = 0
+        for begin in range(0, len(texts), self.batch_size):
+            rows = order[begin:begin + self.batch_size]
+            output[rows] = self.model.encode([texts[i] for i in rows], batch_size=len(rows),
+                                             show_progress_bar=False, convert_to_numpy=True)
+            batches += 1
+        elapsed = time.perf_counter() - start
+
+        with self._lock:
+            self.stats["calls"] += 1
+            self.stats["sentences"] += len(texts)
+            self.stats["batches"] += batches
+            self.stats["seconds"] += elapsed
+        print(f"--- Embedded {len(texts)} texts in {elapsed:.2f}s ({len(texts) / max(elapsed, 1e-9):.0f} sentences/s).")
+        return output
+
+    def report(self) -> str:
+        with self._lock:
+            stats = dict(self.stats)
+        rate = stats["sentences"] / stats["seconds"] if stats["seconds"] else 0.0
+        return (f"--- Embedding service: {stats['sentences']} sentences in {stats['batches']} batches over "
+                f"{stats['calls']} calls, {stats['seconds']:.1f}s ({rate:.0f} sentences/s).")
+
+
+def _onnx_int8_file(quantization: str = EMBEDDING_ONNX_QUANTIZATION) -> str:
+    return f"onnx/model_qint8_{quantization}.onnx"
+
+def load_embedding_model(backend: str = EMBEDDING_BACKEND, onnx_path: str = EMBEDDING_ONNX_PATH) -> "SentenceTransformer":
+    from sentence_transformers import SentenceTransformer
+
+    if backend == "torch":
+        return SentenceTransformer(EMBEDDING_MODEL_NAME)
+    if backend == "onnx":
+        return SentenceTransformer(onnx_path, backend="onnx")
+    if backend == "onnx-int8":
+        return SentenceTransformer(onnx_path, backend="onnx", model_kwargs={"file_name": _onnx_int8_file()})
+    raise ValueError(f"Unknown embedding backend: {backend}")
+
+def embedding_model_id(backend: str = EMBEDDING_BACKEND) -> str:
+    # Quantized vectors differ slightly from the reference ones, so each backend gets its own cache.
+    return EMBEDDING_MODEL_NAME if backend == "torch" else f"{EMBEDDING_MODEL_NAME}+{backend}"
+
+def export_onnx_model(onnx_path: str = EMBEDDING_ONNX_PATH, quantization: str = EMBEDDING_ONNX_QUANTIZATION) -> str:
+    """Export the embedding model to ONNX under onnx_path, plus a dynamically int8-quantized copy."""
+    from sentence_transformers import SentenceTransformer, export_dynamic_quantized_onnx_model
+
+    model = SentenceTransformer(EMBEDDING_MODEL_NAME, backend="onnx")
+    model.save_pretrained(onnx_path)
+    export_dynamic_quantized_onnx_model(model, quantization, onnx_path)
+    print(f"--- Exported ONNX embedding model to {onnx_path} (int8 file: {_onnx_int8_file(quantization)}).")
+    return onnx_path
+
+def check_backend_parity(texts: List[str], backend: str = EMBEDDING_BACKEND, reference_backend: str = "torch",
+                         min_cosine: float = 0.99) -> Dict[str, float]:
+    """Cosine agreement and relative speed of `backend` embeddings against `reference_backend`."""
+    results = {}
+    for name in (reference_backend, backend):
+        service = EmbeddingService(load_embedding_model(name))
+        service.encode(texts[:8])
+        start = time.perf_counter()
+        results[name] = (l2_normalize(service.encode(texts)), time.perf_counter() - start)
+
+    (reference, reference_seconds), (candidate, candidate_seconds) = results[reference_backend], results[backend]
+    cosines = np.sum(reference * candidate, axis=1)
+    parity = {
+        "mean_cosine": float(cosines.mean()),
+        "min_cosine": float(cosines.min()),
+        "speedup": reference_seconds / candidate_seconds if candidate_seconds else 0.0,
+        "passed": bool(cosines.min() >= min_cosine),
+    }
+    print(f"--- {backend} vs {reference_backend}: mean cosine {parity['mean_cosine']:.4f}, "
+          f"min {parity['min_cosine']:.4f}, {parity['speedup']:.2f}x speedup, "
+          f"{'passed' if parity['passed'] else 'FAILED'}.")
+    return parity
+
+
+model_registry.register("embedding", lambda: EmbeddingService(load_embedding_model()))
+embedding_cache = EmbeddingCache(embedding_model_id())
+
+def get_embedding_service() -> EmbeddingService:
+    return model_registry.get("embedding")
+
+def get_embedding_model() -> "SentenceTransformer":
+    return get_embedding_service().model
+
+# Embeddings returned by embed_texts are unit length, so inner product equals cosine similarity.
+EMBEDDINGS_NORMALIZED = RETRIEVAL_METRIC == "cosine"
+
+def embed_texts(texts: List[str], normalize: bool = EMBEDDINGS_NORMALIZED) -> np.ndarray:
+    if not texts:
+        return np.zeros((0, get_embedding_service().dim), dtype=np.float32)
+
+    keys = [embedding_cache.key(text) for text in texts]
+    cached = embedding_cache.get_many(keys)
+
+    missing: Dict[str, str] = {}
+    for key, text, vector in zip(keys, texts, cached):
+        if vector is None and key not in missing:
+            missing[key] = text
 
-embedding_model = SentenceTransformer(EMBEDDING_MODEL_NAME)
+    if missing:
+        new_embeddings = get_embedding_service().encode(list(missing.values()), output_dtype="float32")
+        embedding_cache.put_many(list(missing.keys()), new_embeddings)
+        computed = dict(zip(missing.keys(), new_embeddings))
+        cached = [vector if vector is not None else computed[key] for key, vector in zip(keys, cached)]
 
-def embed_texts(texts: List[str]) -> np.ndarray:
-    embeddings = embedding_model.encode(texts, show_progress_bar=True)
-    return np.array(embeddings)
+    embeddings = np.stack(cached).astype(np.float32, copy=False)
+    if normalize:
+        faiss.normalize_L2(embeddings)
+    return embeddings
 
-def embed_query(query: str) -> np.ndarray:
-    return embedding_model.encode([query])
+def embed_query(query: str, normalize: bool = EMBEDDINGS_NORMALIZED) -> np.ndarray:
+    return embed_texts([query], normalize)
+
+def faiss_metric(metric: str = RETRIEVAL_METRIC) -> int:
+    return faiss.METRIC_INNER_PRODUCT if metric == "cosine" else faiss.METRIC_L2
+
+def build_index(embeddings: np.ndarray, index_type: str = RETRIEVAL_INDEX_TYPE, metric: str = RETRIEVAL_METRIC) -> faiss.Index:
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    dimension = embeddings.shape[1]
+
+    if index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dimension, RETRIEVAL_HNSW_M, faiss_metric(metric))
+    elif index_type == "flat":
+        index = faiss.IndexFlatIP(dimension) if metric == "cosine" else faiss.IndexFlatL2(dimension)
+    else:
+        raise ValueError(f"Unknown retrieval index type: {index_type}")
+
+    index.add(embeddings)
+    return index
+
+# Compressed indexes are described with faiss factory strings, e.g. "SQ8", "IVF1024,PQ48"
+# or "OPQ48_384,IVF1024,PQ48,Refine(SQ8)". Untrained types need train_index before add.
+def new_factory_index(dimension: int, factory: str, metric: str = RETRIEVAL_METRIC) -> faiss.Index:
+    return faiss.index_factory(dimension, factory, faiss_metric(metric))
+
+def train_index(index: faiss.Index, vectors: np.ndarray, max_training_vectors: Optional[int] = None, seed: int = 0):
+    if index.is_trained:
+        return
+    if max_training_vectors and vectors.shape[0] > max_training_vectors:
+        rows = np.sort(np.random.default_rng(seed).choice(vectors.shape[0], max_training_vectors, replace=False))
+        vectors = vectors[rows]
+    start = time.perf_counter()
+    index.train(np.ascontiguousarray(vectors, dtype=np.float32))
+    print(f"--- Trained FAISS index on {vectors.shape[0]} vectors in {time.perf_counter() - start:.1f}s.")
+
+def build_factory_index(embeddings: np.ndarray, factory: str, metric: str = RETRIEVAL_METRIC,
+                        max_training_vectors: Optional[int] = None) -> faiss.Index:
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    index = new_factory_index(embeddings.shape[1], factory, metric)
+    train_index(index, embeddings, max_training_vectors)
+    index.add(embeddings)
+    return index
+
+def set_search_params(index: faiss.Index, nprobe: Optional[int] = None, ef_search: Optional[int] = None):
+    params = faiss.ParameterSpace()
+    for name, value in (("nprobe", nprobe), ("efSearch", ef_search)):
+        if value is None:
+            continue
+        try:
+            params.set_index_parameter(index, name, value)
+        except RuntimeError:
+            pass
+
+def index_memory_bytes(index: faiss.Index) -> int:
+    return int(faiss.serialize_index(index).nbytes)
+
+def evaluate_index(index: faiss.Index, vectors: np.ndarray, queries: np.ndarray, k: int = 10,
+                   ids: Optional[np.ndarray] = None, metric: str = RETRIEVAL_METRIC) -> Dict[str, float]:
+    """Recall@k, memory and query latency of `index` against an exact flat index over `vectors`.
+
+    `ids` maps rows of `vectors` to the ids stored in `index` when it was filled with add_with_ids.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    queries = np.ascontiguousarray(queries, dtype=np.float32)
+    k = min(k, vectors.shape[0])
+
+    exact = build_index(vectors, "flat", metric)
+    _, truth = exact.search(queries, k)
+    if ids is not None:
+        truth = np.asarray(ids)[truth]
+
+    start = time.perf_counter()
+    _, found = index.search(queries, k)
+    elapsed = time.perf_counter() - start
+
+    hits = sum(len(set(found_row[found_row != -1].tolist()) & set(truth_row.tolist()))
+               for found_row, truth_row in zip(found, truth))
+    memory = index_memory_bytes(index)
+    flat_memory = index_memory_bytes(exact)
+    return {
+        "recall_at_k": hits / (k * len(queries)),
+        "k": k,
+        "memory_bytes": memory,
+        "flat_memory_bytes": flat_memory,
+        "compression": flat_memory / memory if memory else 0.0,
+        "query_ms": elapsed * 1000 / max(len(queries), 1),
+    }
+
+def compare_index_factories(vectors: np.ndarray, factories: Sequence[str], num_queries: int = 200, k: int = 10,
+                            max_training_vectors: Optional[int] = None, nprobe: Optional[int] = None,
+                            metric: str = RETRIEVAL_METRIC) -> Dict[str, Dict[str, float]]:
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    rows = np.random.default_rng(0).choice(vectors.shape[0], min(num_queries, vectors.shape[0]), replace=False)
+    queries = vectors[rows]
+
+    results = {}
+    for factory in factories:
+        index = build_factory_index(vectors, factory, metric, max_training_vectors)
+        set_search_params(index, nprobe=nprobe)
+        results[factory] = evaluate_index(index, vectors, queries, k, metric=metric)
+        stats = results[factory]
+        print(f"--- {factory}: recall@{stats['k']} {stats['recall_at_k']:.3f}, "
+              f"{stats['memory_bytes'] / 2**20:.1f} MiB ({stats['compression']:.1f}x smaller than flat), "
+              f"{stats['query_ms']:.2f} ms/query")
+    return results
 
 def save_faiss_index(index: faiss.IndexFlatL2, path: str):
     try:
@@ -47,61 +298,57 @@ def retrieve_documents(index, gkg_documents, query_embedding: np.ndarray, top_k:
     retrieved_docs = [gkg_documents[i] for i in indices[0] if i != -1]
     return retrieved_docs
 
+def l2_normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
 def retrieve_chunks_with_mmr(
         query_embedding: np.ndarray,
         chunk_embeddings: np.ndarray,
         all_chunks_with_meta: List[TextChunk],
         top_n_final: int = 10,
-        lambda_param: float = 0.7
+        lambda_param: float = 0.7,
+        index: Optional[faiss.Index] = None,
+        candidate_pool_size: Optional[int] = None,
+        normalized: bool = False
 ) -> List[TextChunk]:
     if chunk_embeddings.shape[0] == 0:
         return []
-    
-    if query_embedding.ndim == 1:
-        query_embedding = query_embedding.reshape(1, -1)
-    
-    query_similarities = cosine_similarity(query_embedding, chunk_embeddings)[0]
-
-    candidate_embeddings = chunk_embeddings
-    candidate_chunks_meta = all_chunks_with_meta
-    query_similarities_candidates = query_similarities
 
-    selected_indices_in_candidates = []
-    selected_chunks_final: List[TextChunk] = []
+    query_vector = np.asarray(query_embedding, dtype=np.float32).reshape(-1, chunk_embeddings.shape[1])[:1]
 
-    remaining_candidate_indices = list(range(len(candidate_chunks_meta)))
+    # Optionally restrict MMR to the nearest candidates returned by the FAISS index.
+    candidate_ids = np.arange(chunk_embeddings.shape[0])
+    candidates = chunk_embeddings
+    if index is not None and candidate_pool_size and candidate_pool_size < index.ntotal:
+        _, pool = index.search(query_vector, candidate_pool_size)
+        candidate_ids = pool[0][pool[0] != -1]
+        if candidate_ids.size == 0:
+            return []
+        candidates = chunk_embeddings[candidate_ids]
 
-    actual_top_n = min(top_n_final, len(candidate_chunks_meta))
+    # Already-normalized buffers are used as they are, without a copy.
+    if not normalized:
+        candidates = l2_normalize(candidates)
+        query_vector = l2_normalize(query_vector)
+    sim_to_query = candidates @ query_vector[0]
 
-    while len(selected_chunks_final) < actual_top_n and remaining_candidate_indices:
-        mmr_scores = []
-        current_best_score = -float('inf')
-        current_best_idx_in_remaining = -1
-
-        for i, idx_in_candidates in enumerate(remaining_candidate_indices):
-            sim_to_query = query_similarities_candidates[idx_in_candidates]
-
-            max_sim_to_selected = 0.0
-            if selected_indices_in_candidates:
-                current_candidate_embedding = candidate_embeddings[idx_in_candidates].reshape(1, -1)
-                selected_embeddings = candidate_embeddings[selected_indices_in_candidates]
-
-                sim_to_selected_list = cosine_similarity(current_candidate_embedding, selected_embeddings)[0]
-                if len(sim_to_selected_list) > 0:
-                    max_sim_to_selected = np.max(sim_to_selected_list)
-
-            score = lambda_param * sim_to_query - (1 - lambda_param) * max_sim_to_selected
+    actual_top_n = min(top_n_final, candidates.shape[0])
+    selected_mask = np.zeros(candidates.shape[0], dtype=bool)
+    max_sim_to_selected = np.zeros(candidates.shape[0], dtype=np.float32)
+    selected_chunks_final: List[TextChunk] = []
 
-            if score > current_best_score:
-                current_best_score = score
-                current_best_idx_in_remaining = i
+    for round_idx in range(actual_top_n):
+        scores = lambda_param * sim_to_query - (1 - lambda_param) * max_sim_to_selected
+        scores[selected_mask] = -np.inf
+        best = int(np.argmax(scores))
 
-        if current_best_idx_in_remaining == -1:
-            break
+        selected_mask[best] = True
+        selected_chunks_final.append(all_chunks_with_meta[candidate_ids[best]])
 
-        best_actual_candidate_idx = remaining_candidate_indices.pop(current_best_idx_in_remaining)
+        sim_to_best = candidates @ candidates[best]
+        max_sim_to_selected = sim_to_best if round_idx == 0 else np.maximum(max_sim_to_selected, sim_to_best)
 
-        selected_indices_in_candidates.append(best_actual_candidate_idx)
-        selected_chunks_final.append(candidate_chunks_meta[best_actual_candidate_idx])
-    
-    return selected_chunks_final
\ No newline at end of file
+    return selected_chunks_final
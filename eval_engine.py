@@ -0,0 +1,169 @@
+import asyncio
+import time
+import numpy as np
+import pandas as pd
+
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from http_client import get_http_client
+from llm_client import GenerationResult, get_llm_client
+from external_apis import get_gkg_backend
+from llm_interaction import query_ollama_streaming
+from config import EVAL_MAX_CONCURRENT_CLAIMS, EVAL_STAGE_LIMITS, EVAL_BATCH_SIZE, EVAL_BATCH_WAIT_SECONDS
+
+
+class MicroBatcher:
+    def __init__(self, batch_fn: Callable[[List[Any]], List[Any]], semaphore: asyncio.Semaphore,
+                 max_batch_size: int = EVAL_BATCH_SIZE, max_wait: float = EVAL_BATCH_WAIT_SECONDS):
+        self.batch_fn = batch_fn
+        self.semaphore = semaphore
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._pending: List[Tuple[Any, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks = set()
+
+    async def submit(self, item: Any) -> Any:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.ensure_future(self._run_batch(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run_batch(self, batch: List[Tuple[Any, asyncio.Future]]):
+        items = [item for item, _ in batch]
+        async with self.semaphore:
+            try:
+                results = await asyncio.to_thread(self.batch_fn, items)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                return
+
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+
+def _encode_text_groups(text_groups: List[List[str]]) -> List[np.ndarray]:
+    # Imported here so label-only pipelines never load the embedding model.
+    from embedding_retrieval import embed_texts
+
+    flat_texts = [text for group in text_groups for text in group]
+    embeddings = embed_texts(flat_texts)
+
+    results = []
+    offset = 0
+    for group in text_groups:
+        results.append(embeddings[offset:offset + len(group)])
+        offset += len(group)
+    return results
+
+
+class EvalEngine:
+    def __init__(self, stage_limits: Optional[Dict[str, int]] = None,
+                 max_concurrent_claims: int = EVAL_MAX_CONCURRENT_CLAIMS,
+                 batch_size: int = EVAL_BATCH_SIZE,
+                 batch_wait: float = EVAL_BATCH_WAIT_SECONDS):
+        self.stage_limits = {**EVAL_STAGE_LIMITS, **(stage_limits or {})}
+        self.max_concurrent_claims = max_concurrent_claims
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._batchers: Dict[Any, MicroBatcher] = {}
+
+    def stage(self, name: str) -> asyncio.Semaphore:
+        semaphore = self._semaphores.get(name)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.stage_limits.get(name, 1))
+            self._semaphores[name] = semaphore
+        return semaphore
+
+    async def run_stage(self, name: str, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        async with self.stage(name):
+            return await asyncio.to_thread(fn, *args, **kwargs)
+
+    def _batcher(self, key: Any, stage_name: str, batch_fn: Callable[[List[Any]], List[Any]]) -> MicroBatcher:
+        batcher = self._batchers.get(key)
+        if batcher is None:
+            batcher = MicroBatcher(batch_fn, self.stage(stage_name), self.batch_size, self.batch_wait)
+            self._batchers[key] = batcher
+        return batcher
+
+    async def parse(self, analyzer, text: str):
+        batcher = self._batcher(("spacy", id(analyzer)), "spacy", lambda texts: list(analyzer.nlp.pipe(texts)))
+        return await batcher.submit(text)
+
+    async def embed_texts(self, texts: List[str]) -> np.ndarray:
+        return await self._batcher("embed", "embed", _encode_text_groups).submit(list(texts))
+
+    async def embed_query(self, query: str) -> np.ndarray:
+        return await self.embed_texts([query])
+
+    async def generate_stream(self, prompt: str, **kwargs) -> GenerationResult:
+        async with self.stage("llm"):
+            result = await query_ollama_streaming(prompt, **kwargs)
+        ttft = f"{result.time_to_first_token:.2f}s" if result.time_to_first_token is not None else "n/a"
+        print(f"--- LLM first token after {ttft}, {result.tokens} tokens in {result.total_time:.2f}s"
+              f"{' (stopped early)' if result.stopped_early else ''}")
+        return result
+
+    async def evaluate(self, rows: pd.DataFrame,
+                       process_row: Callable[[pd.Series, "EvalEngine"], Awaitable[Any]]) -> List[Dict[str, Any]]:
+        claim_slots = asyncio.Semaphore(self.max_concurrent_claims)
+
+        async def run_one(row: pd.Series) -> Optional[Dict[str, Any]]:
+            async with claim_slots:
+                start_time = time.time()
+                try:
+                    result = await process_row(row, self)
+                except Exception as e:
+                    print(f"--- Failed to process statement ID {row.get('id')}: {e}")
+                    return None
+                if not result:
+                    return None
+                result["time_taken"] = time.time() - start_time
+                print(f"--- Processed statement ID {result['id']}, Predicted: {result['predicted_label']}, Time: {result['time_taken']:.2f}s")
+                return result
+
+        start_time = time.time()
+        results = await asyncio.gather(*(run_one(row) for _, row in rows.iterrows()))
+        results_list = [result for result in results if result]
+        print(f"--- Evaluated {len(results_list)}/{len(rows)} statements in {time.time() - start_time:.2f}s "
+              f"(claims={self.max_concurrent_claims}, stages={self.stage_limits})")
+        return results_list
+
+
+def run_evaluation(rows: pd.DataFrame,
+                   process_row: Callable[[pd.Series, EvalEngine], Awaitable[Any]],
+                   **engine_kwargs) -> List[Dict[str, Any]]:
+    engine = EvalEngine(**engine_kwargs)
+
+    async def evaluate_and_close() -> List[Dict[str, Any]]:
+        try:
+            return await engine.evaluate(rows, process_row)
+        finally:
+            await get_http_client().close()
+            await get_llm_client().close()
+            gkg_backend = get_gkg_backend()
+            if gkg_backend.history:
+                print(gkg_backend.report())
+            gkg_backend.close()
+
+    return asyncio.run(evaluate_and_close())
@@ -1,129 +1,314 @@
 import requests
-from google.cloud import bigquery
 import datetime
+import os
+import pickle
+import threading
+import time
+from array import array
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from typing import Optional, Tuple, List, Union
 
-def fetch_gdelt_themes(url: str = "http://data.gdeltproject.org/api/v2/guides/LOOKUP-GKGTHEMES.TXT") -> set:
-    response = requests.get(url)
-    response.raise_for_status()
+from config import (OFFLINE_MODE, GDELT_THEMES_URL, GDELT_THEMES_CACHE_PATH, GDELT_THEMES_CACHE_TTL_SECONDS,
+                    GKG_BUDGET_MODE, GKG_MAX_BYTES_BILLED, GKG_BACKEND, GKG_RESULT_CACHE_SIZE)
+from gkg_filters import Expr, FILTER_TYPES, cache_key, to_bigquery
+import model_registry
 
-    themes = set()
-    for line in response.text.strip().splitlines():
+def _load_bigquery():
+    from google.cloud import bigquery
+    return bigquery
+
+model_registry.register("bigquery", _load_bigquery)
+
+GDELT_THEMES_CACHE_VERSION = 1
+
+def _parse_gdelt_theme_table(text: str) -> Tuple[List[str], array]:
+    theme_counts = {}
+    for line in text.strip().splitlines():
         if not line.strip():
             continue
         parts = line.split("\t")
+        if len(parts) < 2:
+            continue
         theme = parts[0].strip().upper()
+        try:
+            count = int(parts[1].strip())
+        except ValueError:
+            continue
+        if theme:
+            theme_counts[theme] = count
 
-        if theme and int(parts[1].strip().upper()) > 10000:
-            themes.add(theme)
+    themes = sorted(theme_counts)
+    counts = array('q', (theme_counts[theme] for theme in themes))
+    return themes, counts
 
-    return themes
+def _load_gdelt_theme_cache(cache_path: str, url: str) -> Optional[dict]:
+    try:
+        with open(cache_path, "rb") as f:
+            cache = pickle.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"--- Ignoring unreadable GDELT theme cache {cache_path}: {e}")
+        return None
 
+    if not isinstance(cache, dict) or cache.get("version") != GDELT_THEMES_CACHE_VERSION or cache.get("url") != url:
+        print(f"--- Ignoring outdated GDELT theme cache {cache_path}.")
+        return None
+    return cache
 
-def fetch_gkg_from_bigquery(where_clause: str, limit=100, start_date: str = None, days_to_look_back: int = 7) -> list[dict]:
-    client = bigquery.Client()
+def _save_gdelt_theme_cache(cache_path: str, cache: dict):
+    directory = os.path.dirname(cache_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{cache_path}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            pickle.dump(cache, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, cache_path)
+    except Exception as e:
+        print(f"--- Failed to write GDELT theme cache {cache_path}: {e}")
 
-    # if start_date is None:
-    #     start_date = datetime.datetime.now(datetime.timezone.utc).date()
-    # else:
-    #     parsed_date = datetime.datetime.strptime(start_date, "%Y-%m-%d")
+def _themes_above_count(cache: dict, min_count: int) -> set:
+    return {theme for theme, count in zip(cache["themes"], cache["counts"]) if count > min_count}
 
-    # if parsed_date:
-    #     partition_start_date = parsed_date.strftime('%Y-%m-%d')
-    # else:
-    #     partition_start_date = start_date.strftime('%Y-%m-%d')
+def fetch_gdelt_themes(url: str = GDELT_THEMES_URL,
+                       min_count: int = 10000,
+                       cache_path: str = GDELT_THEMES_CACHE_PATH,
+                       ttl_seconds: int = GDELT_THEMES_CACHE_TTL_SECONDS,
+                       offline: Optional[bool] = None) -> set:
+    if offline is None:
+        offline = OFFLINE_MODE
 
-    if start_date is None:
-        parsed_date = datetime.datetime.now(datetime.timezone.utc).date()
-    else:
-        parsed_date = datetime.datetime.strptime(start_date, "%Y-%m-%d").date()
+    cache = _load_gdelt_theme_cache(cache_path, url)
 
-    partition_start_date = parsed_date.strftime('%Y-%m-%d')
-    partition_end_date = (parsed_date - datetime.timedelta(days=days_to_look_back)).strftime('%Y-%m-%d')
+    if offline:
+        if cache is None:
+            raise RuntimeError(f"Offline mode is enabled and no GDELT theme cache exists at {cache_path}.")
+        return _themes_above_count(cache, min_count)
 
+    if cache is not None and time.time() - cache["fetched_at"] < ttl_seconds:
+        return _themes_above_count(cache, min_count)
 
+    headers = {}
+    if cache is not None and cache.get("etag"):
+        headers["If-None-Match"] = cache["etag"]
 
-    #partition_end_date = (start_date - datetime.timedelta(days=days_to_look_back)).strftime('%Y-%m-%d')
-    
-    query = f"""
-    SELECT
-      DocumentIdentifier,
-      V2Themes,
-      V2Tone,
-      DATE,
-      V2Persons,
-      V2Locations,
-      V2Organizations,
-      SourceCommonName
-    FROM
-      `gdelt-bq.gdeltv2.gkg_partitioned`
-    WHERE
-      _PARTITIONTIME <= TIMESTAMP("{partition_start_date}")
-      AND _PARTITIONTIME >= TIMESTAMP("{partition_end_date}")
-      AND ({where_clause})
-    LIMIT {limit}
-    """
-
-    job_config = bigquery.QueryJobConfig(dry_run=True, use_query_cache=False)
     try:
-        dry_run_job = client.query(query, job_config=job_config)
-        estimated_bytes = dry_run_job.total_bytes_processed
-        print(f"--- Estimated bytes to be processed: {estimated_bytes / (1024**3):.4f} GB")
-        if estimated_bytes / (1024**3) > 100:
-            print("--- Query cost estimate exceeds budget. Aborting.")
-            return []
-    except Exception as e:
-        print(f"--- Error during query cost estimation: {e}")
+        response = requests.get(url, headers=headers, timeout=30)
+        if response.status_code == 304 and cache is not None:
+            print("--- GDELT theme table not modified, refreshing cache timestamp.")
+            cache["fetched_at"] = time.time()
+            _save_gdelt_theme_cache(cache_path, cache)
+            return _themes_above_count(cache, min_count)
+        response.raise_for_status()
+    except requests.RequestException as e:
+        if cache is not None:
+            print(f"--- Failed to revalidate GDELT theme table, using stale cache: {e}")
+            return _themes_above_count(cache, min_count)
+        raise
 
-    print(f"--- Running BigQuery Query:\n{query}")
-    try:
-        query_job = client.query(query)
-        results = query_job.result()
-        print(f"--- Query finished. Rows returned: {results.total_rows}")
-        return [dict(row) for row in results]
-    except Exception as e:
-        print(f"--- BigQuery query failed: {e}")
-        return []
-    
-def fetch_gkg_from_bigquery_filtered(where_clause: str, limit=100, days_to_look_back: int = 7) -> list[dict]:
-    client = bigquery.Client()
+    themes, counts = _parse_gdelt_theme_table(response.text)
+    cache = {
+        "version": GDELT_THEMES_CACHE_VERSION,
+        "url": url,
+        "etag": response.headers.get("ETag"),
+        "fetched_at": time.time(),
+        "themes": themes,
+        "counts": counts,
+    }
+    _save_gdelt_theme_cache(cache_path, cache)
+    print(f"--- Cached {len(themes)} GDELT themes at {cache_path}.")
+    return _themes_above_count(cache, min_count)
 
-    partition_start_date = (datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=days_to_look_back)).strftime('%Y-%m-%d')
 
-    query = f"""
+GKG_TABLE = "gdelt-bq.gdeltv2.gkg_partitioned"
+GKG_SELECT_COLUMNS = ["DocumentIdentifier", "V2Themes", "V2Tone", "DATE", "V2Persons", "V2Locations",
+                      "V2Organizations", "SourceCommonName"]
+
+
+@dataclass
+class GKGQueryStats:
+    label: str
+    latency: float
+    bytes_processed: Optional[int]
+    bytes_billed: Optional[int]
+    rows: int
+    cache_hit: Optional[bool]
+    error: Optional[str] = None
+
+
+class GKGQueryService:
+    """Runs GKG queries through one shared BigQuery client and records per-query cost and latency."""
+
+    def __init__(self, budget_mode: str = GKG_BUDGET_MODE, max_bytes_billed: int = GKG_MAX_BYTES_BILLED,
+                 history_size: int = 1000):
+        if budget_mode not in ("maximum_bytes_billed", "dry_run", "none"):
+            raise ValueError(f"Unknown GKG budget mode: {budget_mode}")
+        self.budget_mode = budget_mode
+        self.max_bytes_billed = max_bytes_billed
+        self.history: deque = deque(maxlen=history_size)
+        self._client = None
+        self._lock = threading.Lock()
+
+    def _get_client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = model_registry.get("bigquery").Client()
+        return self._client
+
+    @staticmethod
+    def build_query(where_clause: str, limit: int, min_partition: str, max_partition: Optional[str] = None) -> str:
+        partition_filter = f'_PARTITIONTIME >= TIMESTAMP("{min_partition}")'
+        if max_partition is not None:
+            partition_filter = f'_PARTITIONTIME <= TIMESTAMP("{max_partition}")\n      AND {partition_filter}'
+        columns = ",\n      ".join(GKG_SELECT_COLUMNS)
+        return f"""
     SELECT
-      DocumentIdentifier,
-      V2Themes,
-      V2Tone,
-      DATE,
-      V2Persons,
-      V2Locations,
-      V2Organizations,
-      SourceCommonName
+      {columns}
     FROM
-      `gdelt-bq.gdeltv2.gkg_partitioned`
+      `{GKG_TABLE}`
     WHERE
-      _PARTITIONTIME >= TIMESTAMP("{partition_start_date}")
+      {partition_filter}
       AND ({where_clause})
     LIMIT {limit}
     """
 
-    job_config = bigquery.QueryJobConfig(dry_run=True, use_query_cache=False)
-    try:
-        dry_run_job = client.query(query, job_config=job_config)
-        estimated_bytes = dry_run_job.total_bytes_processed
-        print(f"--- Estimated bytes to be processed: {estimated_bytes / (1024**3):.4f} GB")
-        if estimated_bytes / (1024**3) > 100:
-            print("--- Query cost estimate exceeds budget. Aborting.")
+    def _record(self, stats: GKGQueryStats):
+        with self._lock:
+            self.history.append(stats)
+        bytes_text = f"{stats.bytes_processed / 1024**3:.4f} GB" if stats.bytes_processed is not None else "unknown bytes"
+        print(f"--- GKG query{' ' + stats.label if stats.label else ''} finished in {stats.latency:.2f}s: {stats.rows} rows, {bytes_text} processed"
+              f"{' (cached)' if stats.cache_hit else ''}{f', error: {stats.error}' if stats.error else ''}")
+
+    def run(self, where_clause: Union[str, Expr], limit: int, min_partition: str, max_partition: Optional[str] = None,
+            label: str = "") -> List[dict]:
+        bigquery = model_registry.get("bigquery")
+        client = self._get_client()
+        # Filter expressions are sent as query parameters; the canonical SQL text keeps BigQuery's result cache
+        # effective for equivalent filters.
+        params = {}
+        if isinstance(where_clause, FILTER_TYPES):
+            where_clause, params = to_bigquery(where_clause)
+        query_parameters = [bigquery.ArrayQueryParameter(name, "STRING", value) if isinstance(value, list)
+                            else bigquery.ScalarQueryParameter(name, "STRING", value) for name, value in params.items()]
+        query = self.build_query(where_clause, limit, min_partition, max_partition)
+        start_time = time.perf_counter()
+
+        if self.budget_mode == "dry_run":
+            job_config = bigquery.QueryJobConfig(dry_run=True, use_query_cache=False, query_parameters=query_parameters)
+            try:
+                estimated_bytes = client.query(query, job_config=job_config).total_bytes_processed
+                print(f"--- Estimated bytes to be processed: {estimated_bytes / (1024**3):.4f} GB")
+                if estimated_bytes > self.max_bytes_billed:
+                    print("--- Query cost estimate exceeds budget. Aborting.")
+                    self._record(GKGQueryStats(label, time.perf_counter() - start_time, estimated_bytes, 0, 0, None,
+                                               "over budget"))
+                    return []
+            except Exception as e:
+                print(f"--- Error during query cost estimation: {e}")
+
+        job_config = bigquery.QueryJobConfig(query_parameters=query_parameters)
+        if self.budget_mode == "maximum_bytes_billed":
+            job_config.maximum_bytes_billed = self.max_bytes_billed
+
+        print(f"--- Running BigQuery Query:\n{query}")
+        if params:
+            print(f"--- Query parameters: {params}")
+        query_job = None
+        try:
+            query_job = client.query(query, job_config=job_config)
+            results = query_job.result()
+            rows = [dict(row) for row in results]
+        except Exception as e:
+            print(f"--- BigQuery query failed: {e}")
+            self._record(GKGQueryStats(label, time.perf_counter() - start_time,
+                                       getattr(query_job, "total_bytes_processed", None),
+                                       getattr(query_job, "total_bytes_billed", None), 0, None, str(e)))
             return []
-    except Exception as e:
-        print(f"--- Error during query cost estimation: {e}")
 
-    print(f"--- Running BigQuery Query:\n{query}")
-    try:
-        query_job = client.query(query)
-        results = query_job.result()
-        print(f"--- Query finished. Rows returned: {results.total_rows}")
-        return [dict(row) for row in results]
-    except Exception as e:
-        print(f"--- BigQuery query failed: {e}")
-        return []
\ No newline at end of file
+        self._record(GKGQueryStats(label, time.perf_counter() - start_time, query_job.total_bytes_processed,
+                                   query_job.total_bytes_billed, len(rows), query_job.cache_hit))
+        return rows
+
+    def report(self) -> str:
+        with self._lock:
+            history = list(self.history)
+        if not history:
+            return "--- GKG queries: none"
+        total_bytes = sum(stats.bytes_processed or 0 for stats in history)
+        latencies = sorted(stats.latency for stats in history)
+        errors = sum(1 for stats in history if stats.error)
+        return (f"--- GKG queries: {len(history)} ({errors} failed), {sum(stats.rows for stats in history)} rows, "
+                f"{total_bytes / 1024**3:.2f} GB processed, median {latencies[len(latencies) // 2]:.2f}s, "
+                f"max {latencies[-1]:.2f}s")
+
+    def close(self):
+        with self._lock:
+            if self._client is not None:
+                self._client.close()
+                self._client = None
+
+
+_gkg_query_service: Optional[GKGQueryService] = None
+
+def get_gkg_query_service() -> GKGQueryService:
+    global _gkg_query_service
+    if _gkg_query_service is None:
+        _gkg_query_service = GKGQueryService()
+    return _gkg_query_service
+
+def get_gkg_backend(backend: str = GKG_BACKEND):
+    if backend == "duckdb":
+        from gkg_local import get_local_gkg_backend
+        return get_local_gkg_backend()
+    if backend == "bigquery":
+        return get_gkg_query_service()
+    raise ValueError(f"Unknown GKG backend: {backend}")
+
+
+_gkg_result_cache: "OrderedDict[tuple, List[dict]]" = OrderedDict()
+_gkg_result_cache_lock = threading.Lock()
+
+def run_gkg_query(where_clause: Union[str, Expr], limit: int, min_partition: str, max_partition: Optional[str] = None,
+                  label: str = "") -> List[dict]:
+    """Run a GKG filter on the configured backend, memoizing expression results by meaning and window."""
+    if not isinstance(where_clause, FILTER_TYPES) or GKG_RESULT_CACHE_SIZE <= 0:
+        return get_gkg_backend().run(where_clause, limit, min_partition, max_partition, label=label)
+
+    key = (GKG_BACKEND, cache_key(where_clause), limit, min_partition, max_partition)
+    with _gkg_result_cache_lock:
+        rows = _gkg_result_cache.get(key)
+        if rows is not None:
+            _gkg_result_cache.move_to_end(key)
+    if rows is not None:
+        print(f"--- Reusing GKG results for an equivalent filter ({len(rows)} rows).")
+        return list(rows)
+
+    rows = get_gkg_backend().run(where_clause, limit, min_partition, max_partition, label=label)
+    # Backends return [] on failure too, so empty results are not memoized.
+    if not rows:
+        return rows
+    with _gkg_result_cache_lock:
+        _gkg_result_cache[key] = rows
+        while len(_gkg_result_cache) > GKG_RESULT_CACHE_SIZE:
+            _gkg_result_cache.popitem(last=False)
+    return list(rows)
+
+
+def fetch_gkg_from_bigquery(where_clause: Union[str, Expr], limit=100, start_date: str = None, days_to_look_back: int = 7) -> list[dict]:
+    if start_date is None:
+        parsed_date = datetime.datetime.now(datetime.timezone.utc).date()
+    else:
+        parsed_date = datetime.datetime.strptime(start_date, "%Y-%m-%d").date()
+
+    partition_start_date = parsed_date.strftime('%Y-%m-%d')
+    partition_end_date = (parsed_date - datetime.timedelta(days=days_to_look_back)).strftime('%Y-%m-%d')
+
+    return run_gkg_query(where_clause, limit, partition_end_date, partition_start_date, label="fetch_gkg_from_bigquery")
+
+def fetch_gkg_from_bigquery_filtered(where_clause: Union[str, Expr], limit=100, days_to_look_back: int = 7) -> list[dict]:
+    partition_start_date = (datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=days_to_look_back)).strftime('%Y-%m-%d')
+
+    return run_gkg_query(where_clause, limit, partition_start_date, label="fetch_gkg_from_bigquery_filtered")
@@ -0,0 +1,235 @@
+import hashlib
+
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+from constants import FIPS_MANUAL_MAP
+
+_FIPS_CODES = set(FIPS_MANUAL_MAP.values())
+
+
+@dataclass(frozen=True)
+class TrueExpr:
+    pass
+
+@dataclass(frozen=True)
+class ColumnLike:
+    """column LIKE '%text%', with `text` matched literally."""
+    column: str
+    text: str
+
+@dataclass(frozen=True)
+class LocationCountry:
+    """Some V2Locations entry has FIPS country code `fips`."""
+    fips: str
+
+@dataclass(frozen=True)
+class SourceNotIn:
+    sources: Tuple[str, ...]
+
+@dataclass(frozen=True)
+class And:
+    children: Tuple["Expr", ...]
+
+@dataclass(frozen=True)
+class Or:
+    children: Tuple["Expr", ...]
+
+Expr = Union[TrueExpr, ColumnLike, LocationCountry, SourceNotIn, And, Or]
+FILTER_TYPES = (TrueExpr, ColumnLike, LocationCountry, SourceNotIn, And, Or)
+
+
+def entity_filter(entities: Dict[str, Optional[List[Tuple[str, Any]]]]) -> Expr:
+    """One OR group per entity column, all groups AND'ed, as in the issue-based filter builders."""
+    groups = []
+    for column, values in entities.items():
+        if not values:
+            continue
+        alternatives = []
+        for _, value_for_filter in values:
+            if column == "V2Locations" and isinstance(value_for_filter, str) and value_for_filter in _FIPS_CODES:
+                alternatives.append(LocationCountry(value_for_filter))
+            elif column == "V2Persons" and isinstance(value_for_filter, list):
+                alternatives.extend(ColumnLike(column, variant) for variant in value_for_filter)
+            elif isinstance(value_for_filter, str):
+                alternatives.append(ColumnLike(column, value_for_filter))
+        if alternatives:
+            groups.append(Or(tuple(alternatives)))
+    return And(tuple(groups))
+
+
+def issue_theme_filter(structured_themes: Dict[str, List[str]], loose: bool = False) -> Expr:
+    groups = [Or(tuple(ColumnLike("V2Themes", theme) for theme in themes))
+              for themes in (structured_themes or {}).values() if themes]
+    if not groups:
+        return TrueExpr()
+    return Or(tuple(groups)) if loose else And(tuple(groups))
+
+
+def issue_filter(entities: Dict[str, Optional[List[Tuple[str, Any]]]],
+                 structured_themes: Dict[str, List[str]],
+                 loose: bool = False,
+                 excluded_sources: Optional[List[str]] = None) -> Expr:
+    parts = [entity_filter(entities), issue_theme_filter(structured_themes, loose)]
+    if excluded_sources:
+        parts.append(SourceNotIn(tuple(excluded_sources)))
+    return canonicalize(And(tuple(parts)))
+
+
+# Rough per-row evaluation cost, used to put cheap predicates first. V2Themes strings are long and the
+# country check splits every location entry.
+_COLUMN_COST = {"SourceCommonName": 1, "V2Organizations": 2, "V2Persons": 2, "V2Locations": 3, "V2Themes": 4}
+
+def cost(expr: Expr) -> int:
+    if isinstance(expr, TrueExpr):
+        return 0
+    if isinstance(expr, SourceNotIn):
+        return 1
+    if isinstance(expr, ColumnLike):
+        return _COLUMN_COST.get(expr.column, 4)
+    if isinstance(expr, LocationCountry):
+        return 8
+    return sum(cost(child) for child in expr.children)
+
+
+def canonicalize(expr: Expr) -> Expr:
+    """Flatten nested groups, drop TRUE, merge source exclusions, dedupe and order children by cost.
+
+    Equivalent filters built in a different order canonicalize to the same expression.
+    """
+    if isinstance(expr, SourceNotIn):
+        return SourceNotIn(tuple(sorted(set(expr.sources)))) if expr.sources else TrueExpr()
+    if not isinstance(expr, (And, Or)):
+        return expr
+
+    children = []
+    for child in (canonicalize(child) for child in expr.children):
+        if isinstance(child, type(expr)):
+            children.extend(child.children)
+        else:
+            children.append(child)
+
+    if isinstance(expr, And):
+        children = [child for child in children if not isinstance(child, TrueExpr)]
+        excluded = [source for child in children if isinstance(child, SourceNotIn) for source in child.sources]
+        children = [child for child in children if not isinstance(child, SourceNotIn)]
+        if excluded:
+            children.append(SourceNotIn(tuple(sorted(set(excluded)))))
+    elif any(isinstance(child, TrueExpr) for child in children):
+        return TrueExpr()
+
+    children = sorted(dict.fromkeys(children), key=lambda child: (cost(child), repr(child)))
+    if not children and isinstance(expr, And):
+        return TrueExpr()
+    if len(children) == 1:
+        return children[0]
+    return type(expr)(tuple(children))
+
+
+def cache_key(expr: Expr) -> str:
+    return hashlib.sha1(repr(canonicalize(expr)).encode("utf-8")).hexdigest()
+
+
+def _like_pattern(text: str) -> str:
+    """'%text%' with LIKE wildcards escaped, so `text` matches literally as in to_predicate and the posting lists."""
+    return "%" + text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+
+class _SQLCompiler:
+    def __init__(self, dialect: str, parameterize: bool):
+        self.dialect = dialect
+        self.parameterize = parameterize
+        self.params: Dict[str, Union[str, List[str]]] = {}
+
+    def literal(self, value: Union[str, List[str]]) -> str:
+        if not self.parameterize:
+            return "'" + value.replace("'", "''") + "'"
+        name = f"p{len(self.params)}"
+        self.params[name] = value
+        return ("@" if self.dialect == "bigquery" else "$") + name
+
+    def like(self, column: str, text: str) -> str:
+        pattern = _like_pattern(text)
+        if self.parameterize:
+            value = self.literal(pattern)
+        elif self.dialect == "bigquery":
+            value = "'" + pattern.replace("\\", "\\\\").replace("'", "\\'") + "'"
+        else:
+            value = "'" + pattern.replace("'", "''") + "'"
+        # BigQuery LIKE always escapes with a backslash and has no ESCAPE clause.
+        if self.dialect == "bigquery":
+            return f"{column} LIKE {value}"
+        return f"{column} LIKE {value} ESCAPE '\\'"
+
+    def compile(self, expr: Expr) -> str:
+        if isinstance(expr, TrueExpr):
+            return "1=1"
+        if isinstance(expr, ColumnLike):
+            return self.like(expr.column, expr.text)
+        if isinstance(expr, LocationCountry):
+            if self.dialect == "bigquery":
+                return (f"EXISTS (SELECT 1 FROM UNNEST(SPLIT(V2Locations, ';')) AS loc_item "
+                        f"WHERE TRIM(SPLIT(loc_item, '#')[SAFE_OFFSET(2)]) = {self.literal(expr.fips)})")
+            return (f"EXISTS (SELECT 1 FROM UNNEST(string_split(V2Locations, ';')) AS _u(loc_item) "
+                    f"WHERE trim(split_part(loc_item, '#', 3)) = {self.literal(expr.fips)})")
+        if isinstance(expr, SourceNotIn):
+            if not self.parameterize:
+                return f"SourceCommonName NOT IN ({', '.join(self.literal(source) for source in expr.sources)})"
+            # One array parameter, however long the exclusion list is.
+            if self.dialect == "bigquery":
+                return f"SourceCommonName NOT IN UNNEST({self.literal(list(expr.sources))})"
+            return f"SourceCommonName NOT IN (SELECT unnest({self.literal(list(expr.sources))}))"
+        if isinstance(expr, And):
+            if not expr.children:
+                return "1=1"
+            return " AND ".join(self.compile(child) if isinstance(child, Or) else f"({self.compile(child)})"
+                                for child in expr.children)
+        if isinstance(expr, Or):
+            return f"({' OR '.join(self.compile(child) for child in expr.children)})" if expr.children else "1=0"
+        raise TypeError(f"Not a GKG filter expression: {expr!r}")
+
+
+def to_bigquery(expr: Expr, parameterize: bool = True) -> Tuple[str, Dict[str, Union[str, List[str]]]]:
+    """BigQuery WHERE clause and its named STRING / ARRAY<STRING> query parameters (@p0, @p1, ...)."""
+    compiler = _SQLCompiler("bigquery", parameterize)
+    return compiler.compile(canonicalize(expr)), compiler.params
+
+
+def to_duckdb(expr: Expr, parameterize: bool = True) -> Tuple[str, Dict[str, Union[str, List[str]]]]:
+    """DuckDB WHERE clause over ';'-joined list columns, with named parameters ($p0, $p1, ...)."""
+    compiler = _SQLCompiler("duckdb", parameterize)
+    return compiler.compile(canonicalize(expr)), compiler.params
+
+
+def _as_text(value) -> str:
+    if value is None:
+        return ""
+    return value if isinstance(value, str) else ";".join(value)
+
+
+def to_predicate(expr: Expr) -> Callable[[dict], bool]:
+    """Row predicate over GKG rows with either ';'-separated strings or list columns."""
+    expr = canonicalize(expr)
+    if isinstance(expr, TrueExpr):
+        return lambda row: True
+    if isinstance(expr, ColumnLike):
+        column, text = expr.column, expr.text
+        return lambda row: text in _as_text(row.get(column))
+    if isinstance(expr, LocationCountry):
+        fips = expr.fips
+        def has_country(row: dict) -> bool:
+            for item in _as_text(row.get("V2Locations")).split(";"):
+                parts = item.split("#")
+                if len(parts) > 2 and parts[2].strip() == fips:
+                    return True
+            return False
+        return has_country
+    if isinstance(expr, SourceNotIn):
+        sources = set(expr.sources)
+        # SQL NOT IN never matches a NULL source.
+        return lambda row: row.get("SourceCommonName") is not None and row["SourceCommonName"] not in sources
+    if isinstance(expr, (And, Or)):
+        predicates = [to_predicate(child) for child in expr.children]
+        if isinstance(expr, And):
+            return lambda row: all(predicate(row) for predicate in predicates)
+        return lambda row: any(predicate(row) for predicate in predicates)
+    raise TypeError(f"Not a GKG filter expression: {expr!r}")
@@ -0,0 +1,195 @@
+import argparse
+import glob
+import json
+import os
+import time
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, Iterable, List, Optional
+from constants import GKG_HEADER
+from config import GKG_LOCAL_DIR, GKG_INGEST_CHUNK_ROWS, GKG_INGEST_WORKERS
+
+# Only the columns the pipeline selects are kept; the ';'-separated ones are stored as list columns.
+INGEST_COLUMNS = ["DocumentIdentifier", "V2Themes", "V2Tone", "DATE", "V2Persons", "V2Locations",
+                  "V2Organizations", "SourceCommonName"]
+LIST_COLUMNS = ["V2Themes", "V2Persons", "V2Locations", "V2Organizations"]
+MANIFEST_NAME = "_ingest_manifest.jsonl"
+
+
+def _schema():
+    import pyarrow as pa
+    return pa.schema([
+        ("DocumentIdentifier", pa.string()),
+        ("V2Themes", pa.list_(pa.string())),
+        ("V2Tone", pa.string()),
+        ("DATE", pa.int64()),
+        ("V2Persons", pa.list_(pa.string())),
+        ("V2Locations", pa.list_(pa.string())),
+        ("V2Organizations", pa.list_(pa.string())),
+        ("SourceCommonName", pa.string()),
+    ])
+
+
+def _split_list(value) -> List[str]:
+    if not isinstance(value, str) or not value:
+        return []
+    return [item for item in value.split(";") if item]
+
+
+_COMPRESSION_SUFFIXES = (".zip", ".gz", ".bz2", ".xz", ".zst")
+
+def _file_stem(path: str) -> str:
+    """Basename without compression and .csv suffixes, so the translation feed ("X.translation.gkg")
+    and the English feed ("X.gkg") of one timestamp keep separate parts."""
+    name = os.path.basename(path)
+    for suffix in _COMPRESSION_SUFFIXES:
+        if name.lower().endswith(suffix):
+            name = name[:-len(suffix)]
+            break
+    if name.lower().endswith(".csv"):
+        name = name[:-len(".csv")]
+    return name
+
+
+def _part_pattern(root: str, stem: str, suffix: str = ".parquet") -> str:
+    # Only this file's own parts: <stem>-<5-digit chunk>.parquet
+    return os.path.join(root, "date=*", f"{glob.escape(stem)}-{'[0-9]' * 5}{suffix}")
+
+
+def ingest_file(path: str, root: str = GKG_LOCAL_DIR, chunk_rows: int = GKG_INGEST_CHUNK_ROWS) -> Dict:
+    """Stream one raw GKG export into root/date=YYYY-MM-DD/<stem>-<chunk>.parquet.
+
+    Parts are written as *.tmp and renamed only once the whole file has been read, so an interrupted
+    file leaves nothing a query could pick up and is simply ingested again.
+    """
+    import pandas as pd
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    stem = _file_stem(path)
+    for leftover in glob.glob(_part_pattern(root, stem, ".parquet.tmp")):
+        os.remove(leftover)
+
+    schema = _schema()
+    start_time = time.time()
+    pending: List[str] = []
+    rows = 0
+    reader = pd.read_csv(path, sep="\t", header=None, names=GKG_HEADER, usecols=INGEST_COLUMNS, dtype=str,
+                         quoting=3, encoding="utf-8", encoding_errors="replace", on_bad_lines="skip",
+                         chunksize=chunk_rows)
+    for chunk_number, chunk in enumerate(reader):
+        chunk["DATE"] = pd.to_numeric(chunk["DATE"], errors="coerce").astype("Int64")
+        chunk = chunk[chunk["DATE"].notna()]
+        for column in LIST_COLUMNS:
+            chunk[column] = chunk[column].map(_split_list)
+        days = chunk["DATE"].astype("int64").astype(str).str[:8]
+
+        for day, part in chunk.groupby(days):
+            directory = os.path.join(root, f"date={day[:4]}-{day[4:6]}-{day[6:8]}")
+            os.makedirs(directory, exist_ok=True)
+            target = os.path.join(directory, f"{stem}-{chunk_number:05d}.parquet.tmp")
+            table = pa.Table.from_pandas(part[INGEST_COLUMNS], schema=schema, preserve_index=False)
+            pq.write_table(table, target, compression="zstd")
+            pending.append(target)
+        rows += len(chunk)
+
+    # Parts from an earlier ingest of this file (other chunk size, changed source, --force) are replaced,
+    # not added to, so re-ingesting never duplicates rows.
+    finished = {target[:-len(".tmp")] for target in pending}
+    previous = set(glob.glob(_part_pattern(root, stem))) - finished
+    for target in pending:
+        os.replace(target, target[:-len(".tmp")])
+    for stale in previous:
+        os.remove(stale)
+
+    return {
+        "file": os.path.basename(path),
+        "size": os.path.getsize(path),
+        "rows": rows,
+        "parts": len(pending),
+        "seconds": round(time.time() - start_time, 3),
+        "finished_at": time.time(),
+    }
+
+
+def load_manifest(root: str = GKG_LOCAL_DIR) -> Dict[str, Dict]:
+    manifest_path = os.path.join(root, MANIFEST_NAME)
+    entries = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                entries[entry["file"]] = entry
+    return entries
+
+
+def _append_manifest(root: str, entry: Dict):
+    with open(os.path.join(root, MANIFEST_NAME), "a", encoding="utf-8") as f:
+        f.write(json.dumps(entry) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def ingest_files(paths: Iterable[str], root: str = GKG_LOCAL_DIR, workers: Optional[int] = GKG_INGEST_WORKERS,
+                 chunk_rows: int = GKG_INGEST_CHUNK_ROWS, force: bool = False) -> List[Dict]:
+    os.makedirs(root, exist_ok=True)
+    manifest = {} if force else load_manifest(root)
+    pending = []
+    for path in paths:
+        entry = manifest.get(os.path.basename(path))
+        if entry is not None and entry.get("size") == os.path.getsize(path):
+            continue
+        pending.append(path)
+
+    print(f"--- Ingesting {len(pending)} GKG files into {root} ({len(manifest)} already done).")
+    completed = []
+    if not pending:
+        return completed
+
+    def finish(entry: Dict):
+        _append_manifest(root, entry)
+        completed.append(entry)
+        print(f"--- Ingested {entry['file']}: {entry['rows']} rows in {entry['parts']} parts ({entry['seconds']}s) "
+              f"[{len(completed)}/{len(pending)}]")
+
+    if workers is None or workers <= 1 or len(pending) == 1:
+        for path in pending:
+            finish(ingest_file(path, root, chunk_rows))
+        return completed
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(ingest_file, path, root, chunk_rows): path for path in pending}
+        for future in as_completed(futures):
+            try:
+                finish(future.result())
+            except Exception as e:
+                print(f"--- Failed to ingest {futures[future]}: {e}")
+    return completed
+
+
+def expand_inputs(inputs: Iterable[str]) -> List[str]:
+    paths = []
+    for item in inputs:
+        if os.path.isdir(item):
+            paths.extend(sorted(glob.glob(os.path.join(item, "*.gkg.csv*"))))
+        else:
+            paths.extend(sorted(glob.glob(item)) or [item])
+    return paths
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stream raw GKG 2.0 exports into date-partitioned Parquet.")
+    parser.add_argument("inputs", nargs="+", help="GKG export files, globs or directories")
+    parser.add_argument("--out", default=GKG_LOCAL_DIR)
+    parser.add_argument("--workers", type=int, default=GKG_INGEST_WORKERS)
+    parser.add_argument("--chunk-rows", type=int, default=GKG_INGEST_CHUNK_ROWS)
+    parser.add_argument("--force", action="store_true", help="Re-ingest files already listed in the manifest")
+    parser.add_argument("--postings", action="store_true", help="Rebuild stale partition postings afterwards")
+    args = parser.parse_args()
+    ingest_files(expand_inputs(args.inputs), args.out, args.workers, args.chunk_rows, args.force)
+    if args.postings:
+        from gkg_postings import build_postings
+        build_postings(args.out)
@@ -0,0 +1,206 @@
+import argparse
+import datetime
+import glob
+import os
+import re
+import threading
+import time
+
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Union
+from external_apis import GKG_SELECT_COLUMNS, GKGQueryStats
+from gkg_filters import Expr, FILTER_TYPES, canonicalize, to_duckdb
+from config import GKG_LOCAL_DIR, GKG_LOCAL_THREADS, GKG_LOCAL_USE_POSTINGS
+
+# Filters are written for BigQuery. DuckDB indexes lists from 1 and names an UNNEST column with a
+# column alias, so SAFE_OFFSET becomes a macro and "UNNEST(...) AS x" becomes "UNNEST(...) AS _u(x)".
+_UNNEST_ALIAS = re.compile(r"UNNEST\((SPLIT\([^()]*\))\)\s+AS\s+(\w+)", re.IGNORECASE)
+# BigQuery string literals use backslash escapes and LIKE escapes with a backslash; DuckDB literals are raw
+# and LIKE needs an explicit ESCAPE.
+_LIKE_LITERAL = re.compile(r"LIKE\s+'((?:[^'\\]|\\.|'')*)'", re.IGNORECASE)
+_STRING_ESCAPE = re.compile(r"\\(.)|''")
+
+
+def _duckdb_like(match: re.Match) -> str:
+    pattern = _STRING_ESCAPE.sub(lambda escape: escape.group(1) or "'", match.group(1))
+    return "LIKE '" + pattern.replace("'", "''") + "' ESCAPE '\\'"
+
+
+def to_duckdb_where_clause(where_clause: str) -> str:
+    where_clause = _LIKE_LITERAL.sub(_duckdb_like, where_clause)
+    return _UNNEST_ALIAS.sub(r"UNNEST(\1) AS _u(\2)", where_clause)
+
+
+def partition_dir(root: str, day: datetime.date) -> str:
+    return os.path.join(root, f"date={day.isoformat()}")
+
+
+class LocalGKGBackend:
+    """Runs GKG filters with DuckDB over Parquet files laid out as <root>/date=YYYY-MM-DD/*.parquet.
+
+    Only the partitions inside the _PARTITIONTIME window are handed to DuckDB, so a query over the
+    last few days never touches older files.
+    """
+
+    def __init__(self, root: str = GKG_LOCAL_DIR, threads: Optional[int] = GKG_LOCAL_THREADS,
+                 use_postings: bool = GKG_LOCAL_USE_POSTINGS, history_size: int = 1000):
+        self.root = root
+        self.threads = threads
+        self.use_postings = use_postings
+        self.history: deque = deque(maxlen=history_size)
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        with self._lock:
+            if self._conn is None:
+                import duckdb
+                conn = duckdb.connect()
+                if self.threads:
+                    conn.execute(f"SET threads = {int(self.threads)}")
+                conn.execute("CREATE MACRO SAFE_OFFSET(i) AS i + 1")
+                self._conn = conn
+            # Each query gets its own cursor; DuckDB connections must not be shared across threads.
+            return self._conn.cursor()
+
+    def partitions(self, min_partition: str, max_partition: Optional[str] = None) -> List[str]:
+        start = datetime.date.fromisoformat(min_partition[:10])
+        end = datetime.date.fromisoformat(max_partition[:10]) if max_partition else None
+        selected = []
+        for path in sorted(glob.glob(os.path.join(self.root, "date=*"))):
+            try:
+                day = datetime.date.fromisoformat(os.path.basename(path)[len("date="):])
+            except ValueError:
+                continue
+            if day >= start and (end is None or day <= end):
+                selected.append(path)
+        return selected
+
+    def _source_query(self, cursor, files: List[str]) -> str:
+        file_list = ", ".join("'" + path.replace("'", "''") + "'" for path in files)
+        # Partitions are already chosen by path; reading the hive key would also shadow the DATE column,
+        # since DuckDB identifiers are case-insensitive.
+        source = f"read_parquet([{file_list}], hive_partitioning = false, union_by_name = true)"
+        # List columns are joined back into GDELT's ';'-separated strings so the LIKE filters keep their meaning.
+        schema = {row[0]: row[1] for row in cursor.execute(f"DESCRIBE SELECT * FROM {source}").fetchall()}
+        columns = []
+        for column in GKG_SELECT_COLUMNS:
+            column_type = schema.get(column)
+            if column_type is None:
+                columns.append(f"NULL AS {column}")
+            elif column_type.endswith("[]"):
+                columns.append(f"array_to_string({column}, ';') AS {column}")
+            else:
+                columns.append(column)
+        return f"SELECT {', '.join(columns)} FROM {source}"
+
+    def _run_postings(self, expr: Expr, limit: int, partitions: List[str]) -> Optional[List[dict]]:
+        """Rows matching expr via posting lists, or None when some partition has no up-to-date postings."""
+        from gkg_postings import evaluate_filter, load_partition_postings, supports_filter, to_array
+
+        if not supports_filter(expr):
+            return None
+        loaded = []
+        for partition in reversed(partitions):
+            postings = load_partition_postings(partition, rebuild_stale=False)
+            if postings is None:
+                return None
+            loaded.append(postings)
+        rows: List[dict] = []
+        for postings in loaded:
+            matches = to_array(evaluate_filter(postings, expr))
+            rows.extend(postings.rows(matches[:limit - len(rows)]))
+            if len(rows) >= limit:
+                break
+        return rows
+
+    def run(self, where_clause: Union[str, Expr], limit: int, min_partition: str, max_partition: Optional[str] = None,
+            label: str = "") -> List[dict]:
+        start_time = time.perf_counter()
+        partitions = self.partitions(min_partition, max_partition)
+        if isinstance(where_clause, FILTER_TYPES):
+            where_clause = canonicalize(where_clause)
+            if self.use_postings and partitions:
+                rows = self._run_postings(where_clause, limit, partitions)
+                if rows is not None:
+                    print(f"--- Answered local GKG query from postings over {len(partitions)} partitions.")
+                    self._record(GKGQueryStats(label, time.perf_counter() - start_time, 0, 0, len(rows), None))
+                    return rows
+            where_sql, params = to_duckdb(where_clause)
+        else:
+            where_sql, params = to_duckdb_where_clause(where_clause), {}
+        files = [path for partition in partitions for path in sorted(glob.glob(os.path.join(partition, "*.parquet")))]
+        if not files:
+            print(f"--- No local GKG partitions between {min_partition} and {max_partition or 'now'} in {self.root}.")
+            self._record(GKGQueryStats(label, time.perf_counter() - start_time, 0, 0, 0, None))
+            return []
+
+        cursor = self._connect()
+        try:
+            query = (f"WITH gkg AS ({self._source_query(cursor, files)}) "
+                     f"SELECT * FROM gkg WHERE ({where_sql}) LIMIT {int(limit)}")
+            print(f"--- Running local GKG query over {len(partitions)} partitions ({len(files)} files):\n{where_sql}")
+            if params:
+                print(f"--- Query parameters: {params}")
+            result = cursor.execute(query, params)
+            names = [description[0] for description in result.description]
+            rows = [dict(zip(names, values)) for values in result.fetchall()]
+        except Exception as e:
+            print(f"--- Local GKG query failed: {e}")
+            self._record(GKGQueryStats(label, time.perf_counter() - start_time, None, 0, 0, None, str(e)))
+            return []
+        finally:
+            cursor.close()
+
+        bytes_scanned = sum(os.path.getsize(path) for path in files)
+        self._record(GKGQueryStats(label, time.perf_counter() - start_time, bytes_scanned, 0, len(rows), None))
+        return rows
+
+    def _record(self, stats: GKGQueryStats):
+        with self._lock:
+            self.history.append(stats)
+        print(f"--- Local GKG query{' ' + stats.label if stats.label else ''} finished in {stats.latency:.3f}s: "
+              f"{stats.rows} rows{f', error: {stats.error}' if stats.error else ''}")
+
+    def report(self) -> str:
+        with self._lock:
+            history = list(self.history)
+        if not history:
+            return "--- Local GKG queries: none"
+        latencies = sorted(stats.latency for stats in history)
+        return (f"--- Local GKG queries: {len(history)} ({sum(1 for stats in history if stats.error)} failed), "
+                f"{sum(stats.rows for stats in history)} rows, median {latencies[len(latencies) // 2]:.3f}s, "
+                f"max {latencies[-1]:.3f}s")
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+def convert_gkg_files(paths: Iterable[str], root: str = GKG_LOCAL_DIR) -> List[Dict]:
+    """Convert raw GKG 2.0 exports (tab separated, optionally zipped) into date-partitioned Parquet under root."""
+    from gkg_ingest import ingest_files
+    return ingest_files(paths, root)
+
+
+_local_gkg_backend: Optional[LocalGKGBackend] = None
+
+def get_local_gkg_backend() -> LocalGKGBackend:
+    global _local_gkg_backend
+    if _local_gkg_backend is None:
+        _local_gkg_backend = LocalGKGBackend()
+    return _local_gkg_backend
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a GKG WHERE clause against the local Parquet store.")
+    parser.add_argument("where", help="BigQuery-style WHERE clause, e.g. \"V2Themes LIKE '%ECON_TAXATION%'\"")
+    parser.add_argument("--days", type=int, default=7)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--root", default=GKG_LOCAL_DIR)
+    args = parser.parse_args()
+    since = (datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=args.days)).strftime("%Y-%m-%d")
+    for row in LocalGKGBackend(args.root).run(args.where, args.limit, since):
+        print(row["DATE"], row["SourceCommonName"], row["DocumentIdentifier"])
@@ -0,0 +1,322 @@
+import argparse
+import bisect
+import glob
+import json
+import os
+import threading
+import time
+import numpy as np
+
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+from gkg_filters import Expr, TrueExpr, ColumnLike, LocationCountry, SourceNotIn, And, Or
+from external_apis import GKG_SELECT_COLUMNS
+from config import GKG_LOCAL_DIR, GKG_POSTINGS_CACHE_SIZE
+
+try:
+    from pyroaring import BitMap
+except ImportError:
+    BitMap = None
+
+POSTINGS_NAME = "_postings.npz"
+POSTINGS_VERSION = 3
+FIELDS = ("themes", "fips", "location_names", "persons", "organizations", "sources")
+# LIKE filters on these columns are answered from the vocabulary of the matching field.
+COLUMN_FIELDS = {"V2Themes": "themes", "V2Persons": "persons", "V2Organizations": "organizations",
+                 "V2Locations": "location_names", "SourceCommonName": "sources"}
+
+
+# Row-id sets are roaring bitmaps when pyroaring is installed, sorted unique uint32 arrays otherwise.
+def _make_set(ids: np.ndarray):
+    return BitMap(ids) if BitMap is not None else ids
+
+def _empty():
+    return _make_set(np.zeros(0, dtype=np.uint32))
+
+def _union(sets: List):
+    if not sets:
+        return _empty()
+    if BitMap is not None:
+        return BitMap.union(*sets)
+    return np.unique(np.concatenate(sets)).astype(np.uint32, copy=False)
+
+def _intersection(a, b):
+    return a & b if BitMap is not None else np.intersect1d(a, b, assume_unique=True)
+
+def _difference(a, b):
+    return a - b if BitMap is not None else np.setdiff1d(a, b, assume_unique=True)
+
+def to_array(ids) -> np.ndarray:
+    if BitMap is not None:
+        return np.fromiter(ids, dtype=np.uint32, count=len(ids))
+    return ids
+
+
+def _items(value) -> List[str]:
+    if value is None:
+        return []
+    if isinstance(value, str):
+        return [item for item in value.split(";") if item]
+    return [item for item in value if item]
+
+def _extract_terms(row: Dict[str, Any]) -> Dict[str, set]:
+    terms = {field: set() for field in FIELDS}
+    for item in _items(row.get("V2Themes")):
+        terms["themes"].add(item.split(",")[0])
+    for item in _items(row.get("V2Locations")):
+        parts = item.split("#")
+        if len(parts) > 2 and parts[2].strip():
+            terms["fips"].add(parts[2].strip())
+        if len(parts) > 1 and parts[1]:
+            terms["location_names"].add(parts[1])
+    for field, column in (("persons", "V2Persons"), ("organizations", "V2Organizations")):
+        for item in _items(row.get(column)):
+            terms[field].add(item.rsplit(",", 1)[0])
+    if row.get("SourceCommonName") is not None:
+        terms["sources"].add(row["SourceCommonName"])
+    return terms
+
+
+def partition_files(directory: str) -> List[str]:
+    return sorted(glob.glob(os.path.join(directory, "*.parquet")))
+
+
+class PartitionPostings:
+    """Posting lists (term -> sorted row ids) for one date partition of the local GKG store.
+
+    Row ids number the rows of the partition's Parquet files read in sorted file order. Each field is
+    stored CSR-style: the sorted vocabulary joined by newlines, per-term offsets and one uint32 id array.
+    """
+
+    def __init__(self, directory: str, num_rows: int, fingerprint: List[Tuple[str, int, int]],
+                 vocabularies: Dict[str, List[str]], offsets: Dict[str, np.ndarray], ids: Dict[str, np.ndarray]):
+        self.directory = directory
+        self.num_rows = num_rows
+        self.fingerprint = fingerprint
+        self.vocabularies = vocabularies
+        self.offsets = offsets
+        self.ids = ids
+        self._joined: Dict[str, Tuple[str, np.ndarray]] = {}
+        self._files: Optional[List[Tuple[str, int, int]]] = None
+
+    @staticmethod
+    def current_fingerprint(directory: str) -> List[Tuple[str, int, int]]:
+        fingerprint = []
+        for path in partition_files(directory):
+            stat = os.stat(path)
+            fingerprint.append((os.path.basename(path), stat.st_size, stat.st_mtime_ns))
+        return fingerprint
+
+    @classmethod
+    def build(cls, directory: str) -> "PartitionPostings":
+        import pyarrow.parquet as pq
+
+        start_time = time.time()
+        columns = ["V2Themes", "V2Locations", "V2Persons", "V2Organizations", "SourceCommonName"]
+        postings: Dict[str, Dict[str, List[int]]] = {field: {} for field in FIELDS}
+        row_id = 0
+        for path in partition_files(directory):
+            for row in pq.read_table(path, columns=columns).to_pylist():
+                for field, terms in _extract_terms(row).items():
+                    for term in terms:
+                        postings[field].setdefault(term, []).append(row_id)
+                row_id += 1
+
+        vocabularies, offsets, ids = {}, {}, {}
+        for field in FIELDS:
+            vocabulary = sorted(postings[field])
+            lengths = np.fromiter((len(postings[field][term]) for term in vocabulary), dtype=np.uint64, count=len(vocabulary))
+            vocabularies[field] = vocabulary
+            offsets[field] = np.concatenate([np.zeros(1, dtype=np.uint64), np.cumsum(lengths, dtype=np.uint64)])
+            ids[field] = (np.fromiter((i for term in vocabulary for i in postings[field][term]), dtype=np.uint32,
+                                      count=int(offsets[field][-1])))
+
+        built = cls(directory, row_id, cls.current_fingerprint(directory), vocabularies, offsets, ids)
+        built.save()
+        print(f"--- Built postings for {directory}: {row_id} rows, "
+              f"{', '.join(f'{len(vocabularies[field])} {field}' for field in FIELDS)} in {time.time() - start_time:.1f}s")
+        return built
+
+    def save(self):
+        arrays = {"meta": np.frombuffer(json.dumps({
+            "version": POSTINGS_VERSION, "num_rows": self.num_rows, "fingerprint": self.fingerprint,
+        }).encode("utf-8"), dtype=np.uint8)}
+        for field in FIELDS:
+            arrays[f"{field}_vocabulary"] = np.frombuffer("\n".join(self.vocabularies[field]).encode("utf-8"), dtype=np.uint8)
+            arrays[f"{field}_offsets"] = self.offsets[field]
+            arrays[f"{field}_ids"] = self.ids[field]
+        target = os.path.join(self.directory, POSTINGS_NAME)
+        with open(f"{target}.tmp", "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(f"{target}.tmp", target)
+
+    @classmethod
+    def load(cls, directory: str, rebuild_stale: bool = True) -> Optional["PartitionPostings"]:
+        path = os.path.join(directory, POSTINGS_NAME)
+        if os.path.exists(path):
+            with np.load(path) as data:
+                meta = json.loads(data["meta"].tobytes().decode("utf-8"))
+                fresh = (meta.get("version") == POSTINGS_VERSION and
+                         [tuple(item) for item in meta["fingerprint"]] == cls.current_fingerprint(directory))
+                if fresh:
+                    vocabularies, offsets, ids = {}, {}, {}
+                    for field in FIELDS:
+                        text = data[f"{field}_vocabulary"].tobytes().decode("utf-8")
+                        vocabularies[field] = text.split("\n") if text else []
+                        offsets[field] = data[f"{field}_offsets"]
+                        ids[field] = data[f"{field}_ids"]
+                    return cls(directory, meta["num_rows"], [tuple(item) for item in meta["fingerprint"]],
+                               vocabularies, offsets, ids)
+        if not rebuild_stale:
+            return None
+        return cls.build(directory)
+
+    def _postings(self, field: str, term_index: int) -> np.ndarray:
+        offsets = self.offsets[field]
+        return self.ids[field][int(offsets[term_index]):int(offsets[term_index + 1])]
+
+    def universe(self):
+        return _make_set(np.arange(self.num_rows, dtype=np.uint32))
+
+    def with_source(self):
+        """Rows that have a SourceCommonName; SQL NOT IN never matches a NULL source."""
+        return _make_set(np.unique(self.ids["sources"]))
+
+    def exact(self, field: str, term: str):
+        vocabulary = self.vocabularies[field]
+        index = bisect.bisect_left(vocabulary, term)
+        if index < len(vocabulary) and vocabulary[index] == term:
+            return _make_set(self._postings(field, index))
+        return _empty()
+
+    def matching_terms(self, field: str, text: str) -> List[int]:
+        """Indexes of vocabulary terms containing text, i.e. the terms a LIKE '%text%' would hit."""
+        if field not in self._joined:
+            vocabulary = self.vocabularies[field]
+            starts = np.zeros(len(vocabulary), dtype=np.int64)
+            if vocabulary:
+                starts[1:] = np.cumsum([len(term) + 1 for term in vocabulary[:-1]])
+            self._joined[field] = ("\n".join(vocabulary), starts)
+        joined, starts = self._joined[field]
+
+        matches = []
+        position = joined.find(text)
+        while position != -1:
+            term_index = int(np.searchsorted(starts, position, side="right")) - 1
+            matches.append(term_index)
+            if term_index + 1 >= len(starts):
+                break
+            position = joined.find(text, int(starts[term_index + 1]))
+        return matches
+
+    def substring(self, field: str, text: str):
+        if not text:
+            return self.universe()
+        return _union([_make_set(self._postings(field, index)) for index in self.matching_terms(field, text)])
+
+    def _file_row_starts(self) -> List[Tuple[str, int, int]]:
+        """(path, first row id, row count) per Parquet file, from the file footers."""
+        if self._files is None:
+            import pyarrow.parquet as pq
+
+            files, start = [], 0
+            for path in partition_files(self.directory):
+                num_rows = pq.ParquetFile(path).metadata.num_rows
+                files.append((path, start, num_rows))
+                start += num_rows
+            self._files = files
+        return self._files
+
+    def rows(self, row_ids: np.ndarray) -> List[dict]:
+        """The selected GKG columns of the given rows, reading only the row groups that hold them."""
+        import pyarrow.parquet as pq
+
+        row_ids = np.asarray(row_ids, dtype=np.int64)
+        records = []
+        for path, start, num_rows in self._file_row_starts():
+            wanted = row_ids[(row_ids >= start) & (row_ids < start + num_rows)] - start
+            if len(wanted) == 0:
+                continue
+            parquet_file = pq.ParquetFile(path)
+            group_starts = np.cumsum([0] + [parquet_file.metadata.row_group(i).num_rows
+                                            for i in range(parquet_file.num_row_groups)])
+            row_group_of = np.searchsorted(group_starts, wanted, side="right") - 1
+            columns = [column for column in GKG_SELECT_COLUMNS if column in parquet_file.schema_arrow.names]
+            for group in np.unique(row_group_of):
+                offsets = wanted[row_group_of == group] - group_starts[group]
+                table = parquet_file.read_row_group(int(group), columns=columns)
+                for row in table.take(offsets).to_pylist():
+                    records.append({column: ";".join(row[column]) if isinstance(row.get(column), list)
+                                    else row.get(column) for column in GKG_SELECT_COLUMNS})
+        return records
+
+
+def evaluate_filter(postings: PartitionPostings, expr: Expr):
+    """Row-id set of the partition rows matching a GKG filter expression."""
+    if isinstance(expr, TrueExpr):
+        return postings.universe()
+    if isinstance(expr, LocationCountry):
+        return postings.exact("fips", expr.fips)
+    if isinstance(expr, SourceNotIn):
+        return _difference(postings.with_source(), _union([postings.exact("sources", source) for source in expr.sources]))
+    if isinstance(expr, ColumnLike):
+        if not supports_filter(expr):
+            raise ValueError(f"Postings cannot answer {expr.column} LIKE '%{expr.text}%'")
+        return postings.substring(COLUMN_FIELDS[expr.column], expr.text)
+    if isinstance(expr, Or):
+        return _union([evaluate_filter(postings, child) for child in expr.children])
+    if isinstance(expr, And):
+        result = None
+        for child in expr.children:
+            child_ids = evaluate_filter(postings, child)
+            result = child_ids if result is None else _intersection(result, child_ids)
+            if len(result) == 0:
+                break
+        return postings.universe() if result is None else result
+    raise TypeError(f"Not a GKG filter expression: {expr!r}")
+
+
+def supports_filter(expr: Expr) -> bool:
+    # A LIKE pattern spanning GDELT's delimiters cannot be answered from single vocabulary terms.
+    if isinstance(expr, ColumnLike):
+        return expr.column in COLUMN_FIELDS and not any(delimiter in expr.text for delimiter in ";#,")
+    if isinstance(expr, (And, Or)):
+        return all(supports_filter(child) for child in expr.children)
+    return True
+
+
+_postings_cache: "OrderedDict[str, PartitionPostings]" = OrderedDict()
+_postings_cache_lock = threading.Lock()
+
+def load_partition_postings(directory: str, rebuild_stale: bool = True) -> Optional[PartitionPostings]:
+    fingerprint = PartitionPostings.current_fingerprint(directory)
+    with _postings_cache_lock:
+        cached = _postings_cache.get(directory)
+        if cached is not None and cached.fingerprint == fingerprint:
+            _postings_cache.move_to_end(directory)
+            return cached
+    postings = PartitionPostings.load(directory, rebuild_stale)
+    if postings is not None:
+        with _postings_cache_lock:
+            _postings_cache[directory] = postings
+            while len(_postings_cache) > GKG_POSTINGS_CACHE_SIZE:
+                _postings_cache.popitem(last=False)
+    return postings
+
+
+def build_postings(root: str = GKG_LOCAL_DIR, force: bool = False) -> int:
+    built = 0
+    for directory in sorted(glob.glob(os.path.join(root, "date=*"))):
+        if force or PartitionPostings.load(directory, rebuild_stale=False) is None:
+            PartitionPostings.build(directory)
+            built += 1
+    print(f"--- Postings up to date for {root} ({built} partitions rebuilt).")
+    return built
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build posting lists for the local GKG Parquet store.")
+    parser.add_argument("--root", default=GKG_LOCAL_DIR)
+    parser.add_argument("--force", action="store_true", help="Rebuild partitions whose postings are up to date")
+    args = parser.parse_args()
+    build_postings(args.root, args.force)
@@ -0,0 +1,150 @@
+import asyncio
+import random
+import time
+import aiohttp
+
+from collections import defaultdict
+from typing import Any, Awaitable, Callable, Dict, Optional
+from urllib.parse import urlsplit
+from constants import HEADERS
+from config import (HTTP_MAX_CONNECTIONS, HTTP_MAX_PER_HOST, HTTP_DNS_CACHE_TTL_SECONDS, HTTP_KEEPALIVE_TIMEOUT_SECONDS,
+                    HTTP_MAX_RETRIES, HTTP_BACKOFF_BASE_SECONDS, HTTP_BACKOFF_MAX_SECONDS)
+
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+
+def _new_host_metrics() -> Dict[str, float]:
+    return {"requests": 0, "retries": 0, "errors": 0, "bytes": 0, "queue_wait": 0.0, "in_flight": 0}
+
+
+def _retry_after_seconds(response: aiohttp.ClientResponse) -> Optional[float]:
+    value = response.headers.get("Retry-After")
+    if value and value.strip().isdigit():
+        return float(value.strip())
+    return None
+
+
+class HttpClient:
+    def __init__(self,
+                 max_connections: int = HTTP_MAX_CONNECTIONS,
+                 max_per_host: int = HTTP_MAX_PER_HOST,
+                 dns_cache_ttl: int = HTTP_DNS_CACHE_TTL_SECONDS,
+                 keepalive_timeout: float = HTTP_KEEPALIVE_TIMEOUT_SECONDS,
+                 max_retries: int = HTTP_MAX_RETRIES,
+                 backoff_base: float = HTTP_BACKOFF_BASE_SECONDS,
+                 backoff_max: float = HTTP_BACKOFF_MAX_SECONDS):
+        self.max_connections = max_connections
+        self.max_per_host = max_per_host
+        self.dns_cache_ttl = dns_cache_ttl
+        self.keepalive_timeout = keepalive_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._global_slots: Optional[asyncio.Semaphore] = None
+        self._host_slots: Dict[str, asyncio.Semaphore] = {}
+
+        self.in_flight = 0
+        self.host_metrics: Dict[str, Dict[str, float]] = defaultdict(_new_host_metrics)
+
+    def _ensure_session(self) -> aiohttp.ClientSession:
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._loop is not loop:
+            # Sessions are bound to the loop that created them.
+            connector = aiohttp.TCPConnector(
+                limit=self.max_connections,
+                limit_per_host=self.max_per_host,
+                use_dns_cache=True,
+                ttl_dns_cache=self.dns_cache_ttl,
+                keepalive_timeout=self.keepalive_timeout,
+            )
+            self._session = aiohttp.ClientSession(connector=connector, headers=HEADERS)
+            self._loop = loop
+            self._global_slots = asyncio.Semaphore(self.max_connections)
+            self._host_slots = {}
+        return self._session
+
+    def _backoff(self, attempt: int, retry_after: Optional[float]) -> float:
+        if retry_after is not None:
+            return min(retry_after, self.backoff_max)
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    async def request(self, url: str,
+                      handler: Callable[[aiohttp.ClientResponse], Awaitable[Any]],
+                      timeout: float = 10,
+                      max_retries: Optional[int] = None) -> Any:
+        session = self._ensure_session()
+        host = urlsplit(url).hostname or ""
+        host_slots = self._host_slots.get(host)
+        if host_slots is None:
+            host_slots = asyncio.Semaphore(self.max_per_host)
+            self._host_slots[host] = host_slots
+        metrics = self.host_metrics[host]
+        max_retries = self.max_retries if max_retries is None else max_retries
+
+        attempt = 0
+        while True:
+            retry_after = None
+            queued_at = time.monotonic()
+            # Wait for the host first so requests queued on a busy host do not hold global slots.
+            async with host_slots, self._global_slots:
+                metrics["queue_wait"] += time.monotonic() - queued_at
+                metrics["requests"] += 1
+                metrics["in_flight"] += 1
+                self.in_flight += 1
+                try:
+                    async with session.get(url, timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+                        try:
+                            if response.status in RETRYABLE_STATUSES and attempt < max_retries:
+                                retry_after = _retry_after_seconds(response)
+                            else:
+                                response.raise_for_status()
+                                return await handler(response)
+                        finally:
+                            metrics["bytes"] += response.content.total_bytes
+                except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                    metrics["errors"] += 1
+                    if attempt >= max_retries:
+                        raise
+                except aiohttp.ClientResponseError:
+                    metrics["errors"] += 1
+                    raise
+                finally:
+                    metrics["in_flight"] -= 1
+                    self.in_flight -= 1
+
+            metrics["retries"] += 1
+            await asyncio.sleep(self._backoff(attempt, retry_after))
+            attempt += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"in_flight": self.in_flight, "hosts": {host: dict(m) for host, m in self.host_metrics.items()}}
+
+    def report(self, top_hosts: int = 3) -> str:
+        totals = _new_host_metrics()
+        for metrics in self.host_metrics.values():
+            for key, value in metrics.items():
+                totals[key] += value
+        avg_wait = totals["queue_wait"] / totals["requests"] if totals["requests"] else 0.0
+        busiest = sorted(self.host_metrics.items(), key=lambda item: item[1]["bytes"], reverse=True)[:top_hosts]
+        busiest_str = ", ".join(f"{host} {m['bytes'] / 1024**2:.1f} MB/{m['requests']} req" for host, m in busiest)
+        return (f"--- HTTP client: {len(self.host_metrics)} hosts, in-flight={self.in_flight}, "
+                f"requests={totals['requests']}, retries={totals['retries']}, errors={totals['errors']}, "
+                f"avg queue wait={avg_wait:.3f}s, {totals['bytes'] / 1024**2:.1f} MB. Busiest: {busiest_str}")
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+        self._loop = None
+
+
+_http_client: Optional[HttpClient] = None
+
+def get_http_client() -> HttpClient:
+    global _http_client
+    if _http_client is None:
+        _http_client = HttpClient()
+    return _http_client
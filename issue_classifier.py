@@ -0,0 +1,111 @@
+import threading
+import numpy as np
+
+from typing import Dict, List, Optional, Sequence
+from constants import CURATED_THEME_LIST, ISSUE_DESCRIPTIONS
+from config import (ISSUE_CLASSIFIER_MIN_SCORE, ISSUE_CLASSIFIER_MARGIN, ISSUE_CLASSIFIER_MAX_ISSUES,
+                    THEME_CLASSIFIER_MIN_SCORE, THEME_CLASSIFIER_MAX_THEMES)
+
+_THEME_PREFIXES = {
+    "ECON": "economy",
+    "ENV": "environment",
+    "SOC": "society",
+    "GOV": "government",
+    "MIL": "military",
+    "ACT": "",
+    "TAX": "",
+    "SLFID": "",
+}
+
+
+def theme_description(theme: str) -> str:
+    parts = theme.strip().lower().split("_")
+    if parts and parts[0].upper() in _THEME_PREFIXES:
+        prefix = _THEME_PREFIXES[parts[0].upper()]
+        parts = ([prefix] if prefix else []) + parts[1:]
+    return " ".join(part for part in parts if part)
+
+
+def _embed(texts: List[str]) -> np.ndarray:
+    # Imported here so building the analyzer does not load the embedding model until it is needed.
+    from embedding_retrieval import embed_texts
+    return embed_texts(texts, normalize=True)
+
+
+class SemanticIssueClassifier:
+    """Maps a claim to issue keys and curated GDELT themes by cosine similarity to their descriptions.
+
+    classify_* returns None when the claim is ambiguous (weak best match, or more candidates within
+    `margin` of the best than may be returned), and the caller falls back to the LLM.
+    """
+
+    def __init__(self,
+                 issue_descriptions: Dict[str, str] = ISSUE_DESCRIPTIONS,
+                 themes: Sequence[str] = CURATED_THEME_LIST,
+                 issue_min_score: float = ISSUE_CLASSIFIER_MIN_SCORE,
+                 theme_min_score: float = THEME_CLASSIFIER_MIN_SCORE,
+                 margin: float = ISSUE_CLASSIFIER_MARGIN,
+                 max_issues: int = ISSUE_CLASSIFIER_MAX_ISSUES,
+                 max_themes: int = THEME_CLASSIFIER_MAX_THEMES):
+        self.issue_keys = list(issue_descriptions)
+        self.issue_descriptions = issue_descriptions
+        self.themes = list(dict.fromkeys(theme.strip() for theme in themes))
+        self.issue_min_score = issue_min_score
+        self.theme_min_score = theme_min_score
+        self.margin = margin
+        self.max_issues = max_issues
+        self.max_themes = max_themes
+
+        self._issue_vectors: Optional[np.ndarray] = None
+        self._theme_vectors: Optional[np.ndarray] = None
+        self._lock = threading.Lock()
+        self.stats = {"issues_local": 0, "issues_fallback": 0, "themes_local": 0, "themes_fallback": 0}
+
+    def _ensure_vectors(self):
+        if self._issue_vectors is not None:
+            return
+        with self._lock:
+            if self._issue_vectors is None:
+                self._theme_vectors = _embed([theme_description(theme) for theme in self.themes])
+                self._issue_vectors = _embed([self.issue_descriptions[key] for key in self.issue_keys])
+
+    def _select(self, scores: np.ndarray, labels: List[str], min_score: float, max_items: int) -> Optional[List[str]]:
+        order = np.argsort(-scores)
+        best = float(scores[order[0]])
+        if best < min_score:
+            return None
+        close = [labels[i] for i in order if scores[i] >= max(min_score, best - self.margin)]
+        if len(close) > max_items:
+            return None
+        return close
+
+    def classify_issues(self, text: str) -> Optional[List[str]]:
+        self._ensure_vectors()
+        scores = self._issue_vectors @ _embed([text])[0]
+        issues = self._select(scores, self.issue_keys, self.issue_min_score, self.max_issues)
+        self.stats["issues_local" if issues is not None else "issues_fallback"] += 1
+        return issues
+
+    def classify_themes(self, text: str) -> Optional[List[str]]:
+        self._ensure_vectors()
+        scores = self._theme_vectors @ _embed([text])[0]
+        themes = self._select(scores, self.themes, self.theme_min_score, self.max_themes)
+        self.stats["themes_local" if themes is not None else "themes_fallback"] += 1
+        return themes
+
+    def report(self) -> str:
+        stats = dict(self.stats)
+        return (f"--- Issue classifier: issues {stats['issues_local']} local / {stats['issues_fallback']} LLM, "
+                f"themes {stats['themes_local']} local / {stats['themes_fallback']} LLM.")
+
+
+_issue_classifier: Optional[SemanticIssueClassifier] = None
+_issue_classifier_lock = threading.Lock()
+
+def get_issue_classifier() -> SemanticIssueClassifier:
+    global _issue_classifier
+    if _issue_classifier is None:
+        with _issue_classifier_lock:
+            if _issue_classifier is None:
+                _issue_classifier = SemanticIssueClassifier()
+    return _issue_classifier
@@ -0,0 +1,164 @@
+import asyncio
+import json
+import random
+import time
+import aiohttp
+
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+from config import (OLLAMA_HOST, OLLAMA_MODEL_NAME, OLLAMA_MAX_IN_FLIGHT, OLLAMA_TIMEOUT_SECONDS, OLLAMA_MAX_RETRIES,
+                    HTTP_BACKOFF_BASE_SECONDS, HTTP_BACKOFF_MAX_SECONDS)
+
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+def normalize_ollama_host(host: str) -> str:
+    """OLLAMA_HOST is shared with the server, which accepts "0.0.0.0:11434" style bind addresses."""
+    host = host.strip().rstrip("/")
+    bare = "://" not in host
+    scheme, _, address = host.partition("://") if not bare else ("http", "", host)
+    if address == "0.0.0.0" or address.startswith("0.0.0.0:"):
+        address = "localhost" + address[len("0.0.0.0"):]
+    # Like the ollama CLI, a bare host without a port means the default port.
+    if bare and ":" not in address.rsplit("]", 1)[-1]:
+        address = f"{address}:11434"
+    return f"{scheme}://{address}"
+
+@dataclass
+class GenerationResult:
+    text: str
+    time_to_first_token: Optional[float]
+    total_time: float
+    tokens: int
+    stopped_early: bool
+
+
+class OllamaClient:
+    def __init__(self,
+                 host: str = OLLAMA_HOST,
+                 model: str = OLLAMA_MODEL_NAME,
+                 max_in_flight: int = OLLAMA_MAX_IN_FLIGHT,
+                 timeout: float = OLLAMA_TIMEOUT_SECONDS,
+                 max_retries: int = OLLAMA_MAX_RETRIES):
+        self.host = normalize_ollama_host(host)
+        self.model = model
+        self.max_in_flight = max_in_flight
+        self.timeout = timeout
+        self.max_retries = max_retries
+
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    def _ensure_session(self) -> aiohttp.ClientSession:
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._loop is not loop:
+            connector = aiohttp.TCPConnector(limit=self.max_in_flight, keepalive_timeout=60)
+            self._session = aiohttp.ClientSession(
+                connector=connector, timeout=aiohttp.ClientTimeout(total=self.timeout)
+            )
+            self._loop = loop
+            self._slots = asyncio.Semaphore(self.max_in_flight)
+        return self._session
+
+    async def _post(self, path: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        session = self._ensure_session()
+        url = f"{self.host}{path}"
+
+        for attempt in range(self.max_retries + 1):
+            last_attempt = attempt >= self.max_retries
+            async with self._slots:
+                try:
+                    async with session.post(url, json=payload) as response:
+                        if response.status in RETRYABLE_STATUSES and not last_attempt:
+                            print(f"--- Ollama returned {response.status}, retrying...")
+                        else:
+                            response.raise_for_status()
+                            return await response.json()
+                except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                    if last_attempt:
+                        raise
+                    print(f"--- Ollama request failed ({e!r}), retrying...")
+
+            await asyncio.sleep(random.uniform(0, min(HTTP_BACKOFF_MAX_SECONDS, HTTP_BACKOFF_BASE_SECONDS * (2 ** attempt))))
+
+    async def generate(self, prompt: str, model: Optional[str] = None, options: Optional[Dict[str, Any]] = None) -> str:
+        payload = {"model": model or self.model, "prompt": prompt, "stream": False}
+        if options:
+            payload["options"] = options
+        data = await self._post("/api/generate", payload)
+        return data['response']
+
+    async def generate_stream(self, prompt: str, model: Optional[str] = None,
+                              options: Optional[Dict[str, Any]] = None,
+                              stop_when: Optional[Callable[[str], bool]] = None,
+                              max_tokens: Optional[int] = None) -> GenerationResult:
+        session = self._ensure_session()
+        url = f"{self.host}/api/generate"
+        options = dict(options or {})
+        if max_tokens is not None:
+            options["num_predict"] = max_tokens
+        payload = {"model": model or self.model, "prompt": prompt, "stream": True}
+        if options:
+            payload["options"] = options
+
+        for attempt in range(self.max_retries + 1):
+            last_attempt = attempt >= self.max_retries
+            async with self._slots:
+                start_time = time.monotonic()
+                time_to_first_token = None
+                try:
+                    async with session.post(url, json=payload) as response:
+                        if response.status in RETRYABLE_STATUSES and not last_attempt:
+                            print(f"--- Ollama returned {response.status}, retrying...")
+                        else:
+                            response.raise_for_status()
+                            text = ""
+                            tokens = 0
+                            stopped_early = False
+                            async for raw_line in response.content:
+                                if not raw_line.strip():
+                                    continue
+                                chunk = json.loads(raw_line)
+                                piece = chunk.get("response", "")
+                                if piece:
+                                    if time_to_first_token is None:
+                                        time_to_first_token = time.monotonic() - start_time
+                                    text += piece
+                                    tokens += 1
+                                if chunk.get("done"):
+                                    break
+                                # Leaving the response unread closes the connection, which aborts generation.
+                                if (stop_when is not None and piece and stop_when(text)) or (max_tokens is not None and tokens >= max_tokens):
+                                    stopped_early = True
+                                    break
+                            return GenerationResult(text, time_to_first_token, time.monotonic() - start_time, tokens, stopped_early)
+                except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                    # Tokens already streamed cannot be replayed, so only retry before the first one.
+                    if last_attempt or time_to_first_token is not None:
+                        raise
+                    print(f"--- Ollama request failed ({e!r}), retrying...")
+
+            await asyncio.sleep(random.uniform(0, min(HTTP_BACKOFF_MAX_SECONDS, HTTP_BACKOFF_BASE_SECONDS * (2 ** attempt))))
+
+    async def chat(self, messages: List[Dict[str, str]], model: Optional[str] = None,
+                   options: Optional[Dict[str, Any]] = None) -> str:
+        payload = {"model": model or self.model, "messages": messages, "stream": False}
+        if options:
+            payload["options"] = options
+        data = await self._post("/api/chat", payload)
+        return data['message']['content']
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+        self._loop = None
+
+
+_llm_client: Optional[OllamaClient] = None
+
+def get_llm_client() -> OllamaClient:
+    global _llm_client
+    if _llm_client is None:
+        _llm_client = OllamaClient()
+    return _llm_client
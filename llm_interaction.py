@@ -1,8 +1,7 @@
-import requests
-
-from typing import List
+from typing import List, Optional
 from data_models import GKGDocument, TextChunk
-from config import OLLAMA_MODEL_NAME
+from llm_client import GenerationResult, get_llm_client
+from constants import LIAR_LABELS
 
 
 def build_prompt(query: str, documents: list[GKGDocument]) -> str:
@@ -53,14 +52,30 @@ def build_prompt_with_chunks(question: str, retrieved_chunks: List[TextChunk]) -
     )
     return prompt
 
-def query_ollama(prompt: str) -> str:
-    response = requests.post(
-        "http://localhost:11434/api/generate",
-        json={
-            "model": OLLAMA_MODEL_NAME,
-            "prompt": prompt,
-            "stream": False
-        }
-    )
-    response.raise_for_status()
-    return response.json()['response']
\ No newline at end of file
+async def query_ollama(prompt: str) -> str:
+    return await get_llm_client().generate(prompt)
+
+# Longest first so "true" never shadows "mostly-true" and friends.
+_LABELS_BY_LENGTH = sorted(LIAR_LABELS, key=len, reverse=True)
+
+def extract_liar_label(text: str, require_marker: bool = True, marker: str = "Label:") -> Optional[str]:
+    marker_idx = text.lower().rfind(marker.lower())
+    if marker_idx != -1:
+        candidate = text[marker_idx + len(marker):]
+    elif require_marker:
+        return None
+    else:
+        candidate = text
+
+    candidate = candidate.lstrip(" \t\n\"'*`[").lower()
+    for label in _LABELS_BY_LENGTH:
+        if candidate.startswith(label):
+            return label
+    return None
+
+async def query_ollama_streaming(prompt: str, stop_on_label: bool = False, require_label_marker: bool = True,
+                                 max_tokens: Optional[int] = None) -> GenerationResult:
+    stop_when = None
+    if stop_on_label:
+        stop_when = lambda text: extract_liar_label(text, require_label_marker) is not None
+    return await get_llm_client().generate_stream(prompt, stop_when=stop_when, max_tokens=max_tokens)
@@ -0,0 +1,58 @@
+import threading
+import time
+
+from typing import Any, Callable, Dict, Iterable, Optional
+
+# Heavy models (spaCy, SentenceTransformer, tokenizer data, cloud SDKs) are registered by the modules
+# that use them and only built the first time get() asks for them, so importing a module stays cheap.
+_factories: Dict[str, Callable[[], Any]] = {}
+_models: Dict[str, Any] = {}
+_locks: Dict[str, threading.Lock] = {}
+_registry_lock = threading.Lock()
+
+
+def register(name: str, factory: Callable[[], Any], replace: bool = False):
+    with _registry_lock:
+        if name in _factories and not replace:
+            return
+        _factories[name] = factory
+        _locks.setdefault(name, threading.Lock())
+        _models.pop(name, None)
+
+
+def get(name: str) -> Any:
+    model = _models.get(name)
+    if model is not None:
+        return model
+
+    with _registry_lock:
+        if name not in _factories:
+            raise KeyError(f"No model registered under '{name}'")
+        lock = _locks[name]
+
+    with lock:
+        model = _models.get(name)
+        if model is None:
+            start_time = time.time()
+            model = _factories[name]()
+            _models[name] = model
+            print(f"--- Loaded model '{name}' in {time.time() - start_time:.2f}s")
+    return model
+
+
+def is_loaded(name: str) -> bool:
+    return name in _models
+
+
+def preload(names: Optional[Iterable[str]] = None):
+    for name in (list(_factories) if names is None else names):
+        get(name)
+
+
+def unload(name: str):
+    with _registry_lock:
+        _models.pop(name, None)
+
+
+def registered() -> Dict[str, bool]:
+    return {name: name in _models for name in _factories}
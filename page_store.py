@@ -0,0 +1,126 @@
+import hashlib
+import os
+
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+from config import PAGE_STORE_MAX_MEMORY_BYTES, PAGE_STORE_SPILL_DIR, PAGE_STORE_MAX_SPILL_BYTES
+
+
+class PageStore:
+    def __init__(self,
+                 max_memory_bytes: int = PAGE_STORE_MAX_MEMORY_BYTES,
+                 spill_dir: Optional[str] = PAGE_STORE_SPILL_DIR,
+                 max_spill_bytes: int = PAGE_STORE_MAX_SPILL_BYTES):
+        self.max_memory_bytes = max_memory_bytes
+        self.spill_dir = spill_dir
+        self.max_spill_bytes = max_spill_bytes
+
+        self._memory: "OrderedDict[str, Tuple[bytes, Optional[str]]]" = OrderedDict()
+        self._memory_bytes = 0
+        self._spilled: "OrderedDict[str, Tuple[str, int, Optional[str]]]" = OrderedDict()
+        self._spill_bytes = 0
+
+        self.stats: Dict[str, int] = {
+            "puts": 0, "hits": 0, "misses": 0, "spills": 0, "evictions": 0, "bytes_served": 0
+        }
+
+    def __contains__(self, url: str) -> bool:
+        return url in self._memory or url in self._spilled
+
+    def __len__(self) -> int:
+        return len(self._memory) + len(self._spilled)
+
+    def put(self, url: str, body: bytes, encoding: Optional[str] = None):
+        self.discard(url)
+        if len(body) > self.max_memory_bytes:
+            self.stats["evictions"] += 1
+            return
+
+        self._memory[url] = (body, encoding)
+        self._memory_bytes += len(body)
+        self.stats["puts"] += 1
+
+        while self._memory_bytes > self.max_memory_bytes and self._memory:
+            old_url, (old_body, old_encoding) = self._memory.popitem(last=False)
+            self._memory_bytes -= len(old_body)
+            self._spill(old_url, old_body, old_encoding)
+
+    def get(self, url: str) -> Optional[Tuple[bytes, Optional[str]]]:
+        entry = self._memory.get(url)
+        if entry is not None:
+            self._memory.move_to_end(url)
+            self.stats["hits"] += 1
+            self.stats["bytes_served"] += len(entry[0])
+            return entry
+
+        spilled = self._spilled.get(url)
+        if spilled is not None:
+            path, size, encoding = spilled
+            try:
+                with open(path, "rb") as f:
+                    body = f.read()
+            except OSError:
+                self._drop_spilled(url)
+                self.stats["misses"] += 1
+                return None
+            self._spilled.move_to_end(url)
+            self.stats["hits"] += 1
+            self.stats["bytes_served"] += size
+            return body, encoding
+
+        self.stats["misses"] += 1
+        return None
+
+    def discard(self, url: str):
+        entry = self._memory.pop(url, None)
+        if entry is not None:
+            self._memory_bytes -= len(entry[0])
+        if url in self._spilled:
+            self._drop_spilled(url)
+
+    def clear(self):
+        for url in list(self._spilled):
+            self._drop_spilled(url)
+        self._memory.clear()
+        self._memory_bytes = 0
+
+    def _spill(self, url: str, body: bytes, encoding: Optional[str]):
+        if not self.spill_dir or len(body) > self.max_spill_bytes:
+            self.stats["evictions"] += 1
+            return
+
+        os.makedirs(self.spill_dir, exist_ok=True)
+        path = os.path.join(self.spill_dir, f"{os.getpid()}-{hashlib.sha1(url.encode('utf-8')).hexdigest()}")
+        try:
+            with open(path, "wb") as f:
+                f.write(body)
+        except OSError as e:
+            print(f"--- Failed to spill page for {url} to disk: {e}")
+            self.stats["evictions"] += 1
+            return
+
+        self._spilled[url] = (path, len(body), encoding)
+        self._spill_bytes += len(body)
+        self.stats["spills"] += 1
+
+        while self._spill_bytes > self.max_spill_bytes and self._spilled:
+            old_url = next(iter(self._spilled))
+            self._drop_spilled(old_url)
+            self.stats["evictions"] += 1
+
+    def _drop_spilled(self, url: str):
+        path, size, _ = self._spilled.pop(url)
+        self._spill_bytes -= size
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def report(self) -> str:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        hit_rate = self.stats["hits"] / lookups if lookups else 0.0
+        return (f"--- Page store: {len(self._memory)} in memory ({self._memory_bytes / 1024**2:.1f} MB), "
+                f"{len(self._spilled)} on disk ({self._spill_bytes / 1024**2:.1f} MB), "
+                f"hits={self.stats['hits']}, misses={self.stats['misses']}, hit rate={hit_rate:.1%}, "
+                f"spills={self.stats['spills']}, evictions={self.stats['evictions']}, "
+                f"reused {self.stats['bytes_served'] / 1024**2:.1f} MB")
@@ -1,21 +1,43 @@
-import spacy
-import country_converter as coco
-import ollama
-import Levenshtein
+import asyncio
+import threading
+import time
 
 from typing import List, Dict, Optional, Tuple, Any
 from external_apis import fetch_gdelt_themes
 from constants import CURATED_THEME_LIST, ISSUES_TO_GDELT_THEMES, FIPS_MANUAL_MAP
-from config import OLLAMA_MODEL_NAME
+from llm_client import get_llm_client
+from theme_matcher import FuzzyThemeMatcher
+from issue_classifier import get_issue_classifier
+from analysis_cache import get_analysis_cache
+from config import (OLLAMA_MODEL_NAME, QUERY_CLASSIFIER_ENABLED, ISSUE_CLASSIFIER_MIN_SCORE, ISSUE_CLASSIFIER_MARGIN,
+                    ISSUE_CLASSIFIER_MAX_ISSUES, THEME_CLASSIFIER_MIN_SCORE, THEME_CLASSIFIER_MAX_THEMES)
+import model_registry
+
+def _load_spacy_pipeline():
+    import spacy
+    return spacy.load("en_core_web_sm")
+
+def _load_country_converter():
+    import country_converter as coco
+    return coco.CountryConverter()
+
+model_registry.register("spacy", _load_spacy_pipeline)
+model_registry.register("country_converter", _load_country_converter)
+
+# Bump whenever the prompts, the entity mapping or the issue map change, so memoized analyses are not reused.
+PROMPT_VERSION = "1"
 
 class QueryAnalyzer:
     def __init__(self):
-        self.nlp = spacy.load("en_core_web_sm")
+        self.nlp = model_registry.get("spacy")
         self.gdelt_themes = CURATED_THEME_LIST
         self.expanded_gdelt_themes = fetch_gdelt_themes()
+        self.theme_matcher = FuzzyThemeMatcher(self.expanded_gdelt_themes)
         
         self.issues_map = ISSUES_TO_GDELT_THEMES
         self.issue_keys = list(self.issues_map.keys())
+        self.classifier = get_issue_classifier() if QUERY_CLASSIFIER_ENABLED else None
+        self.analysis_cache = get_analysis_cache()
 
         self.entity_to_column = {
             "PERSON": "V2Persons",
@@ -24,7 +46,7 @@ class QueryAnalyzer:
             "ORG": "V2Organizations",
         }
 
-        self.cc = coco.CountryConverter()
+        self.cc = model_registry.get("country_converter")
 
     def _parse_compound_gpe_from_org(self, org_text: str) -> List[str]:
         text_norm = org_text.upper().replace('-', ' ').replace('&', ' AND ')
@@ -63,8 +85,9 @@ class QueryAnalyzer:
             return list(set(found_fips))
         return []
 
-    def extract_entities(self, text: str) -> Dict[str, List[Tuple[str, Any]]]:
-        doc = self.nlp(text)
+    def extract_entities(self, text: str, doc=None) -> Dict[str, List[Tuple[str, Any]]]:
+        if doc is None:
+            doc = self.nlp(text)
         entity_mapping: Dict[str, List[Tuple[str, Any]]] = {
             "V2Persons": [], "V2Locations": [], "V2Organizations": []
         }
@@ -141,7 +164,14 @@ class QueryAnalyzer:
 
         return list(variants)
 
-    def extract_themes(self, text: str) -> List[str]:
+    async def extract_themes(self, text: str) -> List[str]:
+        if self.classifier is not None:
+            # Encoding blocks, so it runs in a worker thread rather than on the event loop.
+            local_themes = await asyncio.to_thread(self.classifier.classify_themes, text)
+            if local_themes is not None:
+                print(f"--- Themes from semantic classifier: {local_themes}")
+                return local_themes, []
+
         prompt = f"""
         You are an expert system designed to map user queries to a concise and highly relevant set of GDELT news themes. Your primary goal is to aid in retrieving accurate articles related to the query's core subject.
 
@@ -159,8 +189,7 @@ class QueryAnalyzer:
         Now, process the USER QUERY above.
         """
 
-        response = ollama.chat(model=OLLAMA_MODEL_NAME, messages=[{"role": "user", "content": prompt}])
-        themes_text = response['message']['content']
+        themes_text = await get_llm_client().chat([{"role": "user", "content": prompt}])
 
         raw_themes = [theme.strip().upper() for theme in themes_text.split(',') if theme.strip()]
         valid_themes = [theme for theme in raw_themes if theme in self.gdelt_themes]
@@ -172,15 +201,9 @@ class QueryAnalyzer:
             else:
                 other_themes.append(theme)
 
-        expanded_themes = []
-
-        for theme in other_themes:
-            for ex_theme in self.expanded_gdelt_themes:
-                if Levenshtein.ratio(theme, ex_theme) > 0.6:
-                    expanded_themes.append(ex_theme)
+        expanded_themes = self.theme_matcher.match_many(other_themes)
 
         unique_themes = list(set(valid_themes))
-        expanded_themes = list(set(expanded_themes))
 
 
         print(f"--- Raw Themes from LLM: {raw_themes}")
@@ -189,7 +212,13 @@ class QueryAnalyzer:
         
         return unique_themes, expanded_themes
     
-    def _map_query_to_issue_categories(self, query: str) -> List[str]:
+    async def _map_query_to_issue_categories(self, query: str) -> List[str]:
+        if self.classifier is not None:
+            local_keys = await asyncio.to_thread(self.classifier.classify_issues, query)
+            if local_keys is not None:
+                print(f"--- Query mapped to issue categories (semantic classifier): {local_keys}")
+                return local_keys
+
         issue_keys_str = ", ".join(self.issue_keys)
         prompt = f"""
         Given the user query: "{query}"
@@ -202,8 +231,7 @@ class QueryAnalyzer:
         For "Impact of new tariffs on US steel imports", relevant categories might be "trade, domesticeconomy".
         Output only the comma-separated keys. If no categories seem relevant, output 'NO_CATEGORY_MATCH'.
         """
-        response = ollama.chat(model=OLLAMA_MODEL_NAME, messages=[{"role": "user", "content": prompt}])
-        matched_keys_text = response['message']['content']
+        matched_keys_text = await get_llm_client().chat([{"role": "user", "content": prompt}])
         print(f"--- LLM output for issue categories: {matched_keys_text}")
 
         if "NO_CATEGORY_MATCH" in matched_keys_text.upper(): return []
@@ -212,9 +240,40 @@ class QueryAnalyzer:
         print(f"--- Query mapped to issue categories: {matched_keys}")
         return matched_keys
 
-    def analyze_question_with_issues(self, question: str) -> Tuple[Dict[str, List[Tuple[str, Optional[str]]]], Dict[str, List[str]]]:
-        entities = self.extract_entities(question)
-        matched_issue_keys = self._map_query_to_issue_categories(question)
+    @property
+    def model_id(self) -> str:
+        if self.classifier is not None:
+            # Classifier results depend on the embedding model and backend as well as on its thresholds.
+            from embedding_retrieval import embedding_model_id
+            classifier = (f"semantic:{embedding_model_id()}:{ISSUE_CLASSIFIER_MIN_SCORE}/{THEME_CLASSIFIER_MIN_SCORE}/"
+                          f"{ISSUE_CLASSIFIER_MARGIN}/{ISSUE_CLASSIFIER_MAX_ISSUES}/{THEME_CLASSIFIER_MAX_THEMES}")
+        else:
+            classifier = "llm"
+        return f"{OLLAMA_MODEL_NAME}|en_core_web_sm|{classifier}"
+
+    async def cached_analysis_with_issues(self, question: str) -> Optional[Tuple[Dict[str, List[Tuple[str, Optional[str]]]], Dict[str, List[str]]]]:
+        # SQLite reads and commits stay off the event loop.
+        cached = await asyncio.to_thread(self.analysis_cache.get, "issues", question, self.model_id, PROMPT_VERSION)
+        if cached is None:
+            return None
+        print(f"--- Reusing memoized query analysis: {cached['themes']}")
+        return cached["entities"], cached["themes"]
+
+    async def cached_analysis(self, question: str) -> Optional[Tuple[Dict[str, List[Tuple[str, Optional[str]]]], List[str], List[str]]]:
+        cached = await asyncio.to_thread(self.analysis_cache.get, "themes", question, self.model_id, PROMPT_VERSION)
+        if cached is None:
+            return None
+        print(f"--- Reusing memoized query analysis: {cached['themes']}")
+        return cached["entities"], cached["themes"], cached["expanded_themes"]
+
+    async def analyze_question_with_issues(self, question: str, doc=None, lookup_cache: bool = True) -> Tuple[Dict[str, List[Tuple[str, Optional[str]]]], Dict[str, List[str]]]:
+        if lookup_cache:
+            cached = await self.cached_analysis_with_issues(question)
+            if cached is not None:
+                return cached
+
+        entities = self.extract_entities(question, doc)
+        matched_issue_keys = await self._map_query_to_issue_categories(question)
         
         structured_gdelt_themes = {}
         if matched_issue_keys:
@@ -224,214 +283,52 @@ class QueryAnalyzer:
                     structured_gdelt_themes[key] = themes_for_key
         
         print(f"--- Structured GDELT themes (from issues map) for BigQuery: {structured_gdelt_themes}")
+        await asyncio.to_thread(self.analysis_cache.put, "issues", question, self.model_id, PROMPT_VERSION,
+                                {"entities": entities, "themes": structured_gdelt_themes})
         return entities, structured_gdelt_themes
 
-    def analyze_question(self, question: str) -> Tuple[Dict[str, List[Tuple[str, Optional[str]]]], List[str]]:
-        entities = self.extract_entities(question)
-        themes, expanded_themes = self.extract_themes(question)
-        return entities, themes, expanded_themes
-    
-def build_bigquery_filter_with_issues(entities: Dict[str, List[Tuple[str, Any]]],
-                                      structured_themes: Dict[str, List[str]],
-                                     loose: bool = False) -> str:
-    category_clauses = []
-
-    for column, values in entities.items():
-        if not values: continue
-        
-        likes = []
-        for original_text, value_for_filter in values:
-
-            if column == "V2Locations" and isinstance(value_for_filter, str) and value_for_filter in FIPS_MANUAL_MAP.values():
-                fips_code = value_for_filter
-                likes.append(f"EXISTS (SELECT 1 FROM UNNEST(SPLIT({column}, ';')) AS loc_item WHERE TRIM(SPLIT(loc_item, '#')[SAFE_OFFSET(2)]) = '{fips_code}')")
-            elif column == "V2Locations" and isinstance(value_for_filter, str):
-                likes.append(f"{column} LIKE '%{value_for_filter.replace("'", "''")}%'")
-            elif column == "V2Persons" and isinstance(value_for_filter, list):
-                person_variant_likes = []
-                for variant in value_for_filter:
-                    safe_variant = variant.replace("'", "''")
-                    person_variant_likes.append(f"{column} LIKE '%{safe_variant}%'")
-                if person_variant_likes:
-                    likes.append(f"({' OR '.join(person_variant_likes)})")
-            elif isinstance(value_for_filter, str):
-                likes.append(f"{column} LIKE '%{value_for_filter.replace("'", "''")}%'")
-
-        if likes: 
-            category_clauses.append(f"({' OR '.join(likes)})")
-
-    entity_filter_str = " AND ".join(category_clauses) if category_clauses else "1=1"
-
-    issue_group_clauses = []
-    if structured_themes:
-        for issue_key, theme_list_for_issue in structured_themes.items():
-            if theme_list_for_issue:
-                safe_themes_for_issue = [theme.replace("'", "''") for theme in theme_list_for_issue]
-                theme_likes_for_issue = [f"V2Themes LIKE '%{th}%'" for th in safe_themes_for_issue]
-                issue_group_clauses.append(f"({' OR '.join(theme_likes_for_issue)})")
-    
-    combined_theme_filter_str = "1=1"
-    if issue_group_clauses:
-        if loose:
-            combined_theme_filter_str = f"({' OR '.join(issue_group_clauses)})"
-            print("--- Using LOOSE theme filter logic (OR between issue groups).")
-        else:
-            combined_theme_filter_str = f"({' AND '.join(issue_group_clauses)})"
-            print("--- Using STRICT theme filter logic (AND between issue groups).")
-
-    if entity_filter_str != "1=1" and combined_theme_filter_str != "1=1":
-        final_filter = f"({entity_filter_str}) AND ({combined_theme_filter_str})"
-    elif entity_filter_str != "1=1":
-        final_filter = entity_filter_str
-    elif combined_theme_filter_str != "1=1":
-        final_filter = combined_theme_filter_str
-    else:
-        final_filter = "1=1"
-
-    if final_filter == "1=1":
-        print("--- Warning: No specific entity or theme filters generated (issues-based).")
-    print(f"--- Generated BigQuery Filter (issues-based, loose={loose}): {final_filter}")
-    return final_filter
-    
-def build_bigquery_filter_with_issues_filtered(entities: Dict[str, List[Tuple[str, Any]]],
-                                      structured_themes: Dict[str, List[str]],
-                                      filtered_sources: List,
-                                     loose: bool = False) -> str:
-    category_clauses = []
-
-    for column, values in entities.items():
-        if not values: continue
-        
-        likes = []
-        for original_text, value_for_filter in values:
-
-            if column == "V2Locations" and isinstance(value_for_filter, str) and value_for_filter in FIPS_MANUAL_MAP.values():
-                fips_code = value_for_filter
-                likes.append(f"EXISTS (SELECT 1 FROM UNNEST(SPLIT({column}, ';')) AS loc_item WHERE TRIM(SPLIT(loc_item, '#')[SAFE_OFFSET(2)]) = '{fips_code}')")
-            elif column == "V2Locations" and isinstance(value_for_filter, str):
-                likes.append(f"{column} LIKE '%{value_for_filter.replace("'", "''")}%'")
-            elif column == "V2Persons" and isinstance(value_for_filter, list):
-                person_variant_likes = []
-                for variant in value_for_filter:
-                    safe_variant = variant.replace("'", "''")
-                    person_variant_likes.append(f"{column} LIKE '%{safe_variant}%'")
-                if person_variant_likes:
-                    likes.append(f"({' OR '.join(person_variant_likes)})")
-            elif isinstance(value_for_filter, str):
-                likes.append(f"{column} LIKE '%{value_for_filter.replace("'", "''")}%'")
-
-        if likes: 
-            category_clauses.append(f"({' OR '.join(likes)})")
-
-    entity_filter_str = " AND ".join(category_clauses) if category_clauses else "1=1"
-
-    issue_group_clauses = []
-    if structured_themes:
-        for issue_key, theme_list_for_issue in structured_themes.items():
-            if theme_list_for_issue:
-                safe_themes_for_issue = [theme.replace("'", "''") for theme in theme_list_for_issue]
-                theme_likes_for_issue = [f"V2Themes LIKE '%{th}%'" for th in safe_themes_for_issue]
-                issue_group_clauses.append(f"({' OR '.join(theme_likes_for_issue)})")
-    
-    combined_theme_filter_str = "1=1"
-    if issue_group_clauses:
-        if loose:
-            combined_theme_filter_str = f"({' OR '.join(issue_group_clauses)})"
-            print("--- Using LOOSE theme filter logic (OR between issue groups).")
-        else:
-            combined_theme_filter_str = f"({' AND '.join(issue_group_clauses)})"
-            print("--- Using STRICT theme filter logic (AND between issue groups).")
-
-    source_filter_str = "1=1"
-    if filtered_sources:
-        safe_filtered_sources = [source.replace("'", "''") for source in filtered_sources]
-        sources_list_str = "', '".join(safe_filtered_sources)
-        source_filter_str = f"(SourceCommonName NOT IN ('{sources_list_str}'))"
-
-    all_filters = []
-    if entity_filter_str != "1=1":
-        all_filters.append(f"({entity_filter_str})")
-    if combined_theme_filter_str != "1=1":
-        all_filters.append(f"({combined_theme_filter_str})")
-    if source_filter_str != "1=1":
-        all_filters.append(source_filter_str)
-
-    if not all_filters:
-        final_filter = "1=1"
-    else:
-        final_filter = " AND ".join(all_filters)
-    
-    if final_filter == "1=1" or not final_filter:
-        final_filter = "1=1"
-        print("--- Warning: No specific entity, theme, or source filters generated.")
-
-    return final_filter
-
-
-def build_bigquery_filter(entities: Dict[str, List[Tuple[str, Optional[str]]]], themes: List[str], expanded_themes: List[str]) -> str:
-    """ Builds filter using entities (text, code) and themes """
-    entity_filters = []
-    theme_filters = []
-
-    category_clauses = []
-    for column, values in entities.items():
-        if not values:
-            continue
+    async def analyze_question(self, question: str, doc=None, lookup_cache: bool = True) -> Tuple[Dict[str, List[Tuple[str, Optional[str]]]], List[str]]:
+        if lookup_cache:
+            cached = await self.cached_analysis(question)
+            if cached is not None:
+                return cached
 
-        likes = []
-        for original_text, code in values:
-            safe_text = original_text.replace("'", "''")
-
-            if column == "V2Locations" and code:
-                likes.append(f"{column} LIKE '%#{code}#%'")
-            else:
-                likes.append(f"{column} LIKE '%{safe_text}%'")
-
-        if likes:
-            category_clauses.append(f"({' OR '.join(likes)})")
-
-    entity_filter_str = " AND ".join(category_clauses) if category_clauses else "1=1"
-
-    core_theme_clause_str = ""
-    if themes:
-        safe_core_themes = [theme.replace("'", "''") for theme in themes]
-        if len(safe_core_themes) == 1:
-            core_theme_clause_str = f"(V2Themes LIKE '%{safe_core_themes[0]}%')"
-        elif len(safe_core_themes) > 1:
-            core_theme_likes = [f"V2Themes LIKE '%{theme}%'" for theme in safe_core_themes]
-            core_theme_clause_str = f"({' AND '.join(core_theme_likes)})"
-
-    expanded_theme_clause_str = ""
-    if expanded_themes:
-        safe_expanded_themes = [theme.replace("'", "''") for theme in expanded_themes]
-        if len(safe_expanded_themes) == 1:
-            expanded_theme_clause_str = f"(V2Themes LIKE '%{safe_expanded_themes[0]}%')"
-        elif len(safe_expanded_themes) > 1:
-            expanded_theme_likes = [f"V2Themes LIKE '%{theme}%'" for theme in safe_expanded_themes]
-            expanded_theme_clause_str = f"({' OR '.join(expanded_theme_likes)})"
-
-    final_theme_clauses = []
-    if core_theme_clause_str:
-        final_theme_clauses.append(core_theme_clause_str)
-    if expanded_theme_clause_str:
-        final_theme_clauses.append(expanded_theme_clause_str)
+        entities = self.extract_entities(question, doc)
+        themes, expanded_themes = await self.extract_themes(question)
+        await asyncio.to_thread(self.analysis_cache.put, "themes", question, self.model_id, PROMPT_VERSION,
+                                {"entities": entities, "themes": themes, "expanded_themes": expanded_themes})
+        return entities, themes, expanded_themes
     
-    combined_theme_filter_str = "1=1"
-    if final_theme_clauses:
-        combined_theme_filter_str = " AND ".join(final_theme_clauses)
-
-
-    if entity_filter_str != "1=1" and combined_theme_filter_str != "1=1":
-        final_filter = f"({entity_filter_str}) AND ({combined_theme_filter_str})"
-    elif entity_filter_str != "1=1":
-        final_filter = entity_filter_str
-    elif combined_theme_filter_str != "1=1":
-        final_filter = combined_theme_filter_str
-    else:
-        final_filter = "1=1"
-
-    if final_filter == "1=1":
-        print("--- Warning: No specific entity or theme filters generated by build_bigquery_filter.")
-
-    print(f"--- Generated BigQuery Filter: {final_filter}")
-    return final_filter
\ No newline at end of file
+_analyzer_registry: Dict[str, QueryAnalyzer] = {}
+_analyzer_registry_lock = threading.Lock()
+
+def get_query_analyzer(name: str = "default") -> QueryAnalyzer:
+    analyzer = _analyzer_registry.get(name)
+    if analyzer is not None:
+        return analyzer
+
+    with _analyzer_registry_lock:
+        analyzer = _analyzer_registry.get(name)
+        if analyzer is None:
+            print(f"--- Building shared QueryAnalyzer '{name}'...")
+            analyzer = QueryAnalyzer()
+            _analyzer_registry[name] = analyzer
+    return analyzer
+
+def warm_up_query_analyzer(name: str = "default") -> QueryAnalyzer:
+    start_time = time.time()
+    analyzer = get_query_analyzer(name)
+    # First call through the spaCy pipeline allocates its internal buffers.
+    analyzer.nlp("Warm up the pipeline before the first claim arrives.")
+    print(f"--- QueryAnalyzer '{name}' warmed up in {time.time() - start_time:.2f}s")
+    return analyzer
+
+def reload_query_analyzer(name: str = "default") -> QueryAnalyzer:
+    print(f"--- Reloading shared QueryAnalyzer '{name}'...")
+    # The registry caches the pipelines; drop them so the new analyzer really loads them again.
+    model_registry.unload("spacy")
+    model_registry.unload("country_converter")
+    analyzer = QueryAnalyzer()
+    with _analyzer_registry_lock:
+        _analyzer_registry[name] = analyzer
+    return analyzer
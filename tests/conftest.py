@@ -0,0 +1,23 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+DATA_DIR = os.path.join(ROOT, "tests", "data")
+# tests/data/20240301000000.gkg.csv: 120 synthetic GKG 2.0 rows, 60 each for 2024-03-01 and 2024-03-02,
+# including rows with no source, themes, persons, organizations or locations.
+GKG_SAMPLE = os.path.join(DATA_DIR, "20240301000000.gkg.csv")
+
+
+@pytest.fixture(scope="session")
+def gkg_store(tmp_path_factory):
+    pytest.importorskip("pandas")
+    pytest.importorskip("pyarrow")
+    from gkg_ingest import ingest_files
+
+    root = str(tmp_path_factory.mktemp("gkg"))
+    ingest_files([GKG_SAMPLE], root, workers=1)
+    return root
@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+faiss = pytest.importorskip("faiss")
+
+
+def _chunks(start, count):
+    from data_models import TextChunk
+
+    return [TextChunk(text=f"chunk {i}", source_title="Title", source_url=f"https://example.com/{i}",
+                      source_date="20240301") for i in range(start, start + count)]
+
+
+def test_reopen_trusts_the_saved_index_over_sqlite_metadata(tmp_path):
+    from chunk_corpus import ChunkCorpus
+
+    vectors = np.random.default_rng(0).normal(size=(6, 16)).astype(np.float32)
+    corpus = ChunkCorpus(str(tmp_path), save_every=1000, factory="Flat")
+    corpus.add_chunks(_chunks(0, 3), vectors[:3])
+    corpus.save()
+    corpus.add_chunks(_chunks(3, 2), vectors[3:5])
+    # Crash right after the index file was replaced, before SQLite saw anything about it.
+    faiss.write_index(corpus._index, corpus._index_path)
+    corpus._conn.close()
+
+    reopened = ChunkCorpus(str(tmp_path), save_every=1000, factory="Flat")
+    assert reopened.ntotal == 5
+    reopened.add_chunks(_chunks(5, 1), vectors[5:])
+    for i in range(6):
+        hit = reopened.search(vectors[i], 1)[0]
+        assert hit.chunk.text == f"chunk {i}" and hit.score == pytest.approx(1.0, abs=1e-5)
+
+
+def test_rows_added_after_the_last_save_are_dropped_on_reopen(tmp_path):
+    from chunk_corpus import ChunkCorpus
+
+    vectors = np.random.default_rng(1).normal(size=(4, 16)).astype(np.float32)
+    corpus = ChunkCorpus(str(tmp_path), save_every=1000, factory="Flat")
+    corpus.add_chunks(_chunks(0, 2), vectors[:2])
+    corpus.save()
+    corpus.add_chunks(_chunks(2, 2), vectors[2:])
+    corpus._conn.close()
+
+    reopened = ChunkCorpus(str(tmp_path), save_every=1000, factory="Flat")
+    assert reopened.ntotal == 2
+    assert reopened.add_chunks(_chunks(2, 2), vectors[2:]) == 2
+    assert reopened.search(vectors[3], 1)[0].chunk.text == "chunk 3"
+
+
+def test_similarity_threshold_uses_inner_product(tmp_path, monkeypatch):
+    import chunk_corpus
+
+    # The corpus scores are similarities even when the retrieval metric is L2.
+    new_factory_index = chunk_corpus.new_factory_index
+    monkeypatch.setattr(chunk_corpus, "new_factory_index",
+                        lambda dim, factory, metric="l2": new_factory_index(dim, factory, metric))
+    vectors = np.eye(4, dtype=np.float32)
+    corpus = chunk_corpus.ChunkCorpus(str(tmp_path), factory="Flat")
+    corpus.add_chunks(_chunks(0, 4), vectors)
+    hits = corpus.search(vectors[0] + 0.1 * vectors[1], 4, min_score=0.6)
+    assert [hit.chunk.text for hit in hits] == ["chunk 0"]
@@ -0,0 +1,113 @@
+import pytest
+
+from conftest import GKG_SAMPLE
+from gkg_filters import (And, ColumnLike, LocationCountry, Or, SourceNotIn, TrueExpr, cache_key, canonicalize,
+                         issue_filter, to_bigquery, to_predicate)
+
+pytest.importorskip("duckdb")
+
+EXPRESSIONS = [
+    TrueExpr(),
+    SourceNotIn(("foxnews.com",)),
+    ColumnLike("V2Themes", "ECON_TAXATION"),
+    LocationCountry("US"),
+    Or((ColumnLike("V2Persons", "Obama"), LocationCountry("GM"))),
+    issue_filter({"V2Persons": [("Trump", ["Donald Trump"])], "V2Organizations": None},
+                 {"economy": ["ECON_TAXATION"], "education": ["EDUCATION"]}, loose=True,
+                 excluded_sources=["foxnews.com", "breitbart.com"]),
+    issue_filter({"V2Locations": [("France", "FR"), ("Paris", "Paris")]},
+                 {"climate": ["ENV_CLIMATECHANGE", "HEALTH_PANDEMIC"]}, excluded_sources=["cnn.com"]),
+]
+
+
+def _documents(rows):
+    return sorted(row["DocumentIdentifier"] for row in rows)
+
+
+@pytest.fixture(scope="module")
+def backends(gkg_store):
+    from gkg_local import LocalGKGBackend
+    from gkg_postings import build_postings
+
+    build_postings(gkg_store)
+    scan = LocalGKGBackend(gkg_store, use_postings=False)
+    postings = LocalGKGBackend(gkg_store, use_postings=True)
+    yield scan, postings, scan.run("1=1", 1000, "2024-03-01")
+    scan.close()
+    postings.close()
+
+
+@pytest.mark.parametrize("expr", EXPRESSIONS)
+def test_postings_duckdb_and_predicate_agree(backends, expr):
+    scan, postings, all_rows = backends
+    expected = _documents(scan.run(expr, 1000, "2024-03-01"))
+    predicate = to_predicate(expr)
+    assert _documents(row for row in all_rows if predicate(row)) == expected
+    assert _documents(postings.run(expr, 1000, "2024-03-01")) == expected
+
+
+def test_source_exclusion_drops_rows_without_source(backends):
+    scan, postings, all_rows = backends
+    assert any(row["SourceCommonName"] is None for row in all_rows)
+    rows = postings.run(SourceNotIn(("foxnews.com",)), 1000, "2024-03-01")
+    assert rows and all(row["SourceCommonName"] not in (None, "foxnews.com") for row in rows)
+
+
+def test_like_wildcards_in_filter_text_match_literally(tmp_path):
+    from gkg_ingest import ingest_files
+    from gkg_local import LocalGKGBackend
+    from gkg_postings import build_postings
+
+    # Themes that only match "ECON_TAX" or "TAX%" if "_" and "%" were treated as LIKE wildcards.
+    with open(GKG_SAMPLE, encoding="utf-8") as f:
+        template = f.readline().rstrip("\n").split("\t")
+    sample = tmp_path / "20240301000000.gkg.csv"
+    with open(sample, "w", encoding="utf-8") as f:
+        for index, themes in enumerate(["ECON_TAXATION,1", "ECONXTAXATION,1", "TAX%RATE,1", "TAXRATE,1"]):
+            fields = list(template)
+            fields[0], fields[4], fields[8] = f"20240301-{index}", f"https://example.com/like/{index}", themes
+            f.write("\t".join(fields) + "\n")
+    root = str(tmp_path / "gkg")
+    ingest_files([str(sample)], root, workers=1)
+    build_postings(root)
+
+    scan = LocalGKGBackend(root, use_postings=False)
+    postings = LocalGKGBackend(root, use_postings=True)
+    all_rows = scan.run("1=1", 1000, "2024-03-01")
+    for expr, expected in [(ColumnLike("V2Themes", "ECON_TAX"), ["https://example.com/like/0"]),
+                           (ColumnLike("V2Themes", "TAX%"), ["https://example.com/like/2"])]:
+        predicate = to_predicate(expr)
+        assert _documents(row for row in all_rows if predicate(row)) == expected
+        assert _documents(scan.run(expr, 1000, "2024-03-01")) == expected
+        assert _documents(scan.run(to_bigquery(expr, parameterize=False)[0], 1000, "2024-03-01")) == expected
+        assert _documents(postings.run(expr, 1000, "2024-03-01")) == expected
+    scan.close()
+    postings.close()
+
+
+def test_canonical_form_ignores_order_and_duplicates():
+    first = issue_filter({"V2Persons": [("a", ["X", "Y"])], "V2Organizations": [("o", "Org")]},
+                         {"a": ["T1"], "b": ["T2"]}, excluded_sources=["s2", "s1"])
+    second = issue_filter({"V2Organizations": [("o", "Org")], "V2Persons": [("a", ["Y", "X", "X"])]},
+                          {"b": ["T2"], "a": ["T1"]}, excluded_sources=["s1", "s2", "s1"])
+    assert cache_key(first) == cache_key(second)
+    assert canonicalize(And((TrueExpr(), And((SourceNotIn(("b",)), SourceNotIn(("a",))))))) == SourceNotIn(("a", "b"))
+
+
+def test_equivalent_filters_share_memoized_gkg_results(monkeypatch):
+    import external_apis
+
+    calls = []
+
+    class FakeBackend:
+        def run(self, where_clause, limit, min_partition, max_partition=None, label=""):
+            calls.append(where_clause)
+            return [{"DocumentIdentifier": "https://example.com/1"}]
+
+    monkeypatch.setattr(external_apis, "get_gkg_backend", lambda: FakeBackend())
+    monkeypatch.setattr(external_apis, "_gkg_result_cache", external_apis.OrderedDict())
+    first = issue_filter({"V2Persons": [("a", ["X", "Y"])]}, {"a": ["T1"], "b": ["T2"]})
+    second = issue_filter({"V2Persons": [("a", ["Y", "X"])]}, {"b": ["T2"], "a": ["T1"]})
+    assert external_apis.run_gkg_query(first, 10, "2024-03-01") == external_apis.run_gkg_query(second, 10, "2024-03-01")
+    external_apis.run_gkg_query(second, 10, "2024-02-01")
+    assert len(calls) == 2
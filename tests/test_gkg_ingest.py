@@ -0,0 +1,45 @@
+import glob
+import os
+
+import pytest
+
+from conftest import GKG_SAMPLE
+
+pq = pytest.importorskip("pyarrow.parquet")
+
+
+def _row_count(root):
+    return sum(pq.ParquetFile(path).metadata.num_rows for path in glob.glob(os.path.join(root, "date=*", "*.parquet")))
+
+
+def test_reingest_replaces_previous_parts(tmp_path):
+    from gkg_ingest import ingest_file, ingest_files
+
+    root = str(tmp_path)
+    ingest_files([GKG_SAMPLE], root, workers=1, chunk_rows=25)
+    assert _row_count(root) == 120
+    # Unchanged files are skipped by the manifest; forced or resized runs rewrite the file's parts.
+    assert ingest_files([GKG_SAMPLE], root, workers=1) == []
+    ingest_files([GKG_SAMPLE], root, workers=1, chunk_rows=100, force=True)
+    assert _row_count(root) == 120
+    ingest_file(GKG_SAMPLE, root, chunk_rows=1000)
+    assert _row_count(root) == 120
+    assert not glob.glob(os.path.join(root, "date=*", "*.tmp"))
+
+
+def test_english_and_translation_feeds_keep_separate_parts(tmp_path):
+    from gkg_ingest import ingest_files
+
+    with open(GKG_SAMPLE, "r", encoding="utf-8") as f:
+        lines = f.readlines()
+    english = tmp_path / "raw" / "20240301000000.gkg.csv"
+    translation = tmp_path / "raw" / "20240301000000.translation.gkg.csv"
+    english.parent.mkdir()
+    english.write_text("".join(lines), encoding="utf-8")
+    translation.write_text("".join(lines[:3]), encoding="utf-8")
+
+    root = str(tmp_path / "store")
+    ingest_files([str(english), str(translation)], root, workers=1)
+    assert _row_count(root) == 123
+    ingest_files([str(translation)], root, workers=1, force=True)
+    assert _row_count(root) == 123
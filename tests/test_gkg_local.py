@@ -0,0 +1,41 @@
+import pytest
+
+from gkg_filters import ColumnLike, LocationCountry, Or, SourceNotIn, TrueExpr, issue_filter, to_bigquery
+
+duckdb = pytest.importorskip("duckdb")
+
+EXPRESSIONS = [
+    TrueExpr(),
+    ColumnLike("V2Themes", "ECON_TAXATION"),
+    LocationCountry("FR"),
+    SourceNotIn(("foxnews.com", "breitbart.com")),
+    Or((ColumnLike("V2Persons", "Obama"), ColumnLike("V2Organizations", "Congress"))),
+    issue_filter({"V2Persons": [("Biden", ["Joe Biden", "Biden"])], "V2Locations": [("United States", "US")]},
+                 {"economy": ["ECON_TAXATION", "TAX_FNCACT"], "climate": ["ENV_CLIMATECHANGE"]}, loose=True),
+    issue_filter({"V2Organizations": [("White House", "White House")]},
+                 {"economy": ["ECON_TAXATION"]}, excluded_sources=["cnn.com"]),
+]
+
+
+def _documents(rows):
+    return sorted(row["DocumentIdentifier"] for row in rows)
+
+
+def test_ingested_partitions(gkg_store):
+    from gkg_local import LocalGKGBackend
+
+    backend = LocalGKGBackend(gkg_store, use_postings=False)
+    assert [path[-10:] for path in backend.partitions("2024-03-01")] == ["2024-03-01", "2024-03-02"]
+    assert len(backend.run("1=1", 1000, "2024-03-01")) == 120
+    assert len(backend.run("1=1", 1000, "2024-03-02")) == 60
+    backend.close()
+
+
+@pytest.mark.parametrize("expr", EXPRESSIONS)
+def test_inlined_sql_matches_parameterized(gkg_store, expr):
+    from gkg_local import LocalGKGBackend
+
+    backend = LocalGKGBackend(gkg_store, use_postings=False)
+    inlined, _ = to_bigquery(expr, parameterize=False)
+    assert _documents(backend.run(inlined, 1000, "2024-03-01")) == _documents(backend.run(expr, 1000, "2024-03-01"))
+    backend.close()
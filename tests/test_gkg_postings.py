@@ -0,0 +1,47 @@
+import glob
+import os
+
+import numpy as np
+import pytest
+
+pa = pytest.importorskip("pyarrow")
+pq = pytest.importorskip("pyarrow.parquet")
+
+
+def test_rows_reads_only_selected_row_groups(gkg_store, tmp_path):
+    from gkg_postings import PartitionPostings
+
+    # Rewrite one partition as several files with small row groups, so ids span files and row groups.
+    source = sorted(glob.glob(os.path.join(gkg_store, "date=2024-03-01", "*.parquet")))
+    table = pa.concat_tables([pq.read_table(path) for path in source])
+    directory = tmp_path / "date=2024-03-01"
+    directory.mkdir()
+    pq.write_table(table.slice(0, 25), directory / "a.parquet", row_group_size=7)
+    pq.write_table(table.slice(25), directory / "b.parquet", row_group_size=7)
+
+    postings = PartitionPostings.build(str(directory))
+    assert postings.num_rows == table.num_rows
+    row_ids = np.array([0, 6, 7, 24, 25, 33, table.num_rows - 1], dtype=np.uint32)
+    expected = table.take(pa.array(row_ids.astype(np.int64))).to_pylist()
+    rows = postings.rows(row_ids)
+    assert [row["DocumentIdentifier"] for row in rows] == [row["DocumentIdentifier"] for row in expected]
+    assert rows[0]["V2Themes"] == ";".join(expected[0]["V2Themes"])
+
+
+def test_same_size_rewrite_invalidates_postings(gkg_store, tmp_path):
+    from gkg_postings import PartitionPostings
+
+    directory = tmp_path / "date=2024-03-01"
+    directory.mkdir()
+    source = sorted(glob.glob(os.path.join(gkg_store, "date=2024-03-01", "*.parquet")))
+    table = pa.concat_tables([pq.read_table(path) for path in source])
+    part = directory / "a.parquet"
+    pq.write_table(table, part)
+    PartitionPostings.build(str(directory)).save()
+    assert PartitionPostings.load(str(directory), rebuild_stale=False) is not None
+
+    # A rewrite that happens to keep the file size is still caught by its modification time.
+    stat = os.stat(part)
+    os.utime(part, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert os.path.getsize(part) == stat.st_size
+    assert PartitionPostings.load(str(directory), rebuild_stale=False) is None
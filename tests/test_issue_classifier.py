@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+import issue_classifier
+from issue_classifier import SemanticIssueClassifier, theme_description
+
+
+def _unit(*components):
+    vector = np.zeros(4, dtype=np.float32)
+    vector[:len(components)] = components
+    return vector / np.linalg.norm(vector)
+
+
+VECTORS = {
+    "economy and taxes": _unit(1, 0, 0),
+    "climate and environment": _unit(0, 1, 0),
+    "public health": _unit(0, 0, 1),
+    "economy taxation": _unit(1, 0, 0),
+    "environment climatechange": _unit(0, 1, 0),
+    "Tax cuts pay for themselves.": _unit(1, 0, 0),
+    "Carbon taxes will wreck the economy.": _unit(1, 1, 0),
+    "Mostly about taxes, a little about climate.": _unit(0.95, 0.3, 0),
+    "The moon landing was staged.": _unit(0, 0, 0, 1),
+}
+
+
+@pytest.fixture
+def classifier(monkeypatch):
+    monkeypatch.setattr(issue_classifier, "_embed", lambda texts: np.stack([VECTORS[text] for text in texts]))
+    return SemanticIssueClassifier(
+        issue_descriptions={"economy": "economy and taxes", "climate": "climate and environment",
+                            "health": "public health"},
+        themes=["ECON_TAXATION", "ENV_CLIMATECHANGE"],
+        issue_min_score=0.5, theme_min_score=0.5, margin=0.1, max_issues=1, max_themes=1)
+
+
+def test_clear_best_match_is_returned(classifier):
+    assert classifier.classify_issues("Tax cuts pay for themselves.") == ["economy"]
+    assert classifier.classify_themes("Tax cuts pay for themselves.") == ["ECON_TAXATION"]
+    # The runner-up is well outside the margin.
+    assert classifier.classify_issues("Mostly about taxes, a little about climate.") == ["economy"]
+
+
+def test_ambiguous_margin_falls_back(classifier):
+    assert classifier.classify_issues("Carbon taxes will wreck the economy.") is None
+    assert classifier.classify_themes("Carbon taxes will wreck the economy.") is None
+    classifier.max_issues = 2
+    assert sorted(classifier.classify_issues("Carbon taxes will wreck the economy.")) == ["climate", "economy"]
+
+
+def test_weak_best_match_falls_back(classifier):
+    assert classifier.classify_issues("The moon landing was staged.") is None
+    assert classifier.stats["issues_fallback"] == 1 and classifier.stats["issues_local"] == 0
+
+
+def test_theme_description_expands_prefixes():
+    assert theme_description("ECON_TAXATION") == "economy taxation"
+    assert theme_description("TAX_FNCACT_PRESIDENT") == "fncact president"
@@ -0,0 +1,36 @@
+import pytest
+
+pytest.importorskip("aiohttp")
+
+from llm_interaction import extract_liar_label
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("Reasoning about the claim.\nLabel: mostly-true", "mostly-true"),
+    ("Label: half-true because the numbers are right", "half-true"),
+    ("Label: **barely-true**", "barely-true"),
+    ("Label: \"pants-fire\"", "pants-fire"),
+    ("label: TRUE", "true"),
+    ("Label: false", "false"),
+    # The last marker wins, so labels quoted in the reasoning are ignored.
+    ("It is not Label: true as claimed.\nLabel: mostly-true", "mostly-true"),
+    ("Label: unverifiable", None),
+    ("mostly-true", None),
+    ("The claim is true.", None),
+])
+def test_extract_liar_label_with_marker(text, expected):
+    assert extract_liar_label(text) == expected
+
+
+def test_extract_liar_label_does_not_stop_at_shorter_labels():
+    # A streamed "Label: mostly" must not resolve yet, and the full label must not resolve to "true".
+    assert extract_liar_label("Label: mostly") is None
+    assert extract_liar_label("Label: mostly-true") == "mostly-true"
+    assert extract_liar_label("Label: pants-fire") == "pants-fire"
+
+
+def test_extract_liar_label_without_marker():
+    assert extract_liar_label("mostly-true", require_marker=False) == "mostly-true"
+    assert extract_liar_label("  'half-true'", require_marker=False) == "half-true"
+    assert extract_liar_label("Verdict: false", require_marker=False, marker="Verdict:") == "false"
+    assert extract_liar_label("The claim is mostly-true", require_marker=False) is None
@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+
+faiss = pytest.importorskip("faiss")
+
+
+def _chunks(count):
+    from data_models import TextChunk
+
+    return [TextChunk(text=f"chunk {i}", source_title="Title", source_url=f"https://example.com/{i}",
+                      source_date="20240301") for i in range(count)]
+
+
+def _reference_mmr(query, embeddings, top_n, lambda_param):
+    """Textbook MMR: relevance minus the highest cosine similarity to anything already selected."""
+    def cosine(a, b):
+        return float(np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b)))
+
+    remaining = list(range(len(embeddings)))
+    selected = []
+    while remaining and len(selected) < top_n:
+        def score(i):
+            redundancy = max((cosine(embeddings[i], embeddings[j]) for j in selected), default=0.0)
+            return lambda_param * cosine(embeddings[i], query) - (1 - lambda_param) * redundancy
+        best = max(remaining, key=score)
+        selected.append(best)
+        remaining.remove(best)
+    return selected
+
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("lambda_param", [0.0, 0.3, 0.7, 1.0])
+@pytest.mark.parametrize("top_n", [1, 5, 40])
+def test_vectorized_mmr_matches_reference(seed, lambda_param, top_n):
+    from embedding_retrieval import retrieve_chunks_with_mmr
+
+    rng = np.random.default_rng(seed)
+    embeddings = rng.normal(size=(30, 12)).astype(np.float32) * rng.uniform(0.5, 3.0, size=(30, 1)).astype(np.float32)
+    query = rng.normal(size=12).astype(np.float32)
+    chunks = _chunks(len(embeddings))
+
+    expected = [chunks[i] for i in _reference_mmr(query, embeddings, top_n, lambda_param)]
+    assert retrieve_chunks_with_mmr(query, embeddings, chunks, top_n_final=top_n, lambda_param=lambda_param) == expected
+
+    unit = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+    unit_query = query / np.linalg.norm(query)
+    assert retrieve_chunks_with_mmr(unit_query, unit, chunks, top_n_final=top_n, lambda_param=lambda_param,
+                                    normalized=True) == expected
+
+
+def test_candidate_pool_restricts_mmr_to_nearest_chunks():
+    from embedding_retrieval import retrieve_chunks_with_mmr
+
+    rng = np.random.default_rng(7)
+    embeddings = rng.normal(size=(50, 8)).astype(np.float32)
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+    query = embeddings[0] + 0.05 * rng.normal(size=8).astype(np.float32)
+    chunks = _chunks(len(embeddings))
+    index = faiss.IndexFlatIP(8)
+    index.add(embeddings)
+
+    _, pool = index.search(query.reshape(1, -1), 10)
+    pool = pool[0]
+    expected = [chunks[pool[i]] for i in _reference_mmr(query, embeddings[pool], 5, 0.5)]
+    assert retrieve_chunks_with_mmr(query, embeddings, chunks, top_n_final=5, lambda_param=0.5,
+                                    index=index, candidate_pool_size=10) == expected
@@ -0,0 +1,51 @@
+import random
+import string
+
+import pytest
+
+pytest.importorskip("rapidfuzz")
+pytest.importorskip("Levenshtein")
+
+from theme_matcher import FuzzyThemeMatcher, match_themes_bruteforce
+
+
+def _themes(rng, count):
+    prefixes = ["ECON", "ENV", "TAX", "WB", "EPU", "UNGP", "CRISISLEX", "SOC", "GOV", "HEALTH"]
+    themes = set()
+    while len(themes) < count:
+        words = ["".join(rng.choices(string.ascii_uppercase, k=rng.randint(1, 12))) for _ in range(rng.randint(0, 3))]
+        themes.add("_".join([rng.choice(prefixes)] + words))
+    return sorted(themes)
+
+
+def _mutate(rng, text):
+    chars = list(text)
+    for _ in range(rng.randint(0, 4)):
+        position = rng.randrange(len(chars) + 1)
+        operation = rng.choice(["insert", "delete", "replace"])
+        if operation == "insert" or not chars:
+            chars.insert(position, rng.choice(string.ascii_uppercase + "_ "))
+        elif operation == "delete":
+            del chars[min(position, len(chars) - 1)]
+        else:
+            chars[min(position, len(chars) - 1)] = rng.choice(string.ascii_uppercase)
+    return "".join(chars)
+
+
+@pytest.mark.parametrize("min_ratio", [0.3, 0.6, 0.8, 0.95])
+def test_fuzzy_matcher_agrees_with_bruteforce(min_ratio):
+    rng = random.Random(min_ratio)
+    themes = _themes(rng, 400)
+    queries = [_mutate(rng, rng.choice(themes)) for _ in range(60)]
+    queries += ["", "A", "TAXATION", "CLIMATE POLICY", "ELECTION_FRAUD", "X" * 80]
+
+    matcher = FuzzyThemeMatcher(themes, min_ratio=min_ratio)
+    for query in queries:
+        assert sorted(matcher.match(query)) == sorted(match_themes_bruteforce([query], themes, min_ratio)), query
+    assert sorted(matcher.match_many(queries)) == sorted(match_themes_bruteforce(queries, themes, min_ratio))
+
+
+def test_fuzzy_matcher_keeps_the_strict_threshold():
+    # ratio("ABCD", "ABCE") is exactly 0.75, which the original loop does not count as a match.
+    assert FuzzyThemeMatcher(["ABCE"], min_ratio=0.75).match("ABCD") == []
+    assert FuzzyThemeMatcher(["ABCE"], min_ratio=0.74).match("ABCD") == ["ABCE"]
@@ -0,0 +1,94 @@
+import os
+import sqlite3
+
+import url_cache
+from url_cache import UrlCache
+
+
+class _Clock:
+    def __init__(self, now: float = 1_000_000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def _cache(tmp_path, **kwargs) -> UrlCache:
+    kwargs.setdefault("ttl_seconds", 3600)
+    return UrlCache(path=str(tmp_path / "url_cache.sqlite3"), **kwargs)
+
+
+def test_entries_expire_after_ttl(tmp_path, monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(url_cache.time, "time", clock)
+    cache = _cache(tmp_path, ttl_seconds=60)
+    cache.put("https://a.example/1", title="Title", text="Body text")
+
+    clock.now += 59
+    assert cache.get_article("https://a.example/1") == ("Title", "Body text")
+    clock.now += 2
+    assert cache.get("https://a.example/1") is None
+    assert cache.stats["hits"] == 1 and cache.stats["misses"] == 1
+    cache.close()
+
+
+def test_eviction_drops_least_recently_used_entries(tmp_path, monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(url_cache.time, "time", clock)
+    monkeypatch.setattr(url_cache, "EVICTION_CHECK_INTERVAL", 1)
+    cache = _cache(tmp_path, max_entries=2)
+    cache.put("https://a.example/old", title="old", text="x")
+    clock.now += 1
+    cache.put("https://a.example/kept", title="kept", text="x")
+    clock.now += 1
+    # A hit refreshes last_access, so the first page is no longer the oldest.
+    assert cache.get_title("https://a.example/old") == "old"
+    clock.now += 1
+    cache.put("https://a.example/new", title="new", text="x")
+
+    assert cache.get_title("https://a.example/old") == "old"
+    assert cache.get("https://a.example/kept") is None
+    assert cache.get_title("https://a.example/new") == "new"
+    assert cache.stats["evictions"] == 1
+    cache.close()
+
+
+def test_byte_budget_counts_shared_bodies_once(tmp_path, monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(url_cache.time, "time", clock)
+    monkeypatch.setattr(url_cache, "EVICTION_CHECK_INTERVAL", 1)
+    body = b"<html>" + b"a" * 994 + b"</html>"
+    cache = _cache(tmp_path, max_bytes=2 * len(body) + 10)
+    for index, page_body in enumerate([body, body, body.replace(b"a", b"b"), body.replace(b"a", b"c")]):
+        clock.now += 1
+        cache.put(f"https://a.example/{index}", title=str(index), body=page_body, encoding="utf-8")
+
+    # Pages 0 and 1 share one body; both have to go before its bytes are freed.
+    assert cache.get("https://a.example/0") is None
+    assert cache.get("https://a.example/1") is None
+    assert cache.get_html("https://a.example/2") == (body.replace(b"a", b"b"), "utf-8")
+    assert cache.get_html("https://a.example/3") == (body.replace(b"a", b"c"), "utf-8")
+    with sqlite3.connect(cache.path) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM blobs").fetchone()[0] == 2
+    cache.close()
+
+
+def test_replay_serves_stale_entries_without_writing(tmp_path, monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(url_cache.time, "time", clock)
+    writer = _cache(tmp_path, ttl_seconds=60)
+    writer.put("https://a.example/1", title="Title", text="Body text")
+    writer.close()
+    modified = os.path.getmtime(writer.path)
+
+    clock.now += 3600
+    replay = _cache(tmp_path, mode="replay", ttl_seconds=60)
+    assert replay.get_article("https://a.example/1") == ("Title", "Body text")
+    replay.put("https://a.example/2", title="Other", text="Other text")
+    assert replay.get("https://a.example/2") is None
+    replay.close()
+    assert os.path.getmtime(writer.path) == modified
+
+    missing = UrlCache(path=str(tmp_path / "missing.sqlite3"), mode="replay")
+    assert missing.get("https://a.example/1") is None
+    assert not os.path.exists(missing.path)
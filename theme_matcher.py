@@ -0,0 +1,94 @@
+import bisect
+import time
+import Levenshtein
+
+from rapidfuzz import fuzz, process
+from typing import Dict, Iterable, List, Sequence
+
+DEFAULT_MIN_RATIO = 0.6
+
+
+class FuzzyThemeMatcher:
+    """Finds every theme with Levenshtein.ratio(query, theme) > min_ratio without scanning the whole table.
+
+    ratio = 2 * matches / (len(a) + len(b)) can only exceed r when the shorter string is at least
+    r / (2 - r) times the longer one, so themes are bucketed by length and only the feasible length
+    window is scored, in C, by rapidfuzz. Candidates are re-checked with Levenshtein.ratio so the
+    result is exactly what the original nested loop produced.
+    """
+
+    def __init__(self, themes: Iterable[str], min_ratio: float = DEFAULT_MIN_RATIO):
+        self.min_ratio = min_ratio
+        self.themes = sorted(set(themes), key=len)
+        self._lengths = [len(theme) for theme in self.themes]
+
+    def _length_window(self, length: int) -> Sequence[str]:
+        factor = self.min_ratio / (2 - self.min_ratio)
+        low = bisect.bisect_left(self._lengths, int(length * factor))
+        high = bisect.bisect_right(self._lengths, int(length / factor) + 1) if factor else len(self.themes)
+        return self.themes[low:high]
+
+    def match(self, query: str) -> List[str]:
+        choices = self._length_window(len(query))
+        if not choices:
+            return []
+        # The rapidfuzz cutoff is slightly loose; the exact strict comparison happens below.
+        candidates = process.extract(query, choices, scorer=fuzz.ratio,
+                                     score_cutoff=self.min_ratio * 100 - 0.5, limit=None)
+        return [theme for theme, _, _ in candidates if Levenshtein.ratio(query, theme) > self.min_ratio]
+
+    def match_many(self, queries: Iterable[str]) -> List[str]:
+        matches = set()
+        for query in queries:
+            matches.update(self.match(query))
+        return list(matches)
+
+
+def match_themes_bruteforce(queries: Iterable[str], themes: Sequence[str], min_ratio: float = DEFAULT_MIN_RATIO) -> List[str]:
+    matches = []
+    for query in queries:
+        for theme in themes:
+            if Levenshtein.ratio(query, theme) > min_ratio:
+                matches.append(theme)
+    return list(set(matches))
+
+
+def benchmark_theme_matcher(themes: Sequence[str], queries: Sequence[str], repeats: int = 3) -> Dict[str, float]:
+    start = time.perf_counter()
+    matcher = FuzzyThemeMatcher(themes)
+    build_seconds = time.perf_counter() - start
+
+    def best_of(fn):
+        best = float("inf")
+        for _ in range(repeats):
+            start = time.perf_counter()
+            result = fn()
+            best = min(best, time.perf_counter() - start)
+        return best, result
+
+    loop_seconds, expected = best_of(lambda: match_themes_bruteforce(queries, themes))
+    index_seconds, actual = best_of(lambda: matcher.match_many(queries))
+    identical = set(expected) == set(actual)
+
+    print(f"--- Theme matching over {len(themes)} themes for {len(queries)} queries: "
+          f"loop {loop_seconds * 1000:.1f} ms, index {index_seconds * 1000:.1f} ms "
+          f"(build {build_seconds * 1000:.1f} ms, {loop_seconds / max(index_seconds, 1e-9):.1f}x faster), "
+          f"{'identical' if identical else 'DIFFERENT'} matches ({len(expected)}).")
+    return {
+        "themes": len(themes),
+        "queries": len(queries),
+        "build_seconds": build_seconds,
+        "loop_seconds": loop_seconds,
+        "index_seconds": index_seconds,
+        "speedup": loop_seconds / index_seconds if index_seconds else 0.0,
+        "identical": identical,
+    }
+
+
+if __name__ == "__main__":
+    from external_apis import fetch_gdelt_themes
+    from constants import CURATED_THEME_LIST
+
+    all_themes = fetch_gdelt_themes(min_count=0)
+    sample_queries = [theme.replace("_", " ") for theme in CURATED_THEME_LIST] + ["ELECTION_FRAUD", "CLIMATE_POLICY", "TAXATION"]
+    benchmark_theme_matcher(all_themes, sample_queries)
@@ -0,0 +1,269 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+from config import (URL_CACHE_MODE, URL_CACHE_PATH, URL_CACHE_TTL_SECONDS, URL_CACHE_MAX_ENTRIES,
+                    URL_CACHE_MAX_BYTES, URL_CACHE_STORE_HTML)
+
+URL_CACHE_SCHEMA_VERSION = 2
+EVICTION_CHECK_INTERVAL = 200
+ACCESS_FLUSH_INTERVAL = 100
+
+@dataclass
+class CachedPage:
+    url: str
+    title: Optional[str]
+    text: Optional[str]
+    content_hash: Optional[str]
+    encoding: Optional[str]
+    status: Optional[int]
+    fetched_at: float
+
+
+class UrlCache:
+    def __init__(self,
+                 path: str = URL_CACHE_PATH,
+                 mode: str = URL_CACHE_MODE,
+                 ttl_seconds: int = URL_CACHE_TTL_SECONDS,
+                 max_entries: int = URL_CACHE_MAX_ENTRIES,
+                 max_bytes: int = URL_CACHE_MAX_BYTES,
+                 store_html: bool = URL_CACHE_STORE_HTML):
+        if mode not in ("readwrite", "replay", "off"):
+            raise ValueError(f"Unknown URL cache mode: {mode}")
+        self.path = path
+        self.mode = mode
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.store_html = store_html
+
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._puts_since_eviction = 0
+        # last_access updates from hits, written with the next commit instead of one commit per lookup.
+        self._pending_access: Dict[str, float] = {}
+        self.stats: Dict[str, int] = {"hits": 0, "misses": 0, "puts": 0, "evictions": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != "off"
+
+    @property
+    def replay(self) -> bool:
+        return self.mode == "replay"
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is not None:
+            return self._conn
+
+        if self.replay:
+            # Replay runs must not create or modify the cache.
+            conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+        else:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            version = conn.execute("SELECT value FROM meta WHERE key = 'schema_version'").fetchone()
+            if version is not None and version[0] != str(URL_CACHE_SCHEMA_VERSION):
+                print(f"--- URL cache schema {version[0]} is outdated, rebuilding {self.path}.")
+                conn.executescript("DROP TABLE IF EXISTS pages; DROP TABLE IF EXISTS blobs; DELETE FROM meta;")
+            # Sizes come before the large columns so eviction can sum them without reading page bodies.
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS blobs (
+                    hash TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL,
+                    body BLOB NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS pages (
+                    url TEXT PRIMARY KEY,
+                    title TEXT,
+                    text_size INTEGER NOT NULL DEFAULT 0,
+                    content_hash TEXT REFERENCES blobs(hash),
+                    encoding TEXT,
+                    status INTEGER,
+                    fetched_at REAL NOT NULL,
+                    last_access REAL NOT NULL,
+                    text TEXT
+                );
+                CREATE INDEX IF NOT EXISTS pages_last_access ON pages(last_access);
+                CREATE INDEX IF NOT EXISTS pages_content_hash ON pages(content_hash);
+            """)
+            conn.execute("INSERT OR IGNORE INTO meta(key, value) VALUES ('schema_version', ?)", (str(URL_CACHE_SCHEMA_VERSION),))
+            conn.commit()
+        self._conn = conn
+        return conn
+
+    def _is_fresh(self, fetched_at: float) -> bool:
+        return self.replay or time.time() - fetched_at < self.ttl_seconds
+
+    def get(self, url: str) -> Optional[CachedPage]:
+        if not self.enabled:
+            return None
+        if self.replay and self._conn is None and not os.path.exists(self.path):
+            self.stats["misses"] += 1
+            return None
+        try:
+            with self._lock:
+                conn = self._connect()
+                row = conn.execute(
+                    "SELECT title, text, content_hash, encoding, status, fetched_at FROM pages WHERE url = ?", (url,)
+                ).fetchone()
+                if row is None or not self._is_fresh(row[5]):
+                    self.stats["misses"] += 1
+                    return None
+                self.stats["hits"] += 1
+                if not self.replay:
+                    self._pending_access[url] = time.time()
+                    if len(self._pending_access) >= ACCESS_FLUSH_INTERVAL:
+                        self._flush_access(conn)
+                        conn.commit()
+        except sqlite3.Error as e:
+            print(f"--- URL cache lookup failed for {url}: {e}")
+            return None
+
+        return CachedPage(url, row[0], row[1], row[2], row[3], row[4], row[5])
+
+    def get_title(self, url: str) -> Optional[str]:
+        page = self.get(url)
+        return page.title if page is not None else None
+
+    def get_article(self, url: str) -> Optional[Tuple[str, str]]:
+        page = self.get(url)
+        if page is None or page.text is None:
+            return None
+        return page.title or "No Title Found", page.text
+
+    def get_html(self, url: str) -> Optional[Tuple[bytes, Optional[str]]]:
+        page = self.get(url)
+        if page is None or page.content_hash is None:
+            return None
+        with self._lock:
+            row = self._connect().execute("SELECT body FROM blobs WHERE hash = ?", (page.content_hash,)).fetchone()
+        if row is None:
+            return None
+        return zlib.decompress(row[0]), page.encoding
+
+    def _flush_access(self, conn: sqlite3.Connection):
+        if self._pending_access:
+            conn.executemany("UPDATE pages SET last_access = ? WHERE url = ?",
+                             [(accessed, url) for url, accessed in self._pending_access.items()])
+            self._pending_access.clear()
+
+    def put(self, url: str, title: Optional[str] = None, text: Optional[str] = None,
+            body: Optional[bytes] = None, encoding: Optional[str] = None, status: Optional[int] = 200):
+        if not self.enabled or self.replay:
+            return
+
+        content_hash = compressed = None
+        if body is not None and self.store_html:
+            content_hash = hashlib.sha256(body).hexdigest()
+            compressed = zlib.compress(body)
+        now = time.time()
+        try:
+            with self._lock:
+                conn = self._connect()
+                self._flush_access(conn)
+                if compressed is not None:
+                    conn.execute("INSERT OR IGNORE INTO blobs(hash, size, body) VALUES (?, ?, ?)",
+                                 (content_hash, len(body), compressed))
+                # Keep fields written by the other fetch phase when this one does not provide them.
+                conn.execute("""
+                    INSERT INTO pages(url, title, text_size, content_hash, encoding, status, fetched_at, last_access, text)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(url) DO UPDATE SET
+                        title = COALESCE(excluded.title, pages.title),
+                        text_size = CASE WHEN excluded.text IS NULL THEN pages.text_size ELSE excluded.text_size END,
+                        text = COALESCE(excluded.text, pages.text),
+                        content_hash = COALESCE(excluded.content_hash, pages.content_hash),
+                        encoding = COALESCE(excluded.encoding, pages.encoding),
+                        status = excluded.status,
+                        fetched_at = excluded.fetched_at,
+                        last_access = excluded.last_access
+                """, (url, title, len(text) if text is not None else 0, content_hash, encoding, status, now, now, text))
+                conn.commit()
+                self.stats["puts"] += 1
+                self._puts_since_eviction += 1
+                if self._puts_since_eviction >= EVICTION_CHECK_INTERVAL:
+                    self._puts_since_eviction = 0
+                    self._evict(conn)
+        except sqlite3.Error as e:
+            print(f"--- URL cache write failed for {url}: {e}")
+
+    def _evict(self, conn: sqlite3.Connection):
+        self._flush_access(conn)
+        cutoff = time.time() - self.ttl_seconds
+        removed = conn.execute("DELETE FROM pages WHERE fetched_at < ?", (cutoff,)).rowcount
+
+        entries = conn.execute("SELECT COUNT(*) FROM pages").fetchone()[0]
+        if entries > self.max_entries:
+            removed += conn.execute(
+                "DELETE FROM pages WHERE url IN (SELECT url FROM pages ORDER BY last_access LIMIT ?)",
+                (entries - self.max_entries,)
+            ).rowcount
+
+        conn.execute("DELETE FROM blobs WHERE hash NOT IN (SELECT content_hash FROM pages WHERE content_hash IS NOT NULL)")
+
+        total_bytes = conn.execute(
+            "SELECT COALESCE((SELECT SUM(size) FROM blobs), 0) + COALESCE((SELECT SUM(text_size) FROM pages), 0)"
+        ).fetchone()[0]
+        if total_bytes > self.max_bytes:
+            # Walk pages oldest first until enough bytes are freed; a blob only counts once its last page goes.
+            references = dict(conn.execute(
+                "SELECT content_hash, COUNT(*) FROM pages WHERE content_hash IS NOT NULL GROUP BY content_hash"
+            ).fetchall())
+            victims = []
+            for url, text_size, content_hash, blob_size in conn.execute(
+                "SELECT url, text_size, content_hash, blobs.size FROM pages "
+                "LEFT JOIN blobs ON blobs.hash = pages.content_hash ORDER BY last_access"
+            ).fetchall():
+                victims.append((url,))
+                total_bytes -= text_size
+                if content_hash is not None:
+                    references[content_hash] -= 1
+                    if references[content_hash] == 0 and blob_size is not None:
+                        total_bytes -= blob_size
+                if total_bytes <= self.max_bytes:
+                    break
+            conn.executemany("DELETE FROM pages WHERE url = ?", victims)
+            removed += len(victims)
+            conn.execute("DELETE FROM blobs WHERE hash NOT IN (SELECT content_hash FROM pages WHERE content_hash IS NOT NULL)")
+        conn.commit()
+        if removed:
+            self.stats["evictions"] += removed
+            print(f"--- URL cache evicted {removed} entries.")
+
+    def report(self) -> str:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        hit_rate = self.stats["hits"] / lookups if lookups else 0.0
+        return (f"--- URL cache ({self.mode}): hits={self.stats['hits']}, misses={self.stats['misses']}, "
+                f"hit rate={hit_rate:.1%}, puts={self.stats['puts']}, evictions={self.stats['evictions']}")
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                if self._pending_access:
+                    try:
+                        self._flush_access(self._conn)
+                        self._conn.commit()
+                    except sqlite3.Error as e:
+                        print(f"--- URL cache access flush failed: {e}")
+                self._conn.close()
+                self._conn = None
+
+
+_url_cache: Optional[UrlCache] = None
+
+def get_url_cache() -> UrlCache:
+    global _url_cache
+    if _url_cache is None:
+        _url_cache = UrlCache()
+    return _url_cache